@@ -0,0 +1,156 @@
+#!/usr/bin/env python
+"""
+Per-response cost of decoding and validating status documents, with the
+standard json module and the fast decoders that are installed, for a typical
+document, an aggregate response and an oversized body. Also times reading an
+oversized HTML page and JSON body from a local server, in full and with the
+body size limit and Content-Type check of the checks.
+
+    python benchmarks/bench_decode.py [megabytes]
+"""
+
+import importlib
+import json
+import os
+import sys
+import threading
+import time
+import timeit
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '../src'))
+
+from documents import validate  # noqa: E402
+from http_client import HTTPClient, RejectedResponse  # noqa: E402
+
+STATUS = {
+    'status': 'OK',
+    'lastrun': '2018-06-28T11:55:00Z',
+    'frequency': 10,
+    'process': 'backup',
+    'server': 'web-1',
+    'sleep': [{'start': '22:00:00', 'duration': 450}],
+}
+BODIES = {}
+
+
+def decoders():
+    found = [('json', json.loads)]
+    for name in ('orjson', 'ujson'):
+        try:
+            found.append((name, importlib.import_module(name).loads))
+        except ImportError:
+            pass
+    return found
+
+
+def per_call(function, *args):
+    # Microseconds per call, for at least a tenth of a second
+    number = 1
+    while True:
+        seconds = timeit.timeit(lambda: function(*args), number=number)
+        if seconds > 0.1:
+            return seconds / number * 1e6
+        number *= 10
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        content_type, body = BODIES[self.path]
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def handle(self):
+        try:
+            super(Handler, self).handle()
+        except OSError:
+            # The client closed a connection it stopped reading
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+def fetch(client, url):
+    started = time.perf_counter()
+    try:
+        size = len(client.request(url, check_type=True).read())
+    except RejectedResponse as e:
+        size = e.reason
+    return (time.perf_counter() - started) * 1000, size
+
+
+def main(megabytes=8):
+    typical = json.dumps(STATUS).encode('utf-8')
+    aggregate = json.dumps(
+        [dict(STATUS, task='job-{}'.format(i)) for i in range(1000)]
+    ).encode('utf-8')
+    tasks = megabytes * 1024 * 1024 // len(typical)
+    oversized = json.dumps(
+        [dict(STATUS, task='job-{}'.format(i)) for i in range(tasks)]
+    ).encode('utf-8')
+    bodies = (
+        ('typical', typical),
+        ('1000 tasks', aggregate),
+        ('oversized', oversized),
+    )
+
+    print(
+        '{:<8} {}'.format(
+            'decode',
+            ''.join(
+                '{:>22}'.format('{} ({} B)'.format(name, len(body)))
+                for name, body in bodies
+            ),
+        )
+    )
+    for name, loads in decoders():
+        print(
+            '{:<8} {}'.format(
+                name,
+                ''.join(
+                    '{:>20.1f}us'.format(per_call(loads, body)) for _, body in bodies
+                ),
+            )
+        )
+    print('validate {:>20.2f}us'.format(per_call(validate, STATUS)))
+    invalid = dict(STATUS, status=None, frequency='often', sleep='22:00')
+    print(
+        'invalid  {:>20.2f}us  {}'.format(
+            per_call(validate, invalid), validate(invalid)
+        )
+    )
+
+    html = b'<html>' + b'<p>Internal error</p>' * (len(oversized) // 21) + b'</html>'
+    BODIES['/html'] = ('text/html', html)
+    BODIES['/json'] = ('application/json', oversized)
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.daemon_threads = True
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    base = 'http://127.0.0.1:{}'.format(httpd.server_port)
+    print()
+    print(
+        '{:<22} {:>12} {:>14}'.format('{} MB response'.format(megabytes), 'ms', 'read')
+    )
+    # The whole body is read, like before the limit
+    full = dict(max_body_size=1 << 40, content_types=('text/html', 'application/json'))
+    cases = (
+        ('full /html', HTTPClient(**full), '/html'),
+        ('full /json', HTTPClient(**full), '/json'),
+        ('bounded /html', HTTPClient(), '/html'),
+        ('bounded /json', HTTPClient(), '/json'),
+    )
+    for name, client, path in cases:
+        elapsed, size = fetch(client, base + path)
+        print('{:<22} {:>12.1f} {:>14}'.format(name, elapsed, size))
+        client.close()
+    httpd.shutdown()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
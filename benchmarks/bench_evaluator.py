@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+"""
+Evaluations per second of the check engine, without any I/O.
+
+    python benchmarks/bench_evaluator.py
+"""
+
+import datetime
+import os
+import sys
+import timeit
+from json import dumps
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '../src'))
+
+from pytz import UTC  # noqa: E402
+
+from evaluator import State, evaluate, evaluate_response  # noqa: E402
+
+NUMBER = 20000
+NOW = datetime.datetime(2018, 6, 28, 12, 0, tzinfo=UTC)
+STATUS = {
+    'status': 'OK',
+    'lastrun': '2018-06-28T11:55:00Z',
+    'frequency': 10,
+    'process': 'backup',
+    'server': 'web-1',
+    'sleep': [{'start': '22:00:00', 'duration': 450}],
+}
+
+
+def case(name, function, *args):
+    seconds = timeit.timeit(lambda: function(*args), number=NUMBER)
+    print('{:<24} {:10.0f}/s'.format(name, NUMBER / seconds))
+
+
+def main():
+    ok = State('ok', process='backup', server='web-1')
+    body = dumps(STATUS).encode('utf-8')
+    failing = dict(STATUS, status='ERROR', reason='disk full')
+    stale = dict(STATUS, lastrun='2018-06-28T10:00:00Z')
+    asleep = evaluate(
+        ok, dict(STATUS, sleep=[{'start': '11:00', 'duration': 120}]), NOW
+    )
+
+    case('response ok', evaluate_response, ok, body, NOW, 'u')
+    case('document ok (cached)', evaluate, ok, STATUS, NOW, 'u')
+    case('document failing', evaluate, ok, failing, NOW, 'u')
+    case('document stale', evaluate, ok, stale, NOW, 'u')
+    case('still asleep', evaluate, asleep.state, STATUS, NOW, 'u')
+    case('response not json', evaluate_response, ok, b'<html>', NOW, 'u')
+
+
+if __name__ == '__main__':
+    main()
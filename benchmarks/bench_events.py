@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+"""
+Load test of /events: hundreds of SSE clients on pywsgi, a few of which never
+read. Reports the cost of a publish, the delivery latency to the clients and
+how many slow clients were disconnected.
+
+    python benchmarks/bench_events.py [subscribers] [events] [slow]
+"""
+
+import json
+import os
+import sys
+import time
+
+import gevent
+from gevent import socket
+from gevent.pywsgi import WSGIServer
+from flask import Flask, Response
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '../src'))
+
+from events import EventBuffer  # noqa: E402
+
+RATE = 500
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def subscribe(port, latencies, done, expected, read=True):
+    sock = socket.socket()
+    if not read:
+        # A small window, so the server notices that it is not reading
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    sock.connect(('127.0.0.1', port))
+    sock.sendall(b'GET /events HTTP/1.1\r\nHost: localhost\r\n\r\n')
+    if not read:
+        # Never reads, the server fills the socket buffers and then its queue
+        gevent.sleep(3600)
+        return
+    stream = sock.makefile('rb')
+    received = 0
+    for line in stream:
+        if line.startswith(b'data: '):
+            latencies.append(time.time() - json.loads(line[6:])['sent'])
+            received += 1
+            if received == expected:
+                break
+    done.append(received)
+    sock.close()
+
+
+def main(subscribers=500, events=1000, slow=10):
+    buffer = EventBuffer(queue_size=100, keepalive=1.0)
+
+    app = Flask(__name__)
+
+    @app.route('/events')
+    def stream():
+        return Response(buffer.stream(), mimetype='text/event-stream')
+
+    # Connections get the send buffer of the listener, keep it small so that
+    # slow clients fill it within the run
+    listener = socket.socket()
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 16384)
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1024)
+    server = WSGIServer(listener, app, log=None)
+    server.start()
+    port = server.server_port
+    latencies = []
+    done = []
+    clients = [
+        gevent.spawn(subscribe, port, latencies, done, events)
+        for _ in range(subscribers)
+    ]
+    clients += [
+        gevent.spawn(subscribe, port, latencies, done, events, False)
+        for _ in range(slow)
+    ]
+    while len(buffer.subscribers) < subscribers + slow:
+        gevent.sleep(0.01)
+
+    padding = 'x' * 200
+    publishing = 0.0
+    started = time.time()
+    for i in range(events):
+        before = time.perf_counter()
+        buffer.publish('status', {'sent': time.time(), 'padding': padding})
+        publishing += time.perf_counter() - before
+        gevent.sleep(1.0 / RATE)
+    while len(done) < subscribers and time.time() - started < 60:
+        gevent.sleep(0.1)
+    elapsed = time.time() - started
+
+    print('{} subscribers ({} slow), {} events'.format(subscribers, slow, events))
+    print('publish                 {:10.3f} ms'.format(publishing / events * 1000))
+    print('deliveries              {:10d}'.format(len(latencies)))
+    print('deliveries/s            {:10.0f}'.format(len(latencies) / elapsed))
+    print(
+        'latency p50             {:10.1f} ms'.format(percentile(latencies, 0.5) * 1000)
+    )
+    print(
+        'latency p99             {:10.1f} ms'.format(percentile(latencies, 0.99) * 1000)
+    )
+    print('clients complete        {:10d}'.format(sum(n == events for n in done)))
+    print('slow clients dropped    {:10d}'.format(buffer.disconnected))
+    gevent.killall(clients)
+    server.stop()
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:4]])
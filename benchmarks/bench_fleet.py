@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+"""
+End to end checks per second and scheduling lag against a local fake fleet.
+Every url is due every ``interval`` seconds, so the fleet asks for
+tasks / interval checks per second. Lag percentiles show how far behind
+the scheduler falls.
+
+    python benchmarks/bench_fleet.py [tasks] [seconds] [interval]
+"""
+
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '../src'))
+
+import pinger  # noqa: E402  (monkey patches)
+
+import gevent  # noqa: E402
+
+from alerts import AlertManager  # noqa: E402
+from fake_fleet import FakeFleet  # noqa: E402
+from history import percentile  # noqa: E402
+from scheduler import Scheduler  # noqa: E402
+
+
+class RecordingScheduler(Scheduler):
+    def __init__(self, *args, **kwargs):
+        super(RecordingScheduler, self).__init__(*args, **kwargs)
+        self.lags = []
+
+    def record_lag(self, lag):
+        super(RecordingScheduler, self).record_lag(lag)
+        self.lags.append(lag)
+
+
+def main(tasks=2000, seconds=10, interval=5):
+    # Measure the checker, not the log file
+    logging.getLogger('pinger').setLevel(logging.WARNING)
+    fleet = FakeFleet(
+        tasks,
+        ports=20,
+        latency=0.005,
+        latency_jitter=0.02,
+        error_rate=0.01,
+        failure_rate=0.02,
+        sleep_rate=0.1,
+    ).start()
+    pinger.ALERTS = AlertManager(lambda message: None)
+
+    def check(url):
+        # Keep the benchmark interval for failing urls as well
+        pinger.check(url)
+        return interval
+
+    scheduler = RecordingScheduler(check)
+    for url in fleet.urls():
+        scheduler.add(url, interval)
+    started = time.perf_counter()
+    scheduler.start()
+    gevent.sleep(seconds)
+    elapsed = time.perf_counter() - started
+    scheduler.kill()
+    fleet.stop()
+
+    lags = sorted(scheduler.lags)
+    print(
+        'tasks {}, interval {}s, asking {:.0f} checks/s'.format(
+            tasks, interval, tasks / float(interval)
+        )
+    )
+    print('checks/s:    {:10.1f}'.format(scheduler.checks / elapsed))
+    for p in (50, 99):
+        print('lag p{}:     {:10.1f} ms'.format(p, percentile(lags, p) * 1000))
+    print('lag max:     {:10.1f} ms'.format(lags[-1] * 1000))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:4]])
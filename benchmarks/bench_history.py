@@ -0,0 +1,50 @@
+#!/usr/bin/env python
+"""
+Memory footprint of the check history for 10k urls x 1k samples.
+
+    python benchmarks/bench_history.py [urls] [samples]
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '../src'))
+
+from history import HistoryStore  # noqa: E402
+
+
+def main(urls=10000, samples=1000):
+    tracemalloc.start()
+    store = HistoryStore(capacity=samples)
+    names = ['https://api.example.com/task/{}'.format(i) for i in range(urls)]
+    baseline = tracemalloc.get_traced_memory()[0]
+
+    started = time.perf_counter()
+    now = int(time.time())
+    # Fill every buffer and wrap around once more for a tenth of it
+    for n in range(samples + samples // 10):
+        for url in names:
+            store.record(url, now + n * 60, 0.05, 'ok', 30)
+    elapsed = time.perf_counter() - started
+    used = tracemalloc.get_traced_memory()[0] - baseline
+    records = urls * (samples + samples // 10)
+
+    print('urls:               {}'.format(urls))
+    print('samples per url:    {}'.format(samples))
+    print('history memory:     {:.1f} MB'.format(used / 1e6))
+    print('bytes per sample:   {:.2f}'.format(used / float(urls * samples)))
+    print('record() per second: {:,.0f}'.format(records / elapsed))
+
+    started = time.perf_counter()
+    store.get(names[0]).summary()
+    print(
+        'summary() of {} samples: {:.2f} ms'.format(
+            samples, (time.perf_counter() - started) * 1000
+        )
+    )
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""
+Checks of many urls on one host that stopped answering, without and with
+the circuit breaker of the host: requests sent, time per round of checks and
+alerts. Then the time of a name lookup, uncached and from the DNS cache.
+
+    python benchmarks/bench_hosts.py [urls] [rounds]
+"""
+
+import logging
+import os
+import socket
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '../src'))
+
+import pinger  # noqa: E402  (monkey patches)
+
+from gevent.pool import Pool  # noqa: E402
+
+import http_client  # noqa: E402
+from alerts import AlertManager  # noqa: E402
+from hosts import BREAKERS, DNSCache  # noqa: E402
+
+TIMEOUT = 0.25
+LOOKUPS = 2000
+
+
+def dead_host():
+    # Accepts nothing, connections hang until they time out
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(0)
+    return listener
+
+
+def outage(urls, rounds, failures):
+    BREAKERS.failures = failures
+    BREAKERS.hosts = {}
+    http_client.CLIENT = http_client.HTTPClient(
+        connect_timeout=TIMEOUT, read_timeout=TIMEOUT, total_timeout=TIMEOUT * 2
+    )
+    alerts = []
+    pinger.ALERTS = AlertManager(lambda message: None)
+    pinger.ALERTS.on_alert(lambda url, kind, message: alerts.append(kind))
+    # Checks against a single host, like max_in_flight_per_host
+    pool = Pool(4)
+    started = time.perf_counter()
+    for _ in range(rounds):
+        list(pool.imap_unordered(pinger.check, urls))
+    elapsed = time.perf_counter() - started
+    requests = sum(p['requests'] for p in http_client.CLIENT.stats().values())
+    print(
+        '{:<12} {:9} {:10.2f} {:8}   {}'.format(
+            'breaker' if failures else 'no breaker',
+            requests,
+            elapsed / rounds,
+            len(alerts),
+            ', '.join(sorted(set(alerts))),
+        )
+    )
+
+
+def lookups(ttl):
+    dns = DNSCache(ttl=ttl)
+    started = time.perf_counter()
+    for _ in range(LOOKUPS):
+        dns.getaddrinfo('localhost', 80)
+    return (time.perf_counter() - started) / LOOKUPS * 1e6
+
+
+def main(urls=60, rounds=3):
+    # Measure the checks, not the log file
+    logging.getLogger('pinger').setLevel(logging.CRITICAL)
+    listener = dead_host()
+    host = '127.0.0.1:{}'.format(listener.getsockname()[1])
+    names = ['http://{}/task/{}'.format(host, i) for i in range(urls)]
+    print('{} urls on a host that is down, {} rounds of checks'.format(urls, rounds))
+    print('{:<12} {:>9} {:>10} {:>8}'.format('', 'requests', 's/round', 'alerts'))
+    for failures in (0, 5):
+        pinger.STATS.clear()
+        outage(names, rounds, failures)
+    listener.close()
+
+    print('\nName lookups, microseconds each')
+    print('uncached     {:8.1f}'.format(lookups(0)))
+    print('cached       {:8.1f}'.format(lookups(60)))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+"""
+Heartbeats per second through POST /ingest on pywsgi, one document per
+request and in batches, from keep-alive clients. Also times the deadline
+sweep for many pushed tasks.
+
+    python benchmarks/bench_ingest.py [tasks] [seconds] [clients]
+"""
+
+import datetime
+import json
+import logging
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '../src'))
+
+import pinger  # noqa: E402  (monkey patches)
+
+import gevent  # noqa: E402
+from flask import Flask  # noqa: E402
+from gevent import socket  # noqa: E402
+from gevent.pywsgi import WSGIServer  # noqa: E402
+
+from alerts import AlertManager  # noqa: E402
+from ingest import HeartbeatMonitor  # noqa: E402
+
+BATCH = 100
+
+
+def document(task):
+    return {
+        'task': 'job-{}'.format(task),
+        'status': 'OK',
+        'frequency': 10,
+        'lastrun': datetime.datetime.utcnow().isoformat() + 'Z',
+        'process': 'job-{}'.format(task),
+        'server': 'batch-{}'.format(task % 10),
+    }
+
+
+def request(body):
+    body = json.dumps(body).encode('utf-8')
+    head = (
+        'POST /ingest HTTP/1.1\r\nHost: localhost\r\n'
+        'Content-Type: application/json\r\nContent-Length: {}\r\n\r\n'
+    ).format(len(body))
+    return head.encode('ascii') + body
+
+
+def client(port, requests, until, counts):
+    sock = socket.create_connection(('127.0.0.1', port))
+    stream = sock.makefile('rb')
+    i = 0
+    while time.perf_counter() < until:
+        sock.sendall(requests[i % len(requests)])
+        length = 0
+        for line in stream:
+            if line.lower().startswith(b'content-length:'):
+                length = int(line.split(b':')[1])
+            if line == b'\r\n':
+                break
+        stream.read(length)
+        counts.append(1)
+        i += 1
+    sock.close()
+
+
+def run(port, requests, seconds, clients):
+    counts = []
+    until = time.perf_counter() + seconds
+    gevent.joinall(
+        [gevent.spawn(client, port, requests, until, counts) for _ in range(clients)]
+    )
+    return len(counts) / float(seconds)
+
+
+def sweep(tasks):
+    # Deadlines moved by heartbeats, then all of them passing at once
+    monitor = HeartbeatMonitor(lambda key: None)
+    started = time.perf_counter()
+    for round in range(3):
+        for i in range(tasks):
+            monitor.set(i, 1000.0 + round * 600 + i % 600)
+    moved = time.perf_counter() - started
+    started = time.perf_counter()
+    expired = monitor.due(1e9)
+    swept = time.perf_counter() - started
+    assert len(expired) == tasks
+    return moved / (3 * tasks), swept
+
+
+def main(tasks=1000, seconds=5, clients=20):
+    # Measure the ingest, not the log file
+    logging.getLogger('pinger').setLevel(logging.WARNING)
+    pinger.ALERTS = AlertManager(lambda message: None)
+    pinger.HEARTBEATS = HeartbeatMonitor(pinger.heartbeat_missed)
+    gevent.spawn(pinger.HEARTBEATS.run)
+    app = Flask(__name__)
+    pinger.add_ingest_routes(app)
+    server = WSGIServer(pinger.listen(('127.0.0.1', 0)), app, log=None)
+    server.start()
+    port = server.server_port
+
+    single = [request(document(i)) for i in range(tasks)]
+    batches = [
+        request([document(j) for j in range(i, i + BATCH)])
+        for i in range(0, tasks, BATCH)
+    ]
+    rate = run(port, single, seconds, clients)
+    print('{} tasks, {} clients'.format(tasks, clients))
+    print('single    {:10.0f} heartbeats/s'.format(rate))
+    rate = run(port, batches, seconds, clients)
+    print('batch {:<3} {:10.0f} heartbeats/s'.format(BATCH, rate * BATCH))
+    print('stats     {}'.format(pinger.HEARTBEATS.stats()))
+    server.stop()
+
+    moved, swept = sweep(100000)
+    print('deadline moved          {:8.2f} us'.format(moved * 1e6))
+    print('100k deadlines passing  {:8.1f} ms'.format(swept * 1000))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:4]])
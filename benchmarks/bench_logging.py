@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+"""
+Time a log call takes on the calling thread (the event loop in the pinger),
+writing straight to a file as before, and handing the line to the log
+pipeline. The slow disk case syncs every line to disk.
+
+    python benchmarks/bench_logging.py [lines]
+"""
+
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '../src'))
+
+from logs import TEXT_FORMAT, LogPipeline, file_handler  # noqa: E402
+
+
+class SyncedHandler(logging.FileHandler):
+    # A slow disk
+    def emit(self, record):
+        super(SyncedHandler, self).emit(record)
+        os.fsync(self.stream.fileno())
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def run(name, handler, lines):
+    log = logging.getLogger('bench.{}'.format(name))
+    log.propagate = False
+    log.setLevel(logging.INFO)
+    log.addHandler(handler)
+    durations = []
+    for i in range(lines):
+        started = time.perf_counter()
+        log.info('Status: backup/web-{} (http://127.0.0.1/task/{}) is OK'.format(i, i))
+        durations.append(time.perf_counter() - started)
+    durations.sort()
+    print(
+        '{:<22} {:8.1f} {:8.1f} {:9.1f}'.format(
+            name,
+            percentile(durations, 0.5) * 1e6,
+            percentile(durations, 0.99) * 1e6,
+            durations[-1] * 1e6,
+        ),
+        end='',
+    )
+    handler.close()
+    if isinstance(handler, LogPipeline):
+        print('   {}'.format(handler.stats()), end='')
+    print()
+
+
+def main(lines=20000):
+    directory = tempfile.mkdtemp()
+    formatter = logging.Formatter(TEXT_FORMAT)
+    print('{} lines, microseconds per call'.format(lines))
+    print('{:<22} {:>8} {:>8} {:>9}'.format('', 'p50', 'p99', 'max'))
+    for name, slow in (('file', False), ('file, slow disk', True)):
+        path = os.path.join(directory, name.replace(', ', '-') + '.log')
+        direct = SyncedHandler(path) if slow else logging.FileHandler(path)
+        direct.setFormatter(formatter)
+        run(name, direct, lines)
+
+        target = SyncedHandler(path + '.2') if slow else file_handler(path + '.2')
+        pipeline = LogPipeline(target, rate_limit=0)
+        pipeline.setFormatter(formatter)
+        run('pipeline' + name[4:], pipeline.start(), lines)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""
+Memory per url once every url has been checked once: what its stats,
+history, metrics, cached JSON and schedule take, by the module that
+allocated it, and the growth of the resident set.
+
+    python benchmarks/bench_memory.py [urls]
+"""
+
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '../src'))
+
+import pinger  # noqa: E402  (monkey patches)
+
+from alerts import AlertManager  # noqa: E402
+from documents import loads  # noqa: E402
+from evaluator import State, evaluate  # noqa: E402
+from history import HISTORY  # noqa: E402
+from metrics import METRICS  # noqa: E402
+from scheduler import Scheduler  # noqa: E402
+from utils import get_now  # noqa: E402
+
+
+def rss():
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def body(i, lastrun):
+    # Decoded for every url, like a response, so no strings are shared
+    return json.dumps(
+        {
+            'status': 'OK',
+            'lastrun': lastrun,
+            'frequency': 10,
+            'server': 'web-{}'.format(i % 20),
+            'process': 'task-{}'.format(i % 500),
+        }
+    ).encode('utf-8')
+
+
+def main(urls=20000):
+    logging.getLogger('pinger').setLevel(logging.WARNING)
+    pinger.ALERTS = AlertManager(lambda message: None)
+    scheduler = Scheduler(pinger.check)
+    names = [
+        'https://api-{}.example.com/task/{}'.format(i % 50, i) for i in range(urls)
+    ]
+    now = get_now()
+    lastrun = now.isoformat()
+
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    resident = rss()
+    started = time.perf_counter()
+    for i, url in enumerate(names):
+        scheduler.add(url, 60)
+        pinger.create_stats_per_url(url)
+        result = evaluate(
+            State.from_stats(pinger.STATS[url]), loads(body(i, lastrun)), now, url
+        )
+        pinger.apply_result(url, result, now)
+        HISTORY.record(url, time.time(), 0.05, pinger.STATS[url]['status'], result.lag)
+        METRICS.observe(url, 0.05, 120)
+        pinger.stats_changed(url)
+    pinger.VIEW.render()
+    elapsed = time.perf_counter() - started
+    after = tracemalloc.take_snapshot()
+    resident = rss() - resident
+
+    print('{} urls checked once in {:.2f}s'.format(urls, elapsed))
+    print('bytes per url, by the module that allocated them')
+    modules = {}
+    for stat in after.compare_to(before, 'filename'):
+        name = os.path.basename(stat.traceback[0].filename)
+        modules[name] = modules.get(name, 0) + stat.size_diff
+    total = 0
+    for name, size in sorted(modules.items(), key=lambda item: -item[1]):
+        total += size
+        if size >= urls:
+            print('  {:<20} {:8.0f}'.format(name, size / float(urls)))
+    print('  {:<20} {:8.0f}'.format('total', total / float(urls)))
+    print('  {:<20} {:8.0f}'.format('resident', resident / float(urls)))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+"""
+Simulated days of checks, fixed intervals compared with adaptive polling.
+Tasks run every 5 minutes to once a day, some more often than their
+frequency says. Every task fails once, either reporting an error or
+stopping, and recovers an hour later. Reports the checks per task and hour
+and how long after it became detectable a failure or recovery was seen.
+Adaptive polling checks at the normal interval until it has seen a task run
+twice, longer simulations show more of the steady state.
+
+    python benchmarks/bench_polling.py [tasks] [hours]
+"""
+
+import datetime
+import heapq
+import os
+import random
+import sys
+
+import pytz
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '../src'))
+
+from evaluator import State, evaluate  # noqa: E402
+from polling import PollingPolicy  # noqa: E402
+from settings import Settings  # noqa: E402
+
+START = datetime.datetime(2026, 3, 2, tzinfo=pytz.UTC)
+FREQUENCIES = (5, 15, 60, 240, 1440)
+OUTAGE = 3600
+
+
+class Task(object):
+    def __init__(self, rng, hours):
+        self.frequency = rng.choice(FREQUENCIES)
+        self.period = self.frequency * 60
+        if rng.random() < 0.3:
+            # Runs more often than its frequency
+            self.period /= 4
+        self.offset = rng.uniform(0, self.period)
+        self.stops = rng.random() < 0.5
+        self.fail_at = rng.uniform(0.25, 0.5) * hours * 3600
+        self.fail_end = self.fail_at + OUTAGE
+
+    def lastrun(self, t):
+        run = self.offset + (t - self.offset) // self.period * self.period
+        if self.stops and self.fail_at <= run < self.fail_end:
+            # The last run before it stopped
+            run = (
+                self.offset + (self.fail_at - self.offset) // self.period * self.period
+            )
+        return run
+
+    def document(self, t):
+        run = self.lastrun(t)
+        failing = not self.stops and self.fail_at <= run < self.fail_end
+        lastrun = START + datetime.timedelta(seconds=run)
+        return {
+            'status': 'ERROR' if failing else 'OK',
+            'frequency': self.frequency,
+            'lastrun': lastrun.isoformat(),
+        }
+
+    def next_run(self, t):
+        return self.offset + ((t - self.offset) // self.period + 1) * self.period
+
+    def failure_visible(self):
+        # When a check can first see the failure
+        if self.stops:
+            return self.lastrun(self.fail_at) + self.frequency * 60
+        return self.next_run(self.fail_at - 1e-6)
+
+    def recovery_visible(self):
+        return self.next_run(self.fail_end - 1e-6)
+
+    def detectable(self):
+        # A daily task that stops for an hour is never stale
+        return self.failure_visible() < self.recovery_visible()
+
+
+def simulate(tasks, hours, config, policy=None):
+    end = hours * 3600
+    heap = [
+        (random.Random(i).uniform(0, config.interval), i) for i in range(len(tasks))
+    ]
+    heapq.heapify(heap)
+    states = [State() for _ in tasks]
+    detected = [None] * len(tasks)
+    recovered = [None] * len(tasks)
+    checks = 0
+    while heap:
+        t, i = heapq.heappop(heap)
+        if t > end:
+            continue
+        checks += 1
+        task = tasks[i]
+        now = START + datetime.timedelta(seconds=t)
+        result = evaluate(states[i], task.document(t), now, str(i))
+        states[i] = result.state
+        status = result.state.status
+        if status == 'error' and detected[i] is None and task.detectable():
+            detected[i] = t - task.failure_visible()
+        if status == 'ok' and detected[i] is not None and recovered[i] is None:
+            recovered[i] = t - task.recovery_visible()
+        if policy is not None:
+            delay = policy.next_check(str(i), result.state, result, now, config)
+        elif status == 'error':
+            delay = config.error_interval
+        else:
+            delay = config.interval
+        heapq.heappush(heap, (t + delay, i))
+    return checks, detected, recovered
+
+
+def percentile(values, p):
+    values = sorted(v for v in values if v is not None)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main(tasks=200, hours=72):
+    rng = random.Random(1)
+    fleet = [Task(rng, hours) for _ in range(tasks)]
+    config = Settings({'main': {'interval': '60', 'error_interval': '480'}})
+    print('{} tasks, {} hours'.format(tasks, hours))
+    print(
+        '{:<10} {:>14} {:>12} {:>12} {:>12} {:>12}'.format(
+            '',
+            'checks/task/h',
+            'detect p50',
+            'detect p99',
+            'recover p50',
+            'recover p99',
+        )
+    )
+    for name, policy in (('fixed', None), ('adaptive', PollingPolicy(rng.random))):
+        checks, detected, recovered = simulate(fleet, hours, config, policy)
+        missed = sum(
+            1 for task, d in zip(fleet, detected) if task.detectable() and d is None
+        )
+        print(
+            '{:<10} {:>14.1f} {:>11.0f}s {:>11.0f}s {:>11.0f}s {:>11.0f}s{}'.format(
+                name,
+                checks / float(tasks * hours),
+                percentile(detected, 0.5),
+                percentile(detected, 0.99),
+                percentile(recovered, 0.5),
+                percentile(recovered, 0.99),
+                '  ({} missed)'.format(missed) if missed else '',
+            )
+        )
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,42 @@
+#!/usr/bin/env python
+"""
+Cost per check of the stage timings, turned off and on, for the laps and the
+aggregation of one check.
+
+    python benchmarks/bench_profiling.py [urls]
+"""
+
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '../src'))
+
+from profiling import STAGES, StageTimings  # noqa: E402
+
+NUMBER = 100000
+
+
+def one_check(timings, url):
+    watch = timings.stopwatch()
+    for stage in STAGES:
+        watch.lap(stage)
+    timings.record(url, watch)
+
+
+def main(urls=1000):
+    names = ['http://127.0.0.1/task/{}'.format(i) for i in range(urls)]
+    for enabled in (False, True):
+        timings = StageTimings(enabled)
+        seconds = timeit.timeit(
+            lambda: [one_check(timings, url) for url in names], number=NUMBER // urls
+        )
+        print(
+            '{:<10} {:8.2f} us/check'.format(
+                'on' if enabled else 'off', seconds / NUMBER * 1e6
+            )
+        )
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
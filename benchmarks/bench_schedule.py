@@ -0,0 +1,57 @@
+#!/usr/bin/env python
+"""
+Sleep window and lastrun evaluations per second, before and after compiling
+the sleep schedule and using the ISO-8601 fast path.
+
+    python benchmarks/bench_schedule.py
+"""
+
+import datetime
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '../src'))
+
+from dateutil import parser  # noqa: E402
+from pytz import UTC  # noqa: E402
+
+from schedule import compile_sleep, parse_timestamp  # noqa: E402
+
+NUMBER = 20000
+STATUS = {
+    'status': 'OK',
+    'lastrun': '2018-06-28T11:37:48Z',
+    'frequency': 10,
+    'sleep': [
+        {'start': '22:00:00', 'duration': 450},
+        {'start': '12:00:00', 'duration': 15},
+    ],
+}
+NOW = datetime.datetime(2018, 6, 28, 11, 40, tzinfo=UTC)
+
+
+def before():
+    # What worker() did for every response
+    for sleep in STATUS['sleep']:
+        start = parser.parse(sleep['start']).replace(tzinfo=UTC)
+        end = parser.parse(sleep['start']).replace(tzinfo=UTC)
+        end += datetime.timedelta(minutes=sleep['duration'])
+        if start <= NOW <= end:
+            break
+    parser.parse(STATUS['lastrun'])
+
+
+def after():
+    compile_sleep(STATUS['sleep']).window_at(NOW)
+    parse_timestamp(STATUS['lastrun'])
+
+
+def main():
+    for name, func in (('before', before), ('after', after)):
+        seconds = min(timeit.repeat(func, number=NUMBER, repeat=3))
+        print('{:>6}: {:12,.0f} evaluations per second'.format(name, NUMBER / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python
+"""
+Compare the settings cost of a single ping before and after caching.
+
+Before, every get_settings() call built a new ConfigParser and read
+pinger.ini. One failing ping (worker, set_token_auth, send_messages,
+send_to_slack, send_to_hipchat, only_log x2, debug_mode) made 8 calls.
+
+    python benchmarks/bench_settings.py
+"""
+
+import configparser
+import os
+import sys
+import tempfile
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '../src'))
+
+from settings import SettingsCache  # noqa: E402
+
+CALLS_PER_PING = 8
+NUMBER = 2000
+TEMPLATE = os.path.join(
+    os.path.dirname(os.path.realpath(__file__)), '../pinger.ini.template'
+)
+
+
+def main():
+    with open(TEMPLATE) as f:
+        ini = f.read().replace(
+            'prod=',
+            'prod='
+            + ','.join(
+                'https://api.example.com/task/{}'.format(i) for i in range(2000)
+            ),
+        )
+    with tempfile.NamedTemporaryFile('w', suffix='.ini', delete=False) as f:
+        f.write(ini)
+        config_file = f.name
+
+    def before():
+        for _ in range(CALLS_PER_PING):
+            config = configparser.ConfigParser()
+            config.read(config_file)
+            dict(config._sections)
+
+    cache = SettingsCache(config_file)
+
+    def after():
+        for _ in range(CALLS_PER_PING):
+            cache.get().sections
+
+    try:
+        for name, func in (('before', before), ('after', after)):
+            seconds = min(timeit.repeat(func, number=NUMBER, repeat=3))
+            print('{:>6}: {:10.2f} us per ping'.format(name, seconds / NUMBER * 1e6))
+    finally:
+        os.unlink(config_file)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+"""
+Seconds from starting the process to the first check being dispatched, with
+the urls listed in the ini and read from a url file, and what importing
+the pinger takes of it. Every case runs in a new process.
+
+    python benchmarks/bench_startup.py [urls] [runs]
+"""
+
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+SRC = os.path.join(os.path.dirname(os.path.realpath(__file__)), '../src')
+# Seconds to wait for the first check
+TIMEOUT = 120
+
+INI = """
+[main]
+debug=false
+only_log=true
+greeting=Hello
+interval=1
+[state]
+path={directory}/pinger.db
+[logging]
+path={directory}/pinger.log
+[urls]
+{urls}
+"""
+
+# Stops at the first check, run with the ini and the time the parent
+# started the process
+CHILD = """
+import os, sys, time
+started = float(sys.argv[2])
+sys.path.insert(0, {src!r})
+import settings
+settings.CACHE.config_file = sys.argv[1]
+sys.argv = sys.argv[:1]
+import pinger
+imported = time.time()
+
+def check(url):
+    print(imported - started, time.time() - started)
+    sys.stdout.flush()
+    os._exit(0)
+
+pinger.check = check
+pinger.main()
+"""
+
+
+def run(config_file):
+    started = time.time()
+    output = subprocess.check_output(
+        [sys.executable, '-c', CHILD.format(src=SRC), config_file, repr(started)],
+        timeout=TIMEOUT,
+    )
+    return [float(value) for value in output.split()]
+
+
+def main(urls=100000, runs=3):
+    directory = tempfile.mkdtemp()
+    names = [
+        'https://api-{}.example.com/task/{}'.format(i % 50, i) for i in range(urls)
+    ]
+    url_file = os.path.join(directory, 'urls.txt')
+    with open(url_file, 'w') as f:
+        f.write('\n'.join(names) + '\n')
+    cases = (
+        ('ini', 'prod={}'.format(','.join(names))),
+        ('url file', 'prod_file={}'.format(url_file)),
+    )
+    print('{} urls, best of {} runs'.format(urls, runs))
+    print('{:<10} {:>10} {:>14}'.format('', 'import s', 'first check s'))
+    for name, line in cases:
+        config_file = os.path.join(directory, name.replace(' ', '_') + '.ini')
+        with open(config_file, 'w') as f:
+            f.write(INI.format(directory=directory, urls=line))
+        timings = [run(config_file) for _ in range(runs)]
+        imported = min(t[0] for t in timings)
+        first = min(t[1] for t in timings)
+        print('{:<10} {:10.3f} {:14.3f}'.format(name, imported, first))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:3]])
@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""
+Snapshot and restore time of the on-disk state for 50k urls.
+
+    python benchmarks/bench_state_store.py [urls]
+"""
+
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '../src'))
+
+from pytz import UTC  # noqa: E402
+
+from alerts import AlertManager  # noqa: E402
+from state_store import StateStore  # noqa: E402
+
+
+def main(urls=50000):
+    now = datetime.datetime.now(UTC)
+    stats = {}
+    alerts = AlertManager(lambda message: None)
+    for i in range(urls):
+        url = 'https://api.example.com/task/{}'.format(i)
+        sleeping = i % 10 == 0
+        stats[url] = {
+            'pings': 1000 + i,
+            'errors': i % 7,
+            'status': 'sleeping' if sleeping else 'ok',
+            'sleep_start': now if sleeping else None,
+            'sleep_end': now + datetime.timedelta(hours=7) if sleeping else None,
+            'server': 'web-{}'.format(i % 20),
+            'process': 'task-{}'.format(i),
+        }
+        if i % 5 == 0:
+            alerts.failure(url, 'http', 500, 'Warn: HTTP Error 500')
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'pinger.db')
+        store = StateStore(path)
+        for url in stats:
+            store.mark(url)
+        started = time.perf_counter()
+        store.flush(stats, alerts, threaded=False)
+        print(
+            'full snapshot of {} urls: {:8.1f} ms'.format(
+                urls, (time.perf_counter() - started) * 1000
+            )
+        )
+
+        for url in list(stats)[: urls // 50]:
+            store.mark(url)
+        started = time.perf_counter()
+        store.flush(stats, alerts, threaded=False)
+        print(
+            'incremental snapshot (2%):  {:8.1f} ms'.format(
+                (time.perf_counter() - started) * 1000
+            )
+        )
+        store.close()
+
+        started = time.perf_counter()
+        restored = StateStore(path).load()
+        print(
+            'restore of {} urls:        {:8.1f} ms'.format(
+                len(restored), (time.perf_counter() - started) * 1000
+            )
+        )
+        print(
+            'database size:              {:8.1f} MB'.format(
+                sum(
+                    os.path.getsize(os.path.join(directory, f))
+                    for f in os.listdir(directory)
+                )
+                / 1e6
+            )
+        )
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
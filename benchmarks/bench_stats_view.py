@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+"""
+Cost of serving / and /task/<url> for 10k urls, serializing all of STATS on
+every request compared with the cached view.
+
+    python benchmarks/bench_stats_view.py [urls]
+"""
+
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.realpath(__file__)), '../src'))
+
+from stats_view import StatsView  # noqa: E402
+
+NUMBER = 50
+
+
+def rebuild(stats):
+    tasks = []
+    for key, value in stats.items():
+        d = {'url': key}
+        for k, v in value.items():
+            d[k] = v
+        tasks.append(d)
+    return json.dumps({'data': tasks}, sort_keys=True)
+
+
+def main(urls=10000):
+    stats = {}
+    view = StatsView(stats, lambda o: json.dumps(o, sort_keys=True))
+    for i in range(urls):
+        url = 'https://api.example.com/task/{}'.format(i)
+        stats[url] = {
+            'pings': 1000 + i,
+            'errors': i % 7,
+            'status': 'error' if i % 10 == 0 else 'ok',
+            'sleep_start': None,
+            'sleep_end': None,
+            'server': 'web-{}'.format(i % 20),
+            'process': 'task-{}'.format(i),
+            'cache_hits': 0,
+            'cache_hit_rate': 0.0,
+        }
+        view.touch(url)
+    view.render()
+    some = list(stats)[: urls // 100]
+
+    def changed():
+        # 1% of the urls were checked since the last request
+        for url in some:
+            view.touch(url)
+        return view.render()
+
+    for name, function in (
+        ('/ rebuilt every request', lambda: rebuild(stats)),
+        ('/ cached, unchanged', view.render),
+        ('/ cached, 1% changed', changed),
+        ('/?status=error', lambda: view.render(status='error')),
+        ('/?limit=100', lambda: view.render(limit=100)),
+        ('/summary', view.summary),
+    ):
+        seconds = timeit.timeit(function, number=NUMBER) / NUMBER
+        print('{:<26} {:10.3f} ms'.format(name, seconds * 1000))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:2]])
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""
+An in-process fleet of fake status endpoints for the benchmarks.
+
+Tasks are spread over several local servers, so that per host limits apply
+like they would against a real fleet. Each task answers with a status
+document like a real one. Latency, the share of HTTP errors, of tasks
+reporting a failure and of tasks inside a sleep window are configurable.
+
+Run on its own it serves the fleet until interrupted and prints the urls:
+
+    python benchmarks/fake_fleet.py [tasks] [ports]
+"""
+
+import datetime
+import random
+import sys
+from json import dumps
+
+import gevent
+from gevent.pywsgi import WSGIServer
+
+
+class FakeFleet(object):
+    def __init__(
+        self,
+        tasks=1000,
+        ports=10,
+        latency=0.0,
+        latency_jitter=0.0,
+        error_rate=0.0,
+        failure_rate=0.0,
+        sleep_rate=0.0,
+        seed=0,
+    ):
+        self.tasks = tasks
+        self.ports = ports
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.servers = []
+        self.requests = 0
+        now = datetime.datetime.utcnow()
+        # Sleeping tasks are inside a two hour window that started half an
+        # hour ago
+        window = [
+            {
+                'start': (now - datetime.timedelta(minutes=30)).strftime('%H:%M'),
+                'duration': 120,
+            }
+        ]
+        self.documents = []
+        for n in range(tasks):
+            failing = self.random.random() < failure_rate
+            self.documents.append(
+                {
+                    'status': 'ERROR' if failing else 'OK',
+                    'reason': 'fake failure' if failing else '',
+                    'frequency': 10,
+                    'process': 'task-{}'.format(n),
+                    'server': 'fake-{}'.format(n % ports),
+                    'sleep': window if self.random.random() < sleep_rate else [],
+                }
+            )
+
+    def app(self, environ, start_response):
+        self.requests += 1
+        try:
+            document = self.documents[int(environ['PATH_INFO'].rsplit('/', 1)[1])]
+        except (ValueError, IndexError):
+            start_response('404 Not Found', [('Content-Length', '0')])
+            return [b'']
+        delay = self.latency + self.random.random() * self.latency_jitter
+        if delay:
+            gevent.sleep(delay)
+        if self.random.random() < self.error_rate:
+            start_response('500 Internal Server Error', [('Content-Length', '0')])
+            return [b'']
+        status = dict(document)
+        status['lastrun'] = datetime.datetime.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+        body = dumps(status).encode('utf-8')
+        start_response(
+            '200 OK',
+            [('Content-Type', 'application/json'), ('Content-Length', str(len(body)))],
+        )
+        return [body]
+
+    def start(self):
+        for _ in range(self.ports):
+            server = WSGIServer(('127.0.0.1', 0), self.app, log=None, error_log=None)
+            server.start()
+            self.servers.append(server)
+        return self
+
+    def stop(self):
+        for server in self.servers:
+            server.stop(timeout=1)
+        self.servers = []
+
+    def urls(self):
+        return [
+            'http://127.0.0.1:{}/task/{}'.format(
+                self.servers[n % len(self.servers)].server_port, n
+            )
+            for n in range(self.tasks)
+        ]
+
+
+if __name__ == '__main__':
+    fleet = FakeFleet(*[int(arg) for arg in sys.argv[1:3]]).start()
+    for url in fleet.urls():
+        print(url)
+    try:
+        gevent.wait()
+    except KeyboardInterrupt:
+        fleet.stop()
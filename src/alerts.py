@@ -0,0 +1,248 @@
+import logging
+import time
+
+import gevent
+
+from settings import get_config
+
+DEFAULT_ESCALATE_AFTER = 3
+DEFAULT_REMINDER = 1800
+DEFAULT_REMINDER_FACTOR = 2.0
+DEFAULT_REMINDER_MAX = 86400
+DEFAULT_PER_MINUTE = 30
+# Number of suppressed alerts quoted in a budget summary
+SUMMARY_LINES = 10
+
+log = logging.getLogger('pinger')
+
+
+class AlertState(object):
+    __slots__ = (
+        'status',
+        'key',
+        'failures',
+        'since',
+        'next_reminder',
+        'reminder',
+        'reminders',
+        'suppressed',
+    )
+
+    def __init__(self):
+        self.status = 'ok'
+        self.key = None
+        self.failures = 0
+        self.since = None
+        self.next_reminder = None
+        self.reminder = None
+        self.reminders = 0
+        self.suppressed = 0
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        state = cls()
+        for name in cls.__slots__:
+            if name in data:
+                setattr(state, name, data[name])
+        if state.key is not None:
+            # JSON turns the dedup key tuple into a list
+            state.key = tuple(state.key)
+        return state
+
+
+class AlertManager(object):
+    """
+    Decides which check results turn into messages.
+
+    A url alerts when it goes from ok to error, or when the error changes
+    (the dedup key is url, error class and reason). Repeated failures are
+    suppressed, except for one escalation after ``escalate_after``
+    consecutive failures and reminders at an exponentially growing interval.
+    A recovery message is sent once when the url is ok again.
+
+    When a host is down its urls fail with the ``host`` error class, those
+    are covered by a single ``host_down`` alert and ``host_up`` message.
+
+    At most ``per_minute`` messages are sent per minute, the rest are rolled
+    up into a summary message at the start of the next minute.
+    """
+
+    def __init__(
+        self,
+        send,
+        escalate_after=DEFAULT_ESCALATE_AFTER,
+        reminder=DEFAULT_REMINDER,
+        reminder_factor=DEFAULT_REMINDER_FACTOR,
+        reminder_max=DEFAULT_REMINDER_MAX,
+        per_minute=DEFAULT_PER_MINUTE,
+        clock=time.time,
+    ):
+        self.send = send
+        self.escalate_after = escalate_after
+        self.reminder = reminder
+        self.reminder_factor = reminder_factor
+        self.reminder_max = reminder_max
+        self.per_minute = per_minute
+        self.clock = clock
+        self.states = {}
+        self.window = None
+        self.sent_in_window = 0
+        self.over_budget = []
+        self.sent = 0
+        self.suppressed = 0
+        self.summarized = 0
+        self.listeners = []
+
+    def on_alert(self, callback):
+        # callback(url, kind, message) for every alert, also those over budget
+        self.listeners.append(callback)
+
+    def get_state(self, url):
+        state = self.states.get(url)
+        if state is None:
+            state = self.states[url] = AlertState()
+        return state
+
+    def failure(self, url, error_class, reason, message):
+        state = self.get_state(url)
+        now = self.clock()
+        key = (url, error_class, str(reason))
+        state.failures += 1
+
+        if error_class == 'host':
+            # Not checked because its host is down, which was alerted once
+            # for all of its urls. An error alerted before stays open, it
+            # is deduplicated and recovers as usual once the host is back.
+            if state.status != 'error':
+                state.since = now
+                state.status = 'error'
+                state.key = key
+            state.suppressed += 1
+            self.suppressed += 1
+        elif state.status != 'error' or state.key != key:
+            # ok -> error, or a different error than the one reported
+            if state.status != 'error':
+                state.since = now
+            state.status = 'error'
+            state.key = key
+            state.failures = 1
+            state.reminders = 0
+            state.reminder = self.reminder
+            state.next_reminder = now + self.reminder
+            self.emit(message, url, 'alert')
+        elif state.failures == self.escalate_after:
+            self.emit(
+                'Escalation: {} has failed {} checks in a row. {}'.format(
+                    url, state.failures, message
+                ),
+                url,
+                'escalation',
+            )
+        elif now >= state.next_reminder:
+            state.reminders += 1
+            state.reminder = min(
+                state.reminder * self.reminder_factor, self.reminder_max
+            )
+            state.next_reminder = now + state.reminder
+            self.emit(
+                'Reminder: {} still failing after {} checks. {}'.format(
+                    url, state.failures, message
+                ),
+                url,
+                'reminder',
+            )
+        else:
+            state.suppressed += 1
+            self.suppressed += 1
+            log.info('{}: alert suppressed: {}'.format(url, message))
+
+    def success(self, url, message):
+        state = self.states.get(url)
+        if state is None or state.status != 'error':
+            return
+        self.states[url] = AlertState()
+        if state.key[1] == 'host':
+            # Recovered together with its host
+            return
+        self.emit(message, url, 'recovery')
+
+    def host_down(self, host, reason):
+        # One alert instead of one for every url of the host
+        self.emit(
+            'Error: {} is down, its urls are not checked until it is back. '
+            'Last error: {}'.format(host, reason),
+            host,
+            'host_down',
+        )
+
+    def host_up(self, host):
+        self.emit('OK: {} is back up'.format(host), host, 'host_up')
+
+    def forget(self, url):
+        self.states.pop(url, None)
+
+    def emit(self, message, url=None, kind='alert'):
+        for callback in self.listeners:
+            try:
+                callback(url, kind, message)
+            except Exception as e:
+                log.exception(e)
+        self.tick()
+        if self.sent_in_window < self.per_minute:
+            self.sent_in_window += 1
+            self.sent += 1
+            self.send(message)
+        else:
+            self.over_budget.append(message)
+
+    def tick(self):
+        # Called on every alert and periodically, starts a new budget window
+        # every minute and sends the summary of the previous one
+        window = int(self.clock() // 60)
+        if window == self.window:
+            return
+        self.window = window
+        self.sent_in_window = 0
+        if self.over_budget:
+            messages, self.over_budget = self.over_budget, []
+            self.summarized += len(messages)
+            self.sent_in_window += 1
+            self.sent += 1
+            lines = messages[:SUMMARY_LINES]
+            if len(messages) > SUMMARY_LINES:
+                lines.append('... and {} more'.format(len(messages) - SUMMARY_LINES))
+            self.send(
+                'Summary: {} alerts over the limit of {} per minute:\n{}'.format(
+                    len(messages), self.per_minute, '\n'.join(lines)
+                )
+            )
+
+    def run(self):
+        # Sends the budget summary even when no new alerts come in
+        while True:
+            gevent.sleep(1)
+            self.tick()
+
+    def stats(self):
+        return {
+            'sent': self.sent,
+            'suppressed': self.suppressed,
+            'summarized': self.summarized,
+            'pending_summary': len(self.over_budget),
+            'failing': sum(1 for s in self.states.values() if s.status == 'error'),
+        }
+
+
+def setup_alerts(send):
+    config = get_config()
+    return AlertManager(
+        send,
+        escalate_after=config.escalate_after,
+        reminder=config.reminder,
+        reminder_factor=config.reminder_factor,
+        reminder_max=config.reminder_max,
+        per_minute=config.alerts_per_minute,
+    )
@@ -0,0 +1,96 @@
+import base64
+import logging
+import time
+from json import loads
+
+from gevent.event import AsyncResult
+
+from settings import get_config
+
+# Refresh a token this many seconds before it actually expires
+EXPIRY_MARGIN = 30
+
+log = logging.getLogger('pinger')
+
+
+def token_expiry(token):
+    # Read the `exp` claim of a JWT, None if the token is not a JWT
+    try:
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        exp = loads(base64.urlsafe_b64decode(payload.encode()))['exp']
+        return float(exp)
+    except Exception:
+        return None
+
+
+class TokenCache(object):
+    """
+    Process wide cache for the token_auth login token.
+
+    The token is kept until its TTL (``token_auth.ttl`` in the ini) or its
+    ``exp`` claim runs out. Refreshing is single-flight: the first greenlet
+    that needs a new token logs in, the others wait for its result.
+    """
+
+    def __init__(self, fetch, ttl=None, clock=time.time):
+        self.fetch = fetch
+        self.ttl = ttl
+        self.clock = clock
+        self.token = None
+        self.expires = None
+        self.pending = None
+        self.logins = 0
+
+    def valid(self):
+        if self.token is None:
+            return False
+        return self.expires is None or self.clock() < self.expires - EXPIRY_MARGIN
+
+    def get(self):
+        if self.valid():
+            return self.token
+        if self.pending is not None:
+            # Someone is already logging in, wait for their token
+            return self.pending.get()
+        pending = self.pending = AsyncResult()
+        try:
+            token = self.fetch()
+            self.logins += 1
+            expires = self.get_expiry(token)
+            self.token = token
+            self.expires = expires
+            pending.set(token)
+            return token
+        except Exception as e:
+            pending.set_exception(e)
+            raise
+        finally:
+            self.pending = None
+
+    def get_expiry(self, token):
+        ttl = self.ttl() if callable(self.ttl) else self.ttl
+        if ttl:
+            return self.clock() + ttl
+        return token_expiry(token)
+
+    def invalidate(self, token=None):
+        # Only drop the token if it is the one that was rejected, so that many
+        # greenlets failing with the same stale token cause a single refresh
+        if token is None or token == self.token:
+            self.token = None
+            self.expires = None
+
+
+def configured_ttl():
+    return get_config().token_ttl
+
+
+def request_token():
+    # utils reads the settings on import, which import this module
+    import utils
+
+    return utils.request_token()
+
+
+TOKEN_CACHE = TokenCache(request_token, ttl=configured_ttl)
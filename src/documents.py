@@ -0,0 +1,91 @@
+import json
+from numbers import Real
+
+# The fastest JSON decoder that is installed
+try:
+    import orjson
+
+    loads = orjson.loads
+    DECODER = 'orjson'
+except ImportError:
+    try:
+        import ujson
+
+        loads = ujson.loads
+        DECODER = 'ujson'
+    except ImportError:
+        loads = json.loads
+        DECODER = 'json'
+
+
+def is_number(value):
+    return isinstance(value, Real) and not isinstance(value, bool)
+
+
+def positive(value):
+    if value <= 0:
+        return 'must be greater than 0'
+
+
+def sleep_windows(value):
+    for i, window in enumerate(value):
+        if not isinstance(window, dict):
+            return 'entry {} is not an object'.format(i)
+        if not isinstance(window.get('start'), str):
+            return 'entry {} needs a "start" time'.format(i)
+        if not is_number(window.get('duration')):
+            return 'entry {} needs a "duration" in minutes'.format(i)
+
+
+# The fields of a status document, compiled once into a check per field.
+# field: (required, expected type, type check, value check)
+STATUS_SCHEMA = {
+    'status': (True, 'a string', str, None),
+    'lastrun': (True, 'a string', str, None),
+    'frequency': (False, 'a number', is_number, positive),
+    'sleep': (False, 'an array', list, sleep_windows),
+    'process': (False, 'a string', str, None),
+    'server': (False, 'a string', str, None),
+    'reason': (False, 'a string', str, None),
+}
+
+
+def compile_schema(schema):
+    # Turns every field into a function that returns (field, error) or None
+    checks = []
+    for name, (required, expected, kind, check) in schema.items():
+        checks.append(compile_field(name, required, expected, kind, check))
+
+    def validate(document):
+        # One (field, error) per bad field, an empty list for a valid document
+        errors = []
+        for check in checks:
+            error = check(document)
+            if error is not None:
+                errors.append(error)
+        return errors
+
+    return validate
+
+
+def compile_field(name, required, expected, kind, check):
+    if isinstance(kind, type):
+        cls = kind
+
+        def kind(value):
+            return isinstance(value, cls)
+
+    def check_field(document):
+        value = document.get(name)
+        if value is None:
+            return (name, 'is required') if required else None
+        if not kind(value):
+            return name, 'expected {}, got {}'.format(expected, type(value).__name__)
+        error = check(value) if check is not None else None
+        if error is not None:
+            return name, error
+
+    return check_field
+
+
+validate = compile_schema(STATUS_SCHEMA)
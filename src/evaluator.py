@@ -0,0 +1,264 @@
+import datetime
+from collections import namedtuple
+
+from documents import loads, validate
+from profiling import NO_WATCH
+from schedule import compile_sleep, parse_timestamp
+
+# Event kinds
+FAILURE = 'failure'
+RECOVERY = 'recovery'
+ASLEEP = 'asleep'
+STILL_ASLEEP = 'still_asleep'
+AWAKE = 'awake'
+
+DEFAULT_FREQUENCY = 10
+# Between the url of an aggregate response and the id of one of its tasks.
+# A space is never part of a url, unlike ! and the like, and is sent as %20
+# in /task/<url>, where # would be stripped as the fragment.
+TASK_SEPARATOR = ' '
+
+# `reason` and `error_class` are only set for failures, they make up the
+# alert dedup key together with the url
+Event = namedtuple('Event', 'kind message error_class reason')
+Event.__new__.__defaults__ = (None, '')
+
+# `document` is the decoded status document (None if it could not be
+# decoded), `lag` the age of lastrun in seconds if it could be read
+Result = namedtuple('Result', 'state events document lag')
+
+
+class State(object):
+    """
+    The part of a url's stats that the evaluation depends on and changes.
+    """
+
+    __slots__ = ('status', 'sleep_start', 'sleep_end', 'process', 'server')
+
+    def __init__(
+        self, status='', sleep_start=None, sleep_end=None, process=None, server=None
+    ):
+        self.status = status
+        self.sleep_start = sleep_start
+        self.sleep_end = sleep_end
+        self.process = process
+        self.server = server
+
+    @classmethod
+    def from_stats(cls, stats):
+        return cls(
+            stats['status'],
+            stats['sleep_start'],
+            stats['sleep_end'],
+            stats['process'],
+            stats['server'],
+        )
+
+    def __eq__(self, other):
+        return isinstance(other, State) and all(
+            getattr(self, name) == getattr(other, name) for name in self.__slots__
+        )
+
+    def __repr__(self):
+        return 'State({})'.format(
+            ', '.join('{}={!r}'.format(n, getattr(self, n)) for n in self.__slots__)
+        )
+
+
+def text_field(document, key):
+    # A field that may be one of the invalid ones, only kept when it is text
+    value = document.get(key)
+    return value if isinstance(value, str) else None
+
+
+def error_result(error_class, reason, message, process=None, server=None, **kwargs):
+    return Result(
+        State('error', process=process, server=server),
+        [Event(FAILURE, message, error_class, reason)],
+        kwargs.get('document'),
+        kwargs.get('lag'),
+    )
+
+
+def evaluate_response(previous, body, now, url='', watch=NO_WATCH):
+    """
+    Evaluate a raw response body. Returns a Result with the new state of the
+    url and the events (alerts, recoveries, sleep changes) to act on.
+    """
+    try:
+        document = loads(body)
+    except Exception:
+        return error_result(
+            'parse', '', 'Error: Could not parse response from endpoint {}'.format(url)
+        )
+    finally:
+        watch.lap('decode')
+    return evaluate(previous, document, now, url)
+
+
+def evaluate(previous, document, now, url=''):
+    # Same as evaluate_response, for an already decoded status document
+    if not document:
+        # Nothing to go on, leave the state as it is
+        return Result(previous, [], document, None)
+    if is_aggregate(document):
+        return aggregate_result(url, document)
+    if not isinstance(document, dict):
+        return error_result(
+            'parse',
+            '',
+            'Error: Could not parse response from endpoint {}'.format(url),
+            document=document,
+        )
+
+    events = []
+    if previous.status == 'sleeping':
+        # Check if it's time to wake up
+        if previous.sleep_start <= now <= previous.sleep_end:
+            return Result(previous, [Event(STILL_ASLEEP, url)], document, None)
+        events.append(Event(AWAKE, url))
+    else:
+        # Check if the time falls in one of the sleep windows, the schedule
+        # is compiled once per spec
+        window = compile_sleep(document.get('sleep')).window_at(now)
+        if window is not None:
+            return Result(
+                State('sleeping', window[0], window[1]),
+                [Event(ASLEEP, url)],
+                document,
+                None,
+            )
+
+    errors = validate(document)
+    if errors:
+        # The fields that are wrong make up the reason
+        result = error_result(
+            'schema',
+            ','.join(field for field, _ in errors),
+            'Error: Invalid status document from {}: {}'.format(
+                url, '; '.join('{} {}'.format(*error) for error in errors)
+            ),
+            text_field(document, 'process'),
+            text_field(document, 'server'),
+            document=document,
+        )
+        result.events[:0] = events
+        return result
+
+    # Check if the last run time falls in between the acceptable margin
+    frequency = document.get('frequency', DEFAULT_FREQUENCY)
+    server = document.get('server', '')
+    process = document.get('process', '')
+    reason = document.get('reason', '')
+    status_msg = document.get('status', None)
+    lastrun = document.get('lastrun', None)
+
+    try:
+        margin = datetime.timedelta(minutes=frequency)
+    except (TypeError, OverflowError):
+        # Something is wrong if there is no usable frequency
+        return error_result(
+            'config',
+            '',
+            'Error: {}/{} is not configured properly {} '.format(process, server, url),
+            process,
+            server,
+            document=document,
+        )
+
+    try:
+        status_date = parse_timestamp(lastrun)
+    except Exception:
+        return error_result(
+            'date',
+            '',
+            'Error: Date Parse {} error for endpoint {}'.format(lastrun, url),
+            process,
+            server,
+            document=document,
+        )
+    lag = (now - status_date).total_seconds()
+
+    if not (now - margin <= status_date <= now + margin):
+        # This is a failure due to the age of the last status, report it.
+        # Also report the last known status, for good information.
+        message = (
+            'Error: {}/{} ({}) is outside of the acceptable {} '
+            'minute range. Last Run {} UTC with status {}'.format(
+                process, server, url, frequency, status_date, status_msg
+            )
+        )
+        result = error_result(
+            'stale', '', message, process, server, document=document, lag=lag
+        )
+    elif status_msg != 'OK':
+        message = (
+            'Error: Failure reported on process {} running on {} ({}).'
+            ' Status: {} Error: {}.'.format(process, server, url, status_msg, reason)
+        )
+        result = error_result(
+            'status', reason, message, process, server, document=document, lag=lag
+        )
+    else:
+        # Everything is okay, the alerts decide whether the recovery message
+        # is sent
+        message = 'Status: {}/{} ({}) is OK again!'.format(process, server, url)
+        result = Result(
+            State('ok', process=process, server=server),
+            [Event(RECOVERY, message)],
+            document,
+            lag,
+        )
+    result.events[:0] = events
+    return result
+
+
+def evaluate_error(error_class, reason, message):
+    # A check that did not get a response at all
+    return error_result(error_class, reason, message)
+
+
+def is_aggregate(document):
+    # An array of status documents, or an object of them keyed by task id
+    if isinstance(document, dict):
+        if 'status' in document or 'lastrun' in document:
+            return False
+        entries = document.values()
+    elif isinstance(document, list):
+        entries = document
+    else:
+        return False
+    return bool(entries) and all(isinstance(entry, dict) for entry in entries)
+
+
+def task_url(url, task_id):
+    return '{}{}{}'.format(url, TASK_SEPARATOR, task_id)
+
+
+def base_url(url):
+    # The url that was checked, for the task of an aggregate response
+    return url.split(TASK_SEPARATOR, 1)[0]
+
+
+def aggregate_tasks(url, document):
+    """
+    The tasks of an aggregate response as [(task url, status document)].
+    Entries of an array are named by their `task` or `id`, else by their
+    server and process, else by their position.
+    """
+    if isinstance(document, dict):
+        return [(task_url(url, task_id), entry) for task_id, entry in document.items()]
+    tasks = []
+    for i, entry in enumerate(document):
+        task_id = entry.get('task') or entry.get('id')
+        if not task_id and entry.get('server') and entry.get('process'):
+            task_id = '{}/{}'.format(entry['server'], entry['process'])
+        tasks.append((task_url(url, task_id or i), entry))
+    return tasks
+
+
+def aggregate_result(url, document):
+    # The aggregate url itself is ok once its response could be read, its
+    # tasks are evaluated one by one
+    message = 'Status: {} is OK again!'.format(url)
+    return Result(State('ok'), [Event(RECOVERY, message)], document, None)
@@ -0,0 +1,133 @@
+import itertools
+import logging
+from collections import deque
+from json import dumps
+
+from gevent.queue import Empty, Full, Queue
+
+from settings import get_config
+
+DEFAULT_BUFFER_SIZE = 1000
+DEFAULT_CLIENT_QUEUE = 100
+# Seconds between comments on an idle stream, so proxies keep it open
+DEFAULT_KEEPALIVE = 15.0
+
+log = logging.getLogger('pinger')
+
+
+def format_event(event_id, name, data):
+    return 'id: {}\nevent: {}\ndata: {}\n\n'.format(
+        event_id, name, dumps(data, separators=(',', ':'), sort_keys=True)
+    )
+
+
+class Subscriber(object):
+    __slots__ = ('queue', 'overflowed')
+
+    def __init__(self, queue_size):
+        self.queue = Queue(queue_size)
+        self.overflowed = False
+
+    def push(self, message):
+        # Never blocks the publisher, returns False when the queue is full
+        try:
+            self.queue.put_nowait(message)
+        except Full:
+            self.overflowed = True
+            return False
+        return True
+
+
+class EventBuffer(object):
+    """
+    Fans status changes and alerts out to the clients of /events, as
+    Server-Sent Events.
+
+    Every event gets the next id, the last ``size`` events are kept. A client
+    that reconnects with Last-Event-ID first gets the kept events after that
+    id. Each client has its own queue of ``queue_size`` events. A client that
+    falls further behind is disconnected instead of holding up the checks,
+    and can resume from the buffer when it reconnects.
+    """
+
+    def __init__(
+        self,
+        size=DEFAULT_BUFFER_SIZE,
+        queue_size=DEFAULT_CLIENT_QUEUE,
+        keepalive=DEFAULT_KEEPALIVE,
+    ):
+        self.events = deque(maxlen=size)
+        self.queue_size = queue_size
+        self.keepalive = keepalive
+        self.last_id = 0
+        self.subscribers = set()
+        self.disconnected = 0
+
+    def publish(self, name, data):
+        self.last_id += 1
+        message = format_event(self.last_id, name, data)
+        self.events.append((self.last_id, message))
+        for subscriber in list(self.subscribers):
+            if not subscriber.push(message):
+                self.subscribers.discard(subscriber)
+                self.disconnected += 1
+
+    def since(self, last_id):
+        # Kept events after last_id, and whether events in between were lost.
+        # An id from the future comes from before a restart.
+        if last_id > self.last_id:
+            return [], True
+        if not self.events:
+            return [], last_id < self.last_id
+        first = self.events[0][0]
+        start = max(0, last_id - first + 1)
+        backlog = [m for _, m in itertools.islice(self.events, start, None)]
+        return backlog, last_id < first - 1
+
+    def stream(self, last_id=None):
+        # The SSE text for one client, until it disconnects or falls behind
+        subscriber = Subscriber(self.queue_size)
+        self.subscribers.add(subscriber)
+        backlog, lost = [], False
+        if last_id is not None:
+            backlog, lost = self.since(last_id)
+        try:
+            if lost:
+                # Too far behind for the buffer, the client should reload /
+                yield 'event: reset\ndata: {}\n\n'
+            for message in backlog:
+                yield message
+            # An overflowed client gets what is queued, then the stream ends
+            while not (subscriber.overflowed and subscriber.queue.empty()):
+                try:
+                    message = subscriber.queue.get(timeout=self.keepalive)
+                except Empty:
+                    yield ': keepalive\n\n'
+                    continue
+                yield message
+        finally:
+            self.subscribers.discard(subscriber)
+
+    def stats(self):
+        return {
+            'last_id': self.last_id,
+            'buffered': len(self.events),
+            'subscribers': len(self.subscribers),
+            'disconnected': self.disconnected,
+        }
+
+
+def parse_last_event_id(value):
+    try:
+        return int(value) if value else None
+    except ValueError:
+        return None
+
+
+def setup_events():
+    config = get_config()
+    return EventBuffer(
+        size=config.event_buffer_size,
+        queue_size=config.event_client_queue,
+        keepalive=config.event_keepalive,
+    )
@@ -0,0 +1,152 @@
+from array import array
+import math
+
+DEFAULT_CAPACITY = 1000
+
+OK = 0
+ERROR = 1
+SLEEPING = 2
+# A check without a known status, counted apart from the errors
+UNKNOWN = 3
+OUTCOMES = {'ok': OK, 'error': ERROR, 'sleeping': SLEEPING, 'unknown': UNKNOWN}
+OUTCOME_NAMES = {code: name for name, code in OUTCOMES.items()}
+
+# Latency is kept in whole milliseconds, NO_LATENCY marks checks that got no
+# response. NO_LAG marks checks without a usable lastrun.
+MAX_LATENCY = 0xFFFE
+NO_LATENCY = 0xFFFF
+NO_LAG = -(2**31)
+MAX_LAG = 2**31 - 1
+
+
+def percentile(values, p):
+    # Nearest rank percentile of sorted values
+    if not values:
+        return None
+    return values[max(0, math.ceil(p / 100.0 * len(values)) - 1)]
+
+
+class History(object):
+    """
+    The last ``capacity`` check results of one url in arrays: timestamp
+    (epoch seconds), latency (ms), outcome code and lastrun lag (seconds).
+    11 bytes per sample. The arrays grow with the samples until they hold
+    ``capacity``, then the oldest sample is overwritten.
+    """
+
+    __slots__ = ('capacity', 'head', 'size', 'times', 'latency', 'outcome', 'lag')
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.head = 0
+        self.size = 0
+        self.times = array('I')
+        self.latency = array('H')
+        self.outcome = array('B')
+        self.lag = array('i')
+
+    def record(self, timestamp, latency, outcome, lag):
+        if latency is None:
+            latency = NO_LATENCY
+        else:
+            latency = min(int(latency * 1000), MAX_LATENCY)
+        if lag is None:
+            lag = NO_LAG
+        else:
+            lag = max(min(int(lag), MAX_LAG), NO_LAG + 1)
+        i = self.head
+        if len(self.times) < self.capacity:
+            # Still growing, the next sample goes at the end
+            self.times.append(int(timestamp))
+            self.latency.append(latency)
+            self.outcome.append(outcome)
+            self.lag.append(lag)
+        else:
+            self.times[i] = int(timestamp)
+            self.latency[i] = latency
+            self.outcome[i] = outcome
+            self.lag[i] = lag
+        self.head = (i + 1) % self.capacity
+        if self.size < self.capacity:
+            self.size += 1
+
+    def indexes(self):
+        # Oldest to newest
+        start = (self.head - self.size) % self.capacity
+        for n in range(self.size):
+            yield (start + n) % self.capacity
+
+    def select(self, start=None, end=None):
+        times = self.times
+        for i in self.indexes():
+            t = times[i]
+            if (start is None or t >= start) and (end is None or t <= end):
+                yield i
+
+    def samples(self, start=None, end=None):
+        for i in self.select(start, end):
+            latency = self.latency[i]
+            lag = self.lag[i]
+            yield {
+                'time': self.times[i],
+                'latency': None if latency == NO_LATENCY else latency / 1000.0,
+                'status': OUTCOME_NAMES.get(self.outcome[i]),
+                'lag': None if lag == NO_LAG else lag,
+            }
+
+    def summary(self, start=None, end=None):
+        count = 0
+        errors = 0
+        unknown = 0
+        flaps = 0
+        previous = None
+        latencies = []
+        for i in self.select(start, end):
+            count += 1
+            outcome = self.outcome[i]
+            if outcome == ERROR:
+                errors += 1
+            elif outcome == UNKNOWN:
+                unknown += 1
+            # Sleeping and unknown are neither up nor down, flaps are
+            # ok <-> error changes
+            if outcome not in (SLEEPING, UNKNOWN):
+                if previous is not None and outcome != previous:
+                    flaps += 1
+                previous = outcome
+            if self.latency[i] != NO_LATENCY:
+                latencies.append(self.latency[i])
+        latencies.sort()
+        p50 = percentile(latencies, 50)
+        p95 = percentile(latencies, 95)
+        known = count - unknown
+        return {
+            'samples': count,
+            'errors': errors,
+            'unknown': unknown,
+            'uptime': round(100.0 * (known - errors) / known, 3) if known else None,
+            'latency_p50': None if p50 is None else p50 / 1000.0,
+            'latency_p95': None if p95 is None else p95 / 1000.0,
+            'flaps': flaps,
+        }
+
+
+class HistoryStore(object):
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.urls = {}
+
+    def record(self, url, timestamp, latency, status, lag):
+        history = self.urls.get(url)
+        if history is None:
+            history = self.urls[url] = History(self.capacity)
+        history.record(timestamp, latency, OUTCOMES.get(status, UNKNOWN), lag)
+
+    def get(self, url):
+        return self.urls.get(url)
+
+    def forget(self, url):
+        self.urls.pop(url, None)
+
+
+HISTORY = HistoryStore()
@@ -0,0 +1,224 @@
+import logging
+import socket
+from time import monotonic
+
+from gevent.event import AsyncResult
+
+DEFAULT_FAILURES = 5
+DEFAULT_RETRY = 30
+DEFAULT_DNS_TTL = 60
+# Failed lookups are cached for a shorter time
+DEFAULT_DNS_NEGATIVE_TTL = 5
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+log = logging.getLogger('pinger')
+
+
+class HostDown(Exception):
+    """
+    A check that was not sent because its host is down.
+    """
+
+    def __init__(self, host, reason):
+        super(HostDown, self).__init__(
+            '{} is down, last error: {}'.format(host, reason)
+        )
+        self.host = host
+        self.reason = reason
+
+
+class HostState(object):
+    __slots__ = ('status', 'failures', 'since', 'retry_at', 'reason')
+
+    def __init__(self):
+        self.status = CLOSED
+        self.failures = 0
+        self.since = None
+        self.retry_at = None
+        self.reason = None
+
+
+class HostBreakers(object):
+    """
+    A circuit breaker per host, shared by all of its urls.
+
+    A host opens after ``failures`` connection failures in a row, from
+    whichever of its urls. While it is open no requests are sent to it,
+    after ``retry`` seconds a single check goes through as a probe
+    (half open). The host closes when the probe gets a response, and opens
+    again for another ``retry`` seconds when it fails. ``failures=0`` turns
+    the breakers off.
+    """
+
+    def __init__(self, failures=DEFAULT_FAILURES, retry=DEFAULT_RETRY, clock=monotonic):
+        self.failures = failures
+        self.retry = retry
+        self.clock = clock
+        self.hosts = {}
+        self.short_circuited = 0
+
+    def allow(self, host):
+        # False while the host is open, the first check after `retry`
+        # seconds is let through as the probe
+        state = self.hosts.get(host)
+        if state is None or state.status == CLOSED:
+            return True
+        now = self.clock()
+        if now < state.retry_at:
+            self.short_circuited += 1
+            return False
+        # A probe that never reported back does not keep the host half open
+        state.status = HALF_OPEN
+        state.retry_at = now + self.retry
+        return True
+
+    def is_open(self, host):
+        state = self.hosts.get(host)
+        return state is not None and state.status != CLOSED
+
+    def success(self, host):
+        # Returns True when this closes the host
+        state = self.hosts.pop(host, None)
+        return state is not None and state.status != CLOSED
+
+    def failure(self, host, reason):
+        # Returns True when this opens the host
+        if not self.failures:
+            return False
+        state = self.hosts.get(host)
+        if state is None:
+            state = self.hosts[host] = HostState()
+        now = self.clock()
+        state.failures += 1
+        state.reason = str(reason)
+        if state.status == HALF_OPEN:
+            state.status = OPEN
+            state.retry_at = now + self.retry
+            log.info('{}: probe failed, still down'.format(host))
+            return False
+        if state.status == CLOSED and state.failures >= self.failures:
+            state.status = OPEN
+            state.since = now
+            state.retry_at = now + self.retry
+            return True
+        return False
+
+    def reason(self, host):
+        state = self.hosts.get(host)
+        return state.reason if state is not None else None
+
+    def stats(self):
+        now = self.clock()
+        hosts = {}
+        for host, state in self.hosts.items():
+            entry = {
+                'status': state.status,
+                'failures': state.failures,
+                'reason': state.reason,
+            }
+            if state.status != CLOSED:
+                entry['down_for'] = round(now - state.since, 3)
+                entry['retry_in'] = round(max(state.retry_at - now, 0), 3)
+            hosts[host] = entry
+        return {
+            'open': sum(1 for s in self.hosts.values() if s.status != CLOSED),
+            'short_circuited': self.short_circuited,
+            'hosts': hosts,
+        }
+
+
+def getaddrinfo(host, port):
+    # Looked up on every call, gevent patches the socket module
+    return socket.getaddrinfo(host, port, 0, socket.SOCK_STREAM)
+
+
+class DNSCache(object):
+    """
+    Resolved addresses per host and port, kept for ``ttl`` seconds and
+    shared by every connection. Lookups of a name that is already being
+    resolved wait for that lookup instead of starting another one. Failed
+    lookups are kept for ``negative_ttl`` seconds. ``ttl=0`` turns the cache
+    off.
+    """
+
+    def __init__(
+        self,
+        ttl=DEFAULT_DNS_TTL,
+        negative_ttl=DEFAULT_DNS_NEGATIVE_TTL,
+        resolve=getaddrinfo,
+        clock=monotonic,
+    ):
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.resolve = resolve
+        self.clock = clock
+        # (host, port) -> (expires, addresses, or the args of the error)
+        self.entries = {}
+        self.pending = {}
+        self.hits = 0
+        self.misses = 0
+        self.shared = 0
+        self.errors = 0
+
+    def getaddrinfo(self, host, port):
+        if not self.ttl:
+            return self.resolve(host, port)
+        key = (host, port)
+        entry = self.entries.get(key)
+        if entry is not None and entry[0] > self.clock():
+            self.hits += 1
+            if entry[1] is None:
+                raise socket.gaierror(*entry[2])
+            return entry[1]
+        pending = self.pending.get(key)
+        if pending is not None:
+            self.shared += 1
+            addresses = pending.get()
+            if addresses is None:
+                # The lookup failed, try again or raise the cached error
+                return self.getaddrinfo(host, port)
+            return addresses
+
+        self.misses += 1
+        pending = self.pending[key] = AsyncResult()
+        addresses = None
+        try:
+            addresses = self.resolve(host, port)
+            self.entries[key] = (self.clock() + self.ttl, addresses, None)
+        except socket.gaierror as e:
+            self.errors += 1
+            self.entries[key] = (self.clock() + self.negative_ttl, None, e.args)
+            raise
+        finally:
+            del self.pending[key]
+            pending.set(addresses)
+        return addresses
+
+    def forget(self, host, port):
+        # After none of the addresses could be connected to
+        self.entries.pop((host, port), None)
+
+    def stats(self):
+        now = self.clock()
+        return {
+            'ttl': self.ttl,
+            'entries': sum(1 for entry in self.entries.values() if entry[0] > now),
+            'hits': self.hits,
+            'misses': self.misses,
+            'shared': self.shared,
+            'errors': self.errors,
+        }
+
+
+BREAKERS = HostBreakers()
+DNS = DNSCache()
+
+
+def setup_hosts(config):
+    # Options come from the optional [hosts] section of the ini
+    BREAKERS.failures = config.host_failures
+    BREAKERS.retry = config.host_retry
+    DNS.ttl = config.dns_ttl
@@ -0,0 +1,393 @@
+import http.client
+import io
+import socket
+import ssl
+import time
+from urllib.error import HTTPError, URLError
+from urllib.parse import urljoin, urlsplit
+
+import gevent
+from gevent.lock import BoundedSemaphore
+
+from hosts import DNS
+from profiling import NO_WATCH
+from settings import get_config
+
+DEFAULT_MAX_PER_HOST = 4
+DEFAULT_CONNECT_TIMEOUT = 5.0
+DEFAULT_READ_TIMEOUT = 20.0
+DEFAULT_TOTAL_TIMEOUT = 30.0
+MAX_REDIRECTS = 5
+# Bodies of successful responses above this many bytes are rejected, error
+# pages are cut off
+DEFAULT_MAX_BODY_SIZE = 1024 * 1024
+# What a status endpoint may answer with, besides any type ending in +json
+DEFAULT_CONTENT_TYPES = ('application/json', 'text/json', 'text/plain')
+
+# Errors that mean a pooled keep-alive connection was closed by the server
+# while it sat idle, the request is safe to retry on a fresh connection
+STALE_CONNECTION_ERRORS = (
+    http.client.RemoteDisconnected,
+    http.client.BadStatusLine,
+    BrokenPipeError,
+    ConnectionResetError,
+)
+
+
+class RejectedResponse(Exception):
+    """
+    A response that was not read because of its Content-Type or size.
+    ``reason`` is ``content_type`` or ``too_large``.
+    """
+
+    def __init__(self, url, reason, message):
+        super(RejectedResponse, self).__init__(message)
+        self.url = url
+        self.reason = reason
+
+
+class Response(object):
+    """
+    A fully read HTTP response. It can be used like the object returned by
+    ``urlopen`` (``with client.request(url) as fp: fp.read()``).
+    """
+
+    def __init__(self, url, status, reason, headers, body):
+        self.url = url
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.body = body
+
+    def read(self):
+        return self.body
+
+    def getcode(self):
+        return self.status
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+
+class HTTPConnection(http.client.HTTPConnection):
+    """
+    Connects itself so that names are resolved by the shared DNS cache, and
+    name resolution and the TCP connect are timed as separate stages of the
+    ``watch`` of the request.
+    """
+
+    watch = NO_WATCH
+
+    def __init__(self, *args, **kwargs):
+        super(HTTPConnection, self).__init__(*args, **kwargs)
+        self._create_connection = self.create_connection
+
+    def create_connection(self, address, timeout, source_address=None):
+        host, port = address
+        addresses = DNS.getaddrinfo(host, port)
+        self.watch.lap('dns')
+        error = None
+        for family, kind, proto, _, sockaddr in addresses:
+            sock = socket.socket(family, kind, proto)
+            try:
+                if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+                    sock.settimeout(timeout)
+                if source_address:
+                    sock.bind(source_address)
+                sock.connect(sockaddr)
+            except OSError as e:
+                error = e
+                sock.close()
+                continue
+            self.watch.lap('connect')
+            return sock
+        # The host may have moved, resolve it again next time
+        DNS.forget(host, port)
+        raise error
+
+
+class HTTPSConnection(HTTPConnection, http.client.HTTPSConnection):
+    def connect(self):
+        super(HTTPSConnection, self).connect()
+        self.watch.lap('tls')
+
+
+class HostPool(object):
+    """
+    Idle keep-alive connections to a single scheme://host:port, with at most
+    ``max_size`` connections open at the same time.
+    """
+
+    def __init__(self, scheme, host, port, max_size, ssl_context=None):
+        self.scheme = scheme
+        self.host = host
+        self.port = port
+        self.max_size = max_size
+        self.ssl_context = ssl_context
+        self.slots = BoundedSemaphore(max_size)
+        self.idle = []
+        self.in_use = 0
+        self.created = 0
+        self.reused = 0
+        self.requests = 0
+        self.errors = 0
+
+    def new_connection(self):
+        if self.scheme == 'https':
+            return HTTPSConnection(self.host, self.port, context=self.ssl_context)
+        return HTTPConnection(self.host, self.port)
+
+    def acquire(self, timeout=None):
+        if not self.slots.acquire(timeout=timeout):
+            raise URLError('timed out waiting for a connection to {}'.format(self.host))
+        self.in_use += 1
+        if self.idle:
+            self.reused += 1
+            return self.idle.pop(), True
+        self.created += 1
+        return self.new_connection(), False
+
+    def release(self, conn, reuse=True):
+        self.in_use -= 1
+        if reuse:
+            self.idle.append(conn)
+        else:
+            conn.close()
+        self.slots.release()
+
+    def close(self):
+        while self.idle:
+            self.idle.pop().close()
+
+    def stats(self):
+        return {
+            'max': self.max_size,
+            'in_use': self.in_use,
+            'idle': len(self.idle),
+            'created': self.created,
+            'reused': self.reused,
+            'requests': self.requests,
+            'errors': self.errors,
+        }
+
+
+def remaining(deadline):
+    left = deadline - time.monotonic()
+    if left <= 0:
+        raise socket.timeout('timed out')
+    return left
+
+
+class HTTPClient(object):
+    def __init__(
+        self,
+        max_per_host=DEFAULT_MAX_PER_HOST,
+        connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+        read_timeout=DEFAULT_READ_TIMEOUT,
+        total_timeout=DEFAULT_TOTAL_TIMEOUT,
+        max_body_size=DEFAULT_MAX_BODY_SIZE,
+        content_types=DEFAULT_CONTENT_TYPES,
+    ):
+        self.max_per_host = max_per_host
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.total_timeout = total_timeout
+        self.max_body_size = max_body_size
+        self.content_types = content_types
+        self.ssl_context = ssl.create_default_context()
+        self.pools = {}
+
+    def get_pool(self, scheme, host, port):
+        key = '{}://{}:{}'.format(scheme, host, port)
+        pool = self.pools.get(key)
+        if pool is None:
+            pool = self.pools[key] = HostPool(
+                scheme, host, port, self.max_per_host, self.ssl_context
+            )
+        return pool
+
+    def request(
+        self,
+        url,
+        data=None,
+        headers=None,
+        method=None,
+        timeout=None,
+        check_type=False,
+        watch=NO_WATCH,
+    ):
+        # With `check_type` a successful response must have one of the
+        # `content_types`, the checks set it, the notifiers do not. The
+        # stages of the request are timed on `watch`.
+        total = timeout or self.total_timeout
+        deadline = time.monotonic() + total
+        # gevent enforces the overall deadline, the socket timeouts cover
+        # connect and each individual read and never exceed the deadline
+        with gevent.Timeout(total, socket.timeout('{} timed out'.format(url))):
+            for _ in range(MAX_REDIRECTS + 1):
+                response = self._request(
+                    url, data, headers or {}, method, deadline, check_type, watch
+                )
+                location = response.headers.get('Location')
+                if response.status in (301, 302, 303, 307, 308) and location:
+                    url = urljoin(url, location)
+                    if response.status in (301, 302, 303):
+                        data, method = None, None
+                    continue
+                break
+            else:
+                # Still redirected, there is no status document to read
+                raise URLError('too many redirects')
+        if response.status >= 400:
+            raise HTTPError(
+                url,
+                response.status,
+                response.reason,
+                response.headers,
+                io.BytesIO(response.body),
+            )
+        return response
+
+    def _request(
+        self, url, data, headers, method, deadline, check_type=False, watch=NO_WATCH
+    ):
+        parts = urlsplit(url)
+        if parts.scheme not in ('http', 'https') or not parts.hostname:
+            raise ValueError('unknown url type: {!r}'.format(url))
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        pool = self.get_pool(parts.scheme, parts.hostname, port)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        if method is None:
+            method = 'POST' if data is not None else 'GET'
+
+        pool.requests += 1
+        conn, reused = pool.acquire(timeout=remaining(deadline))
+        watch.lap('pool')
+        conn.watch = watch
+        ok = False
+        try:
+            try:
+                response = self._send(conn, method, path, data, headers, deadline)
+            except STALE_CONNECTION_ERRORS:
+                if not reused:
+                    raise
+                # The server closed the idle connection, retry on a new one
+                conn.close()
+                response = self._send(conn, method, path, data, headers, deadline)
+            watch.lap('first_byte')
+            body = self._read(url, response, check_type)
+            watch.lap('read')
+            # A body that was cut off leaves the connection unusable
+            ok = not response.will_close and response.isclosed()
+            return Response(
+                url, response.status, response.reason, response.headers, body
+            )
+        except (socket.timeout, http.client.HTTPException, OSError) as e:
+            watch.lap('error')
+            pool.errors += 1
+            if (
+                conn.sock is None
+                or isinstance(e, ConnectionRefusedError)
+                or not isinstance(e, OSError)
+            ):
+                # Nothing was sent, or the answer was not HTTP (e.g. a bad
+                # status line), report it like urlopen does
+                raise URLError(e)
+            raise
+        except BaseException:
+            pool.errors += 1
+            raise
+        finally:
+            conn.watch = NO_WATCH
+            pool.release(conn, reuse=ok)
+
+    def _read(self, url, response, check_type):
+        # Reads at most max_body_size bytes, a successful response that is
+        # too large or of the wrong type is rejected before its body is read
+        limit = self.max_body_size
+        success = 200 <= response.status < 300
+        if success and check_type:
+            content_type = response.headers.get('Content-Type')
+            media_type = (content_type or '').split(';')[0].strip().lower()
+            if not (
+                content_type is None
+                or media_type in self.content_types
+                or media_type.endswith('+json')
+            ):
+                raise RejectedResponse(
+                    url,
+                    'content_type',
+                    'Unexpected Content-Type {}'.format(content_type),
+                )
+        length = response.length
+        if success and length is not None and length > limit:
+            raise RejectedResponse(
+                url,
+                'too_large',
+                'Body of {} bytes is over the limit of {}'.format(length, limit),
+            )
+        body = response.read(limit + 1)
+        if len(body) > limit:
+            if success:
+                raise RejectedResponse(
+                    url,
+                    'too_large',
+                    'Body is over the limit of {} bytes'.format(limit),
+                )
+            body = body[:limit]
+        return body
+
+    def _send(self, conn, method, path, data, headers, deadline):
+        if conn.sock is None:
+            conn.timeout = min(self.connect_timeout, remaining(deadline))
+            try:
+                conn.connect()
+            except BaseException:
+                conn.close()
+                raise
+        conn.sock.settimeout(min(self.read_timeout, remaining(deadline)))
+        conn.request(method, path, body=data, headers=headers)
+        return conn.getresponse()
+
+    def stats(self):
+        return {key: pool.stats() for key, pool in self.pools.items()}
+
+    def close(self):
+        for pool in self.pools.values():
+            pool.close()
+
+
+CLIENT = None
+
+
+def get_client():
+    # One client shared by the checks and the notifiers
+    global CLIENT
+    if CLIENT is None:
+        config = get_config()
+        CLIENT = HTTPClient(
+            max_per_host=config.max_connections_per_host,
+            connect_timeout=config.connect_timeout,
+            read_timeout=config.read_timeout,
+            total_timeout=config.total_timeout,
+            max_body_size=config.max_body_size,
+            content_types=config.content_types,
+        )
+    return CLIENT
+
+
+def request(
+    url,
+    data=None,
+    headers=None,
+    method=None,
+    timeout=None,
+    check_type=False,
+    watch=NO_WATCH,
+):
+    return get_client().request(url, data, headers, method, timeout, check_type, watch)
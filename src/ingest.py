@@ -0,0 +1,178 @@
+import datetime
+import heapq
+import hmac
+import logging
+import time
+
+from gevent.event import Event
+
+from documents import loads
+from evaluator import DEFAULT_FREQUENCY
+from settings import get_config
+
+# Seconds after lastrun + frequency before a missing heartbeat fails
+DEFAULT_GRACE = 5
+DEFAULT_MAX_BATCH = 1000
+# Stats of pushed tasks are kept under push://<task>
+PUSH_PREFIX = 'push://'
+
+log = logging.getLogger('pinger')
+
+
+class IngestError(ValueError):
+    pass
+
+
+def task_key(document):
+    # The `task` of a heartbeat names it, or else its server and process
+    task = document.get('task')
+    if not task:
+        server = document.get('server')
+        process = document.get('process')
+        if not (server and process):
+            raise IngestError('A heartbeat needs a task, or a server and a process')
+        task = '{}/{}'.format(server, process)
+    return PUSH_PREFIX + str(task)
+
+
+def parse_heartbeats(body, max_batch=DEFAULT_MAX_BATCH):
+    # A single status document or an array of them, as [(key, document)]
+    try:
+        documents = loads(body)
+    except ValueError:
+        raise IngestError('The body is not valid JSON')
+    if isinstance(documents, dict):
+        documents = [documents]
+    elif not isinstance(documents, list):
+        raise IngestError('Expected a status document or an array of them')
+    if len(documents) > max_batch:
+        raise IngestError(
+            'At most {} heartbeats per request, got {}'.format(
+                max_batch, len(documents)
+            )
+        )
+    heartbeats = []
+    for i, document in enumerate(documents):
+        if not isinstance(document, dict):
+            raise IngestError('Heartbeat {} is not a status document'.format(i))
+        heartbeats.append((task_key(document), document))
+    return heartbeats
+
+
+class HeartbeatMonitor(object):
+    """
+    Deadlines of the tasks that push their status to /ingest.
+
+    Every heartbeat moves the deadline of its task to ``lastrun`` plus its
+    ``frequency`` plus ``grace`` seconds, and ``expired(key)`` is called once
+    a deadline passes without another heartbeat. The deadlines are kept on a
+    min-heap with one entry per task. A heartbeat only updates a dict, an
+    entry that comes up before the current deadline of its task is pushed
+    back instead of firing.
+    """
+
+    def __init__(
+        self,
+        expired,
+        grace=DEFAULT_GRACE,
+        max_batch=DEFAULT_MAX_BATCH,
+        token=None,
+        clock=time.time,
+    ):
+        self.expired = expired
+        self.grace = grace
+        self.max_batch = max_batch
+        self.token = token
+        self.clock = clock
+        self.documents = {}
+        self.deadlines = {}
+        self.heap = []
+        self.wakeup = Event()
+        self.received = 0
+        self.overdue = 0
+
+    def authorized(self, header):
+        if not self.token:
+            return True
+        return hmac.compare_digest(header or '', 'Bearer {}'.format(self.token))
+
+    def receive(self, key, document):
+        self.received += 1
+        self.documents[key] = document
+
+    def arm(self, key, result, now, error_interval):
+        # Set the deadline from the evaluated heartbeat, `now` is a datetime
+        state = result.state
+        if state.status == 'sleeping':
+            deadline = state.sleep_end.timestamp() + self.grace
+        elif state.status == 'error' or result.lag is None:
+            # Evaluated again like a failing url is checked again
+            deadline = now.timestamp() + error_interval
+        else:
+            # The same lastrun gives exactly the same deadline
+            lastrun = now - datetime.timedelta(seconds=result.lag)
+            frequency = result.document.get('frequency', DEFAULT_FREQUENCY) * 60
+            deadline = lastrun.timestamp() + frequency + self.grace
+        self.set(key, deadline)
+
+    def set(self, key, deadline):
+        current = self.deadlines.get(key)
+        self.deadlines[key] = deadline
+        if current is None or deadline < current:
+            heapq.heappush(self.heap, (deadline, key))
+            self.wakeup.set()
+
+    def due(self, now):
+        # Pops the tasks whose deadline passed
+        expired = []
+        while self.heap and self.heap[0][0] <= now:
+            deadline, key = heapq.heappop(self.heap)
+            current = self.deadlines.get(key)
+            if current is None:
+                continue
+            if current > deadline:
+                heapq.heappush(self.heap, (current, key))
+                continue
+            del self.deadlines[key]
+            expired.append(key)
+        return expired
+
+    def run(self):
+        while True:
+            self.wakeup.clear()
+            for key in self.due(self.clock()):
+                self.overdue += 1
+                try:
+                    self.expired(key)
+                except Exception as e:
+                    log.exception(e)
+            timeout = self.heap[0][0] - self.clock() if self.heap else None
+            self.wakeup.wait(timeout)
+
+    def restore(self, key, document):
+        # A task of the last run, evaluated again from its last heartbeat
+        # right away, a task that stopped while the pinger was down fails
+        self.documents[key] = document
+        self.set(key, self.clock())
+
+    def forget(self, key):
+        self.documents.pop(key, None)
+        self.deadlines.pop(key, None)
+
+    def stats(self):
+        return {
+            'tasks': len(self.documents),
+            'scheduled': len(self.heap),
+            'received': self.received,
+            'overdue': self.overdue,
+        }
+
+
+def setup_ingest(expired):
+    config = get_config()
+    return HeartbeatMonitor(
+        expired,
+        grace=config.ingest_grace,
+        max_batch=config.ingest_max_batch,
+        token=config.ingest_token,
+    )
@@ -0,0 +1,210 @@
+import json
+import logging
+import logging.handlers
+import os
+from collections import deque
+from time import monotonic
+
+from gevent.monkey import get_original
+
+from settings import get_config
+
+DEFAULT_PATH = 'pinger.log'
+# Rotated at 10 MB, keeping 5 old files
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUP_COUNT = 5
+DEFAULT_BUFFER_SIZE = 10000
+# Identical lines written per period, the rest are counted
+DEFAULT_RATE_LIMIT = 20
+DEFAULT_RATE_PERIOD = 60.0
+# Seconds the writer sleeps when there is nothing to write, and the most
+# lines it writes at once
+WRITER_IDLE = 0.05
+MAX_BATCH = 1000
+TEXT_FORMAT = '%(asctime)s %(levelname)s %(message)s'
+
+# A real thread and sleep even after monkey patching, so that the disk
+# writes never run on the event loop
+start_new_thread = get_original('_thread', 'start_new_thread')
+real_sleep = get_original('time', 'sleep')
+
+
+class JSONFormatter(logging.Formatter):
+    # One JSON object per line
+    def format(self, record):
+        line = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            line['exception'] = self.formatException(record.exc_info)
+        return json.dumps(line)
+
+
+class LogPipeline(logging.Handler):
+    """
+    Formats log records and hands the lines to a single background thread,
+    which writes them in batches with the ``target`` handler. Lines wait in a
+    buffer of ``capacity`` lines, a full buffer drops and counts them instead
+    of blocking. At most ``rate_limit`` records with the same key (the
+    ``key`` extra, or else the message) are kept per ``rate_period`` seconds,
+    how many more there were is written once the period ends.
+
+    The writer thread mostly waits on the disk without holding the GIL, it
+    formats nothing and writes a batch with a single call.
+    """
+
+    def __init__(
+        self,
+        target,
+        capacity=DEFAULT_BUFFER_SIZE,
+        rate_limit=DEFAULT_RATE_LIMIT,
+        rate_period=DEFAULT_RATE_PERIOD,
+        clock=monotonic,
+    ):
+        super(LogPipeline, self).__init__()
+        self.target = target
+        self.capacity = capacity
+        self.rate_limit = rate_limit
+        self.rate_period = rate_period
+        self.clock = clock
+        self.buffer = deque()
+        self.window = clock()
+        self.seen = {}
+        self.running = False
+        self.stopped = True
+        self.written = 0
+        self.dropped = 0
+        self.suppressed = 0
+        self.errors = 0
+
+    def start(self):
+        self.running = True
+        self.stopped = False
+        start_new_thread(self.run, ())
+        return self
+
+    def emit(self, record):
+        if self.rate_limit and not self.allow(record):
+            return
+        self.put(record)
+
+    def put(self, record):
+        if len(self.buffer) >= self.capacity:
+            self.dropped += 1
+            return
+        self.buffer.append(self.format(record))
+
+    def allow(self, record):
+        now = self.clock()
+        if now - self.window >= self.rate_period:
+            self.end_window()
+            self.window = now
+        key = (record.levelno, getattr(record, 'key', None) or record.getMessage())
+        entry = self.seen.get(key)
+        if entry is None:
+            self.seen[key] = [1, record]
+            return True
+        entry[0] += 1
+        if entry[0] <= self.rate_limit:
+            return True
+        self.suppressed += 1
+        return False
+
+    def end_window(self):
+        seen, self.seen = self.seen, {}
+        for count, first in seen.values():
+            if count > self.rate_limit:
+                summary = logging.makeLogRecord(first.__dict__)
+                summary.msg = '{} more times in {:.0f}s: {}'.format(
+                    count - self.rate_limit, self.rate_period, first.getMessage()
+                )
+                summary.args = None
+                summary.exc_info = summary.exc_text = None
+                self.put(summary)
+
+    def run(self):
+        # The only writer, nothing else touches the target handler
+        while self.running or self.buffer:
+            if not self.buffer:
+                real_sleep(WRITER_IDLE)
+                continue
+            lines = []
+            while self.buffer and len(lines) < MAX_BATCH:
+                lines.append(self.buffer.popleft())
+            # One record for the batch, the target rotates between batches
+            batch = logging.makeLogRecord({'msg': '\n'.join(lines)})
+            try:
+                self.target.emit(batch)
+                self.written += len(lines)
+            except Exception:
+                self.errors += 1
+        self.target.close()
+        self.stopped = True
+
+    def flush(self, timeout=5.0):
+        # Waits for the writer to catch up
+        deadline = monotonic() + timeout
+        while self.buffer and not self.stopped and monotonic() < deadline:
+            real_sleep(WRITER_IDLE)
+
+    def close(self, timeout=5.0):
+        # Writes what is left, then stops the writer
+        self.running = False
+        deadline = monotonic() + timeout
+        while not self.stopped and monotonic() < deadline:
+            real_sleep(WRITER_IDLE)
+        super(LogPipeline, self).close()
+
+    def stats(self):
+        return {
+            'queued': len(self.buffer),
+            'capacity': self.capacity,
+            'written': self.written,
+            'dropped': self.dropped,
+            'suppressed': self.suppressed,
+            'errors': self.errors,
+        }
+
+
+def file_handler(
+    path, max_bytes=DEFAULT_MAX_BYTES, backup_count=DEFAULT_BACKUP_COUNT, when=None
+):
+    # Rotates by time when `when` is set (e.g. midnight), else by size
+    if when:
+        return logging.handlers.TimedRotatingFileHandler(
+            path, when=when, backupCount=backup_count, delay=True
+        )
+    return logging.handlers.RotatingFileHandler(
+        path, maxBytes=max_bytes, backupCount=backup_count, delay=True
+    )
+
+
+def shard_path(path, shard):
+    # pinger.log -> pinger.<shard>.log
+    root, ext = os.path.splitext(path)
+    return '{}.{}{}'.format(root, shard, ext)
+
+
+def setup_logging(config=None, shard=None):
+    # Shard workers write their own file, a file that several processes
+    # rotate loses lines and old files
+    config = config or get_config()
+    path = config.log_path
+    if shard is not None:
+        path = shard_path(path, shard)
+    target = file_handler(
+        path, config.log_max_bytes, config.log_backup_count, config.log_when
+    )
+    pipeline = LogPipeline(
+        target,
+        capacity=config.log_buffer_size,
+        rate_limit=config.log_rate_limit,
+        rate_period=config.log_rate_period,
+    )
+    if config.log_format == 'json':
+        pipeline.setFormatter(JSONFormatter())
+    else:
+        pipeline.setFormatter(logging.Formatter(TEXT_FORMAT))
+    return pipeline.start()
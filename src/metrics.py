@@ -0,0 +1,149 @@
+from array import array
+from bisect import bisect_left
+
+# Upper bounds of the latency buckets in seconds and size buckets in bytes
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = (128, 512, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class Histogram(object):
+    """
+    Fixed bucket histogram, constant memory per instance. Histograms with the
+    same buckets can be merged.
+    """
+
+    __slots__ = ('bounds', 'counts', 'total', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        # One slot per bound plus the +Inf bucket
+        self.counts = array('L', bytes(array('L').itemsize * (len(bounds) + 1)))
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def merge(self, other):
+        if other.bounds != self.bounds:
+            raise ValueError('Cannot merge histograms with different buckets')
+        for i, n in enumerate(other.counts):
+            self.counts[i] += n
+        self.total += other.total
+        self.count += other.count
+        return self
+
+    def cumulative(self):
+        running = 0
+        for n in self.counts:
+            running += n
+            yield running
+
+
+def escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_bound(bound):
+    return repr(float(bound))
+
+
+class URLMetrics(object):
+    __slots__ = ('labels', 'latency', 'size', 'rendered')
+
+    def __init__(self, url):
+        # The label set is rendered once and reused on every scrape
+        self.labels = 'url="{}"'.format(escape(url))
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.size = Histogram(SIZE_BUCKETS)
+        # Rendered histogram lines, kept until the next observation
+        self.rendered = {}
+
+
+class Metrics(object):
+    def __init__(self):
+        self.urls = {}
+        self.bucket_labels = {
+            bounds: [',le="{}"}} '.format(format_bound(b)) for b in bounds]
+            + [',le="+Inf"} ']
+            for bounds in (LATENCY_BUCKETS, SIZE_BUCKETS)
+        }
+
+    def get(self, url):
+        metrics = self.urls.get(url)
+        if metrics is None:
+            metrics = self.urls[url] = URLMetrics(url)
+        return metrics
+
+    def observe(self, url, seconds, size=None):
+        # Failed checks have a duration but no response size
+        metrics = self.get(url)
+        metrics.latency.observe(seconds)
+        if size is not None:
+            metrics.size.observe(size)
+        metrics.rendered.clear()
+
+    def labels(self, url):
+        # Urls that were never fetched, like the tasks of an aggregate url,
+        # get no histograms
+        metrics = self.urls.get(url)
+        if metrics is None:
+            return 'url="{}"'.format(escape(url))
+        return metrics.labels
+
+    def forget(self, url):
+        self.urls.pop(url, None)
+
+    def render_histogram(self, out, name, help_text, attr):
+        out.append('# HELP {} {}\n# TYPE {} histogram\n'.format(name, help_text, name))
+        bucket = name + '_bucket{'
+        total = name + '_sum{'
+        count = name + '_count{'
+        for metrics in self.urls.values():
+            text = metrics.rendered.get(attr)
+            if text is None:
+                histogram = getattr(metrics, attr)
+                labels = metrics.labels
+                les = self.bucket_labels[histogram.bounds]
+                lines = [
+                    '{}{}{}{}\n'.format(bucket, labels, le, n)
+                    for le, n in zip(les, histogram.cumulative())
+                ]
+                lines.append('{}{}}} {}\n'.format(total, labels, repr(histogram.total)))
+                lines.append('{}{}}} {}\n'.format(count, labels, histogram.count))
+                text = metrics.rendered[attr] = ''.join(lines)
+            out.append(text)
+
+    def render(self, stats):
+        # Prometheus text exposition format, `stats` is the pinger STATS dict
+        out = []
+        self.render_histogram(
+            out,
+            'pinger_check_duration_seconds',
+            'Time taken to fetch the task status.',
+            'latency',
+        )
+        self.render_histogram(
+            out,
+            'pinger_response_size_bytes',
+            'Size of the task status response.',
+            'size',
+        )
+        for name, key, help_text in (
+            ('pinger_pings_total', 'pings', 'Checks made per url.'),
+            ('pinger_errors_total', 'errors', 'Checks that ended in an error.'),
+        ):
+            out.append(
+                '# HELP {} {}\n# TYPE {} counter\n'.format(name, help_text, name)
+            )
+            for url, value in list(stats.items()):
+                labels = self.labels(url)
+                out.append('{}{{{}}} {}\n'.format(name, labels, value[key]))
+        return ''.join(out)
+
+
+METRICS = Metrics()
@@ -0,0 +1,168 @@
+import logging
+import time
+
+import gevent
+from gevent.queue import Queue, Empty, Full
+
+DEFAULT_WINDOW = 5.0
+DEFAULT_QUEUE_SIZE = 1000
+DEFAULT_MAX_BATCH = 50
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF = 2.0
+MAX_BACKOFF = 60.0
+# Weight of the newest sample in the average delivery latency
+LATENCY_SMOOTHING = 0.1
+
+log = logging.getLogger('pinger')
+
+
+def digest(messages):
+    if len(messages) == 1:
+        return messages[0]
+    return '{} messages:\n{}'.format(len(messages), '\n'.join(messages))
+
+
+class Channel(object):
+    """
+    Delivers messages to a single notification service from a bounded queue.
+
+    Messages that arrive within ``window`` seconds of the first one are sent
+    as a single digest. Failed deliveries are retried with exponential
+    backoff, and messages are dropped (and counted) when the queue is full.
+    """
+
+    def __init__(
+        self,
+        name,
+        send,
+        window=DEFAULT_WINDOW,
+        queue_size=DEFAULT_QUEUE_SIZE,
+        max_batch=DEFAULT_MAX_BATCH,
+        retries=DEFAULT_RETRIES,
+        backoff=DEFAULT_BACKOFF,
+    ):
+        self.name = name
+        self.send = send
+        self.window = window
+        self.max_batch = max_batch
+        self.retries = retries
+        self.backoff = backoff
+        self.queue = Queue(queue_size)
+        self.greenlet = None
+        self.busy = False
+        self.closing = False
+        self.queued = 0
+        self.dropped = 0
+        self.delivered = 0
+        self.posts = 0
+        self.failed = 0
+        self.retried = 0
+        self.latency_last = 0.0
+        self.latency_avg = 0.0
+        self.latency_max = 0.0
+
+    def put(self, message):
+        try:
+            self.queue.put_nowait((time.monotonic(), message))
+            self.queued += 1
+        except Full:
+            self.dropped += 1
+
+    def run(self):
+        while not self.closing:
+            batch = [self.queue.get()]
+            self.busy = True
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(self.queue.get(timeout=timeout))
+                except Empty:
+                    break
+            self.deliver(batch)
+            self.busy = False
+
+    def deliver(self, batch):
+        message = digest([m for _, m in batch])
+        for attempt in range(self.retries + 1):
+            try:
+                self.send(message)
+                break
+            except Exception as e:
+                if attempt == self.retries:
+                    self.failed += len(batch)
+                    log.error(
+                        'Giving up sending {} messages to {}: {}'.format(
+                            len(batch), self.name, e
+                        )
+                    )
+                    return
+                self.retried += 1
+                gevent.sleep(min(self.backoff * 2**attempt, MAX_BACKOFF))
+        self.posts += 1
+        self.delivered += len(batch)
+        latency = time.monotonic() - batch[0][0]
+        self.latency_last = latency
+        self.latency_max = max(self.latency_max, latency)
+        self.latency_avg += LATENCY_SMOOTHING * (latency - self.latency_avg)
+
+    def flush(self):
+        # Deliver whatever is left in the queue right away
+        batch = []
+        while not self.queue.empty():
+            batch.append(self.queue.get_nowait())
+            if len(batch) == self.max_batch:
+                self.deliver(batch)
+                batch = []
+        if batch:
+            self.deliver(batch)
+
+    def stats(self):
+        return {
+            'depth': self.queue.qsize(),
+            'queued': self.queued,
+            'dropped': self.dropped,
+            'delivered': self.delivered,
+            'posts': self.posts,
+            'failed': self.failed,
+            'retried': self.retried,
+            'latency_last': round(self.latency_last, 3),
+            'latency_avg': round(self.latency_avg, 3),
+            'latency_max': round(self.latency_max, 3),
+        }
+
+
+class Dispatcher(object):
+    def __init__(self, senders, **options):
+        self.channels = {
+            name: Channel(name, send, **options) for name, send in senders.items()
+        }
+
+    def publish(self, message):
+        for channel in self.channels.values():
+            channel.put(message)
+
+    def start(self):
+        for channel in self.channels.values():
+            channel.greenlet = gevent.spawn(channel.run)
+
+    def idle(self):
+        return all(c.queue.empty() and not c.busy for c in self.channels.values())
+
+    def close(self, timeout=None):
+        # Stop the delivery workers and send what is still queued. A worker
+        # that is in the middle of a delivery finishes it first.
+        for channel in self.channels.values():
+            channel.closing = True
+            if channel.greenlet is not None and not channel.busy:
+                channel.greenlet.kill()
+        with gevent.Timeout(timeout, False):
+            for channel in self.channels.values():
+                if channel.greenlet is not None:
+                    channel.greenlet.join()
+                channel.flush()
+
+    def stats(self):
+        return {name: c.stats() for name, c in self.channels.items()}
@@ -1,248 +1,335 @@
 #!/usr/bin/env python
-from time import sleep
-import datetime
-from pytz import UTC
-from dateutil import parser
+from time import sleep, monotonic, time
 from urllib.error import HTTPError, URLError
 from socket import error as SocketError
-from json import loads
-from urllib.request import urlopen, Request
+import argparse
 import signal
+import socket
 import os
+import sys
 
 from utils import (
     get_settings,
     get_now,
-    debug_mode,
     sigterm_handler,
     send_messages,
     get_logger,
     setup_sentry,
-    request_token,
+    setup_notifications,
 )
+import utils
+from auth import TOKEN_CACHE
+import http_client
+from hosts import BREAKERS, DNS, HostDown, setup_hosts
+from scheduler import Scheduler, host_of
+from alerts import AlertState, setup_alerts
+from metrics import METRICS, CONTENT_TYPE as METRICS_CONTENT_TYPE
+from history import HISTORY
+from events import parse_last_event_id, setup_events
+from evaluator import (
+    State,
+    aggregate_tasks,
+    base_url,
+    evaluate,
+    evaluate_response,
+    evaluate_error,
+    is_aggregate,
+    FAILURE,
+    RECOVERY,
+    ASLEEP,
+    STILL_ASLEEP,
+    AWAKE,
+)
+from ingest import PUSH_PREFIX, IngestError, parse_heartbeats, setup_ingest
+from polling import PollingPolicy
+from profiling import (
+    MAX_PROFILE_SECONDS,
+    NO_WATCH,
+    TIMINGS,
+    profile,
+    setup_profiling,
+)
+from response_cache import RESPONSES
+from state_store import setup_state_store
+from settings import get_config, sighup_handler, CACHE as SETTINGS_CACHE
+from sharding import node_urls, read_assignments, setup_reporter, setup_supervisor
+from stats_view import StatsView
+from url_stats import UrlStats, shared
 
 
-from flask import Flask, jsonify
 import gevent
 import gevent.monkey
+from gevent.fileobject import FileObject
+from gevent.pywsgi import WSGIServer
 
 gevent.monkey.patch_all()
 
 log = get_logger()
 
 STATS = {}
-
-
-def worker(url):
+VIEW = StatsView(STATS)
+ALERTS = None
+STORE = None
+REPORTER = None
+EVENTS = None
+POLLING = PollingPolicy()
+HEARTBEATS = None
+HUB_MONITOR = None
+# The task urls of every aggregate url
+TASKS = {}
+# Bytes of a response body that are logged in debug mode
+DEBUG_BODY_SIZE = 200
+# Urls listed in the message sent at startup
+MESSAGE_URLS = 10
+
+
+def check(url):
+    # Check a url once, returns the number of seconds until the next check
     global STATS
-    settings = get_settings()
-    DEBUG = debug_mode()
-    INTERVAL = int(settings['main']['interval'])
-    ERRINTERVAL = int(settings['main']['error_interval'])
 
-    while 1:
-        # Create a stats dict per url
-        create_stats_per_url(url)
-        try:
-            req = Request(url)
-            # Set an auth token header if necessary
-            set_token_auth(req)
-
-            # Begin checking the endpoints
-            with urlopen(req) as fp:
-                now = get_now()
-                sleeping = False
-                status = None
-                status_date = None
-                message = ''
-                line = fp.read()
-                if DEBUG:
-                    log.debug(
-                        '{}: Received response from {}: {}'.format(now, url, line)
-                    )
-                try:
-                    status = loads(line)
-                except Exception as e:
-                    send_messages(
-                        'Error: Could not parse response from'
-                        ' endpoint {}'.format(url)
+    # Settings are cached, re-read them every check so that a reload
+    # changes the intervals without a restart
+    config = get_config()
+    DEBUG = config.debug
+    INTERVAL = config.interval
+    ERRINTERVAL = config.error_interval
+    # Create a stats dict per url
+    create_stats_per_url(url)
+    latency = None
+    lag = None
+    now = None
+    result = None
+    # Times the stages of the check when [profiling] timings is on
+    watch = TIMINGS.stopwatch()
+    try:
+        # Begin checking the endpoints
+        started = monotonic()
+        # Conditional headers let the server answer 304 if nothing changed
+        with open_url(url, RESPONSES.headers(url), watch) as fp:
+            host_answered(url)
+            now = get_now()
+            line = fp.read()
+            latency = monotonic() - started
+            METRICS.observe(url, latency, len(line))
+            if DEBUG:
+                log.debug(
+                    '{}: Received {} bytes from {}: {}'.format(
+                        now, len(line), url, line[:DEBUG_BODY_SIZE]
                     )
-                    update_stats(url, 'error')
-
-                if status:
-                    if STATS[url]['status'] == 'sleeping':
-                        # Check if it's time to wake up
-                        start = STATS[url]['sleep_start']
-                        end = STATS[url]['sleep_end']
-                        if DEBUG:
-                            log.debug('{} <= {} <= {}'.format(start, now, end))
-                        if start <= now <= end:
-                            log.info('{}: {} is still asleep! zzzzzz'.format(now, url))
-                        else:
-                            # Wake Up!
-                            update_stats(url, 'ok', None, None)
-                            STATS[url]['sleep_start'] = None
-                            end = STATS[url]['sleep_end'] = None
-                            log.info('{}: {} is waking up! (yawn)'.format(now, url))
-                    else:
-                        # Check if the time falls between the normal
-                        # sleep interval
-                        sleepy_time = status.get('sleep', [])
-                        for sleep in sleepy_time:
-                            start = sleep.get('start')
-                            end = sleep.get('start')
-                            duration = sleep.get('duration')
-                            # Check that to and from are parsable dates
-                            if start and duration:
-                                try:
-                                    start = parser.parse(start).replace(tzinfo=UTC)
-                                    # The from time is the to time + the duration
-                                    # in minutes
-                                    end = parser.parse(end).replace(tzinfo=UTC)
-                                    end += datetime.timedelta(minutes=duration)
-                                    # Does the time now fall between the sleep period?
-                                    if DEBUG:
-                                        log.debug(
-                                            '{} <= {} <= {}'.format(start, now, end)
-                                        )
-                                        log.info(
-                                            'Sleeping: {}'.format(start <= now <= end)
-                                        )
-                                    if start <= now <= end:
-                                        sleeping = True
-                                        update_stats(url, 'sleeping', start, end)
-                                        log.info(
-                                            '{}: {} is asleep! zzzzzz'.format(now, url)
-                                        )
-                                        break
-                                except Exception as e:
-                                    log.error('Error parsing sleep time!')
-
-                    if STATS[url]['status'] != 'sleeping':
-                        # Check if the last run time falls in between the
-                        # acceptable margin
-                        frequency = status.get('frequency', 10)
-                        server = status.get('server', '')
-                        process = status.get('process', '')
-                        reason = status.get('reason', '')
-                        status_msg = status.get('status', None)
-                        margin = datetime.timedelta(minutes=frequency)
-                        # Try to parse the date, if this is not possible throw
-                        # an exeption and notify
-                        try:
-                            status_date = parser.parse(status.get('lastrun', None))
-                        except Exception as e:
-                            update_stats(url, 'error', process=process, server=server)
-                            status_date = None
-                            send_messages(
-                                'Error: Date Parse {} error for endpoint'
-                                ' {}'.format(status.get('lastrun', None), url)
-                            )
-                        if status_date and not (
-                            now - margin <= status_date <= now + margin
-                        ):
-                            # This is a failure due to the age of the last status, report it.
-                            # Also report the last known status, for good information.
-                            message = (
-                                'Error: {}/{} is outside of the acceptable {} '
-                                'minute range. Last Run {} UTC with status {}'.format(
-                                    process, server, frequency, status_date, status_msg
-                                )
-                            )
-                            update_stats(url, 'error', process=process, server=server)
-                            send_messages(message)
-                        elif status_date and (
-                            now - margin <= status_date <= now + margin
-                        ):
-                            if status_msg != 'OK':
-                                message = (
-                                    'Error: Failure reported on process {} running'
-                                    ' on {}. Status: {} Error: {}.'.format(
-                                        process, server, status_msg, reason
-                                    )
-                                )
-                                update_stats(
-                                    url, 'error', process=process, server=server
-                                )
-                                send_messages(message)
-                            else:
-                                # Everything is okay, but check if the last check
-                                # was a failure
-                                if STATS[url]['status'] == 'error':
-                                    message = 'Status: {}/{} ({}) is OK again!'.format(
-                                        process, server, url
-                                    )
-                                    send_messages(message)
-                                update_stats(url, 'ok', process=process, server=server)
-                        else:
-                            # Something is wrong if no status_date exists
-                            message = 'Error: {}/{} is not configured properly {} '.format(
-                                process, server, url
-                            )
-                            update_stats(url, 'error', process=process, server=server)
-                            send_messages(message)
-
-        except HTTPError as e:
-            # If we receive an HTML error, report it as an error
-            # https://docs.python.org/3/library/urllib.error.html#urllib.error.HTTPError
-            log.exception(e)
-            send_messages(
-                'Warn: HTTP Error: {} - Code {} - {}'.format(url, e.code, e.reason)
+                )
+            # An unchanged response reuses the status parsed last time, only
+            # the time based checks run again
+            previous = State.from_stats(STATS[url])
+            status = RESPONSES.lookup(url, fp)
+            if status is not None:
+                watch.lap('decode')
+                STATS[url]['cache_hits'] += 1
+                result = evaluate(previous, status, now, url)
+            else:
+                result = evaluate_response(previous, line, now, url, watch)
+                if result.document is not None:
+                    RESPONSES.store(url, fp, result.document)
+            watch.lap('evaluate')
+            STATS[url]['cache_hit_rate'] = round(
+                STATS[url]['cache_hits'] / float(STATS[url]['pings']), 3
             )
-            update_stats(url, 'error')
-        except URLError as e:
-            # If we receive an URL error, report it as an error
-            # https://docs.python.org/3/library/urllib.error.html#urllib.error.URLError
-            log.exception(e)
-            send_messages('Warn: URLError: {} - {}'.format(url, e))
-            update_stats(url, 'error')
-        except SocketError as e:
-            # If we receive a socket error, report it as a warning
-            log.exception(e)
-            message = 'Warn: Problem retrieving {}. Will try again in a few minutes.'.format(
-                url
-            )
-            send_messages(message)
-            update_stats(url, 'error')
-
-        if STATS[url]['status'] == 'error':
-            # Use the longer interval so as not to spam people with errors
-            log.warning('Sleeping {} for {} seconds'.format(url, ERRINTERVAL))
-            gevent.sleep(ERRINTERVAL)
-        else:
-            if DEBUG:
-                log.debug('Sleeping {} for {} seconds'.format(url, INTERVAL))
-            # Everything is fine, use the normal interval
-            gevent.sleep(INTERVAL)
-
-
-def set_token_auth(req):
+            lag = result.lag
+            apply_result(url, result, now)
+            if is_aggregate(result.document):
+                # One response with the status of many tasks
+                check_tasks(url, result.document, now)
+
+    except HTTPError as e:
+        # If we receive an HTML error, report it as an error
+        # https://docs.python.org/3/library/urllib.error.html#urllib.error.HTTPError
+        log.exception(e)
+        METRICS.observe(url, monotonic() - started)
+        host_answered(url)
+        message = 'Warn: HTTP Error: {} - Code {} - {}'.format(url, e.code, e.reason)
+        apply_result(url, evaluate_error('http', e.code, message))
+    except http_client.RejectedResponse as e:
+        # A response that is not a status document, its body was not read
+        log.warning('{}: {}'.format(url, e))
+        METRICS.observe(url, monotonic() - started)
+        host_answered(url)
+        message = 'Warn: Rejected response from {} - {}'.format(url, e)
+        apply_result(url, evaluate_error('response', e.reason, message))
+    except HostDown as e:
+        # Nothing was sent, the alert of the host covers this url
+        message = 'Warn: Not checking {} - {}'.format(url, e)
+        apply_result(url, evaluate_error('host', e.host, message))
+    except URLError as e:
+        # If we receive an URL error, report it as an error
+        # https://docs.python.org/3/library/urllib.error.html#urllib.error.URLError
+        log.exception(e)
+        METRICS.observe(url, monotonic() - started)
+        message = 'Warn: URLError: {} - {}'.format(url, e)
+        apply_result(url, connection_error(url, 'url', e.reason, message))
+    except SocketError as e:
+        # If we receive a socket error, report it as a warning, timeouts
+        # included
+        log.exception(e)
+        METRICS.observe(url, monotonic() - started)
+        message = 'Warn: Problem retrieving {}. Will try again in a few minutes.'.format(
+            url
+        )
+        apply_result(url, connection_error(url, 'socket', type(e).__name__, message))
+    watch.lap('notify')
+
+    HISTORY.record(url, time(), latency, STATS[url]['status'], lag)
+    stats_changed(url)
+    if STORE is not None:
+        STORE.mark(url)
+    if REPORTER is not None:
+        REPORTER.mark(url)
+    watch.lap('record')
+    TIMINGS.record(url, watch)
+
+    if config.adaptive:
+        # Follow the schedule of the task, back off while it fails
+        delay = POLLING.next_check(
+            url, State.from_stats(STATS[url]), result, now or get_now(), config
+        )
+    elif STATS[url]['status'] == 'error':
+        # Use the longer interval so as not to spam people with errors
+        delay = ERRINTERVAL
+    else:
+        # Everything is fine, use the normal interval
+        delay = INTERVAL
+    if BREAKERS.is_open(host_of(url)):
+        # Come back around the probe of the host instead of after the error
+        # interval, these checks send no requests
+        delay = min(delay, BREAKERS.retry)
+    if STATS[url]['status'] == 'error':
+        log.warning('Sleeping {} for {:.0f} seconds'.format(url, delay))
+    elif DEBUG:
+        log.debug('Sleeping {} for {:.0f} seconds'.format(url, delay))
+    return delay
+
+
+def apply_result(url, result, now=None):
+    # Write the outcome of an evaluation to STATS and act on its events
+    for event in result.events:
+        if event.kind == FAILURE:
+            ALERTS.failure(url, event.error_class, event.reason, event.message)
+        elif event.kind == RECOVERY:
+            ALERTS.success(url, event.message)
+        elif event.kind == ASLEEP:
+            log.info('{}: {} is asleep! zzzzzz'.format(now, url))
+        elif event.kind == STILL_ASLEEP:
+            log.info('{}: {} is still asleep! zzzzzz'.format(now, url))
+        elif event.kind == AWAKE:
+            log.info('{}: {} is waking up! (yawn)'.format(now, url))
+    state = result.state
+    if state.status != 'error' and state == State.from_stats(STATS[url]):
+        return
+    update_stats(
+        url,
+        state.status,
+        state.sleep_start,
+        state.sleep_end,
+        state.process,
+        state.server,
+    )
+
+
+def stats_changed(url):
+    # Refresh the cached JSON of a url, a new status is published on /events
+    previous = VIEW.touch(url)
+    stats = STATS.get(url)
+    if EVENTS is None or not stats or not stats['status']:
+        return
+    if stats['status'] != previous:
+        data = {
+            'url': url,
+            'status': stats['status'],
+            'previous': previous,
+            'errors': stats['errors'],
+            'time': round(time(), 3),
+        }
+        EVENTS.publish('status', data)
+
+
+def publish_event(name, data):
+    # Workers hand their events to the supervisor, which serves /events
+    if REPORTER is not None:
+        REPORTER.event(name, data)
+    elif EVENTS is not None:
+        EVENTS.publish(name, data)
+
+
+def publish_alert(url, kind, message):
+    publish_event(
+        'alert',
+        {'url': url, 'kind': kind, 'message': message, 'time': round(time(), 3)},
+    )
+
+
+def host_answered(url):
+    # Any response, even an error page, means the host is up
+    host = host_of(url)
+    if BREAKERS.success(host):
+        log.info('---- {} is back up ----'.format(host))
+        ALERTS.host_up(host)
+
+
+def connection_error(url, error_class, reason, message):
+    # Connection failures of all the urls of a host count towards its
+    # breaker, once it is open they are covered by the alert of the host
+    host = host_of(url)
+    if BREAKERS.failure(host, reason):
+        log.warning('---- {} is down: {} ----'.format(host, reason))
+        ALERTS.host_down(host, reason)
+    if BREAKERS.is_open(host):
+        return evaluate_error('host', host, message)
+    return evaluate_error(error_class, reason, message)
+
+
+def open_url(url, headers=None, watch=NO_WATCH):
+    host = host_of(url)
+    if not BREAKERS.allow(host):
+        raise HostDown(host, BREAKERS.reason(host))
+    headers = dict(headers or {})
+    # Set an auth token header if necessary
+    cached_token = set_token_auth(headers)
+    try:
+        return http_client.request(url, headers=headers, check_type=True, watch=watch)
+    except HTTPError as e:
+        if e.code not in (401, 403) or not cached_token:
+            raise
+        # The login token was rejected, refresh it once and retry
+        log.warning('{}: token rejected with {}, refreshing'.format(url, e.code))
+        TOKEN_CACHE.invalidate(cached_token)
+        set_token_auth(headers)
+        return http_client.request(url, headers=headers, check_type=True, watch=watch)
+
+
+def set_token_auth(headers):
+    # Returns the token if it came from the login token cache
     settings = get_settings()
+    cached_token = None
     if settings.get('token_auth'):
         auth_token = settings['token_auth'].get('token', '')
         if not auth_token and settings['token_auth'].get('url'):
             try:
-                auth_token = request_token()
+                auth_token = cached_token = TOKEN_CACHE.get()
             except Exception as e:
                 log.error(e)
         header = settings['token_auth'].get('header')
-        req.add_header(header, auth_token)
+        headers[header] = auth_token
+    return cached_token
+
+
+def new_stats():
+    return UrlStats()
 
 
 def create_stats_per_url(url):
     global STATS
     # Store stats per URL
     if not STATS.get(url):
-        STATS[url] = {
-            'pings': 0,
-            'errors': 0,
-            'status': '',
-            'sleep_start': None,
-            'sleep_end': None,
-            'server': None,
-            'process': None,
-        }
-    log.info('{}: Pinging {}'.format(datetime.datetime.utcnow(), url))
+        STATS[url] = new_stats()
+    log.debug('Pinging {}'.format(url))
     STATS[url]['pings'] = STATS[url]['pings'] + 1
 
 
@@ -262,27 +349,450 @@ def update_stats(url='', status='', start=None, end=None, process=None, server=N
         STATS[url]['sleep_start'] = start
         STATS[url]['sleep_end'] = end
 
-    STATS[url]['process'] = process
-    STATS[url]['server'] = server
+    # Many urls run on the same servers, keep one copy of the names
+    STATS[url]['process'] = shared(process)
+    STATS[url]['server'] = shared(server)
+
+
+def restore_state(urls, forget_others=True):
+    # Pick up the stats, sleep windows and alert state of the last run
+    started = monotonic()
+    urls = set(urls)
+    restored = 0
+    heartbeats = STORE.load_heartbeats() if HEARTBEATS is not None else {}
+    for u, (stats, alert) in STORE.load().items():
+        base = base_url(u)
+        if u.startswith(PUSH_PREFIX):
+            # Pushed tasks are never listed, only the process serving
+            # /ingest picks them up
+            if HEARTBEATS is None:
+                continue
+        elif base not in urls:
+            if forget_others:
+                STORE.forget(u)
+            continue
+        STATS[u] = UrlStats.from_dict(stats)
+        if base != u:
+            TASKS.setdefault(base, set()).add(u)
+        stats_changed(u)
+        if alert is not None:
+            ALERTS.states[u] = AlertState.from_dict(alert)
+        if u in heartbeats:
+            HEARTBEATS.restore(u, heartbeats[u])
+        restored += 1
+    log.info(
+        '---- Restored state of {} URLs in {:.1f} ms ----'.format(
+            restored, (monotonic() - started) * 1000
+        )
+    )
+
+
+def monitor(scheduler, urls, interval, forget_stored=True):
+    # Schedule new urls and drop the ones no longer monitored. The stored
+    # state is kept for urls that only moved to another shard.
+    urls = set(urls)
+    for u in urls:
+        if u not in scheduler.active:
+            log.info('---- Now monitoring {} ----'.format(u))
+            scheduler.add(u, interval)
+    for u in list(scheduler.active):
+        if u not in urls:
+            log.info('---- No longer monitoring {} ----'.format(u))
+            scheduler.remove(u)
+            forget_url(u, forget_stored)
+
+
+def forget_url(url, forget_stored=True):
+    ALERTS.forget(url)
+    METRICS.forget(url)
+    HISTORY.forget(url)
+    RESPONSES.forget(url)
+    POLLING.forget(url)
+    TIMINGS.forget(url)
+    if STORE is not None and forget_stored:
+        STORE.forget(url)
+    STATS.pop(url, None)
+    stats_changed(url)
+    for task in TASKS.pop(url, ()):
+        forget_url(task, forget_stored)
+
+
+def check_tasks(url, document, now):
+    # Fan an aggregate response out into the stats of its tasks
+    tasks = set()
+    for task, entry in aggregate_tasks(url, document):
+        if not STATS.get(task):
+            STATS[task] = new_stats()
+        STATS[task]['pings'] += 1
+        settle(task, evaluate(State.from_stats(STATS[task]), entry, now, task), now)
+        tasks.add(task)
+    for task in TASKS.get(url, set()) - tasks:
+        log.info('---- {} is no longer in the response ----'.format(task))
+        forget_url(task)
+        if REPORTER is not None:
+            REPORTER.mark(task)
+    TASKS[url] = tasks
+    STATS[url]['tasks'] = len(tasks)
+
+
+def settle(url, result, now):
+    # Act on the evaluation of a task that was not fetched by itself
+    apply_result(url, result, now)
+    HISTORY.record(url, time(), None, STATS[url]['status'], result.lag)
+    stats_changed(url)
+    if STORE is not None:
+        STORE.mark(url)
+    if REPORTER is not None:
+        REPORTER.mark(url)
+
+
+def listen(address, backlog=1024):
+    # pywsgi sends a response in more than one write, with Nagle's algorithm
+    # a keep-alive client waits for the delayed ACK on every request
+    listener = socket.socket()
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    listener.bind(address)
+    listener.listen(backlog)
+    return listener
+
+
+def serve(app, address):
+    server = WSGIServer(listen(address), app, log=None, error_log=log)
+    server.serve_forever()
+
+
+def make_flask_thread(app):
+    def on_exception(greenlet):
+        log.error('---- Flask service crashed! ----')
+        # Sleep, maybe the problem will be resolved in 60 seconds?!
+        sleep(60)
+        log.info('---- Restarting Flask service! ----')
+        make_flask_thread(app)
+
+    log.info('---- Attempting to start Flask service! ----')
+    webapp = gevent.spawn(serve, app, ('0.0.0.0', 3002))
+    webapp.link_exception(on_exception)
+    return webapp
+
+
+def make_app():
+    # Flask is only imported by the process that serves the routes, shard
+    # workers start without it
+    from flask import Flask, json
+
+    VIEW.dumps = json.dumps
+    return Flask(__name__)
+
+
+def json_response(body, etag, status=200):
+    # Cached JSON with an ETag, a matching If-None-Match gets a 304
+    from flask import Response, request
+
+    response = Response(body, status=status, mimetype='application/json')
+    response.set_etag(etag)
+    if status == 200:
+        response.make_conditional(request)
+    return response
+
+
+def add_stats_routes(app):
+    from flask import Response, jsonify, request
+
+    @app.route('/')
+    def service_stats():
+        # ?status= and ?prefix= filter the urls, ?limit= returns pages with
+        # the cursor of the next page in `next`, pass it back as ?cursor=
+        try:
+            limit = request.args.get('limit')
+            if limit is not None:
+                limit = int(limit)
+                if limit < 1:
+                    raise ValueError('limit must be positive')
+            body = VIEW.render(
+                request.args.get('status'),
+                request.args.get('prefix'),
+                request.args.get('cursor'),
+                limit,
+            )
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return json_response(body, VIEW.etag())
+
+    @app.route('/task/<path:url>')
+    def stats_by_url(url):
+        body = VIEW.detail(url)
+        if body is None:
+            return jsonify({'data': {}}), 404
+        status = 500 if STATS[url].get('status') == 'error' else 200
+        return json_response(body, VIEW.etag(url), status)
+
+    @app.route('/summary')
+    def summary():
+        # Number of urls per status
+        return jsonify({'data': VIEW.summary()})
+
+    @app.route('/events')
+    def events():
+        # Server-Sent Events of status changes and alerts, a client that
+        # reconnects with Last-Event-ID continues where it left off
+        last_id = parse_last_event_id(
+            request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+        )
+        response = Response(EVENTS.stream(last_id), mimetype='text/event-stream')
+        response.headers['Cache-Control'] = 'no-cache'
+        # Stops nginx from buffering the stream
+        response.headers['X-Accel-Buffering'] = 'no'
+        return response
+
+    @app.route('/events/stats')
+    def event_stats():
+        return jsonify({'data': EVENTS.stats()})
+
+
+def ingest(key, document, now):
+    # A status document pushed by a task, evaluated like a polled response
+    if not STATS.get(key):
+        STATS[key] = new_stats()
+    STATS[key]['pings'] += 1
+    HEARTBEATS.receive(key, document)
+    result = evaluate(State.from_stats(STATS[key]), document, now, key)
+    settle(key, result, now)
+    HEARTBEATS.arm(key, result, now, get_config().error_interval)
+
+
+def retire_task(key):
+    # A pushed task that stopped for good, its deadline and state are dropped
+    HEARTBEATS.forget(key)
+    forget_url(key)
+
+
+def heartbeat_missed(key):
+    # No heartbeat before the deadline, the last document is now stale
+    document = HEARTBEATS.documents.get(key)
+    if document is None or key not in STATS:
+        return
+    now = get_now()
+    result = evaluate(State.from_stats(STATS[key]), document, now, key)
+    settle(key, result, now)
+    HEARTBEATS.arm(key, result, now, get_config().error_interval)
+
+
+def add_ingest_routes(app):
+    from flask import jsonify, request
+
+    @app.route('/ingest', methods=['POST'])
+    def ingest_heartbeats():
+        # A status document, or an array of them, pushed by tasks
+        if not HEARTBEATS.authorized(request.headers.get('Authorization')):
+            return jsonify({'error': 'Invalid token'}), 401
+        try:
+            heartbeats = parse_heartbeats(request.get_data(), HEARTBEATS.max_batch)
+        except IngestError as e:
+            return jsonify({'error': str(e)}), 400
+        now = get_now()
+        for key, document in heartbeats:
+            ingest(key, document, now)
+        tasks = [key for key, _ in heartbeats]
+        return jsonify({'data': {'accepted': len(tasks), 'tasks': tasks}})
+
+    @app.route('/ingest/<path:task>', methods=['DELETE'])
+    def retire_heartbeats(task):
+        if not HEARTBEATS.authorized(request.headers.get('Authorization')):
+            return jsonify({'error': 'Invalid token'}), 401
+        key = PUSH_PREFIX + task
+        if key not in STATS and key not in HEARTBEATS.documents:
+            return jsonify({'error': 'Unknown task {}'.format(task)}), 404
+        retire_task(key)
+        return jsonify({'data': {'retired': key}})
+
+    @app.route('/ingest/stats')
+    def ingest_stats():
+        return jsonify({'data': HEARTBEATS.stats()})
+
+
+def add_debug_routes(app):
+    from flask import Response, jsonify, request
+
+    @app.route('/debug/timings')
+    def debug_timings():
+        # Time per stage of the checks, ?url= for a single url
+        url = request.args.get('url')
+        return jsonify({'data': TIMINGS.stats(url)})
+
+    @app.route('/debug/hub')
+    def debug_hub():
+        if HUB_MONITOR is None:
+            return jsonify({'error': 'Set max_blocking_ms in [profiling]'}), 404
+        return jsonify({'data': HUB_MONITOR.stats()})
+
+    @app.route('/debug/logging')
+    def debug_logging():
+        # Lines waiting for the writer, and the ones dropped or rate limited
+        return jsonify({'data': utils.LOG_PIPELINE.stats()})
+
+    @app.route('/debug/profile')
+    def debug_profile():
+        # Samples the stacks of the event loop for ?seconds=, as collapsed
+        # stacks that flame graph tools read
+        if not get_config().profile:
+            return jsonify({'error': 'Set profile=true in [profiling]'}), 404
+        seconds = request.args.get('seconds', 10, type=float)
+        if not 0 < seconds <= MAX_PROFILE_SECONDS:
+            message = 'seconds must be between 0 and {}'.format(MAX_PROFILE_SECONDS)
+            return jsonify({'error': message}), 400
+        stacks = profile(seconds)
+        if stacks is None:
+            return jsonify({'error': 'A profile is already running'}), 409
+        return Response(stacks, mimetype='text/plain')
+
+
+def startup_message(urls, debug):
+    # A message with thousands of urls helps nobody, list the first few
+    listed = list(urls[:MESSAGE_URLS])
+    if len(urls) > MESSAGE_URLS:
+        listed.append('... and {} more'.format(len(urls) - MESSAGE_URLS))
+    return '{}\n Monitoring: {}\n'.format('\n'.join(listed), debug)
+
+
+def add_check_routes(app, scheduler):
+    from flask import Response, jsonify, request
+
+    @app.route('/task/<path:url>/history')
+    def history_by_url(url):
+        # ?start=&end= limit the samples to a range of epoch seconds
+        history = HISTORY.get(url)
+        if history is None:
+            return jsonify({'data': {}}), 404
+        # With type=float a bad value is silently dropped, parsed here instead
+        start = request.args.get('start') or None
+        end = request.args.get('end') or None
+        try:
+            start = float(start) if start is not None else None
+            end = float(end) if end is not None else None
+        except ValueError:
+            return jsonify({'error': 'start and end must be epoch seconds'}), 400
+        data = {
+            'summary': history.summary(start, end),
+            'samples': list(history.samples(start, end)),
+        }
+        return jsonify({'data': data})
+
+    @app.route('/pools')
+    def pool_stats():
+        # Keep-alive connection pool usage per host
+        return jsonify({'data': http_client.get_client().stats()})
+
+    @app.route('/hosts')
+    def host_stats():
+        # Circuit breaker state per host and DNS cache hits
+        return jsonify({'data': {'breakers': BREAKERS.stats(), 'dns': DNS.stats()}})
+
+    @app.route('/notifications')
+    def notification_stats():
+        # Queue depth, drops, failures and delivery latency per channel
+        return jsonify({'data': utils.DISPATCHER.stats()})
+
+    @app.route('/metrics')
+    def prometheus_metrics():
+        return Response(METRICS.render(STATS), mimetype=METRICS_CONTENT_TYPE)
+
+    @app.route('/alerts')
+    def alert_stats():
+        return jsonify({'data': ALERTS.stats()})
+
+    @app.route('/scheduler')
+    def scheduler_stats():
+        # Queue depth and scheduling lag show when checks fall behind
+        data = scheduler.stats()
+        data['polling'] = POLLING.stats()
+        return jsonify({'data': data})
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Monitor task status endpoints')
+    # Set by the supervisor when it starts a worker process
+    parser.add_argument('--shard', help=argparse.SUPPRESS)
+    parser.add_argument('--report-fd', type=int, help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def supervise(config, urls):
+    # Worker processes run the checks, this process only serves their stats
+    global EVENTS
+    log.info(
+        '---- Monitoring {} URLs with {} workers ----'.format(len(urls), config.workers)
+    )
+    setup_sentry()
+    setup_notifications()
+
+    EVENTS = setup_events()
+    supervisor = setup_supervisor(
+        [sys.executable, os.path.realpath(__file__)],
+        STATS,
+        stats_changed,
+        EVENTS.publish,
+    )
+    supervisor.start(urls)
+    SETTINGS_CACHE.on_reload(lambda old, new: supervisor.set_urls(node_urls(new)))
+
+    send_messages(startup_message(urls, config['main']['debug']))
+
+    from flask import jsonify
+
+    app = make_app()
+    add_stats_routes(app)
+    add_debug_routes(app)
+
+    @app.route('/shards')
+    def shard_stats():
+        return jsonify({'data': supervisor.stats()})
+
+    make_flask_thread(app)
+
+    gevent.signal(signal.SIGTERM, sigterm_handler, [supervisor])
+    gevent.signal(signal.SIGHUP, sighup_handler)
+
+    log.info('Terminate me by kill -TERM {}'.format(os.getpid()))
+
+    gevent.wait()
+
+    message = 'Monitoring service shutting down! C-ya later!'
+    send_messages(message)
+    utils.DISPATCHER.close(timeout=30)
+
+    log.info('---- Exiting Pinger ----')
 
 
 def main():
-    global SENTRY_CLIENT
+    global SENTRY_CLIENT, ALERTS, STORE, REPORTER, EVENTS, HEARTBEATS, HUB_MONITOR
+    args = parse_args()
+    if args.shard is not None:
+        utils.use_shard_log(args.shard)
     log.info('---- Starting Pinger ----')
     # Read in settings
     try:
-        settings = get_settings()
+        config = get_config()
     except Exception as e:
         log.error('Could not read settings! {}'.format(e))
+    settings = config.sections
 
     # Set basic variables
-    DEBUG = debug_mode()
-
-    # Get URLs to monitor depending on if we are in DEBUG mode or not
-    if DEBUG:
-        urls = settings['urls']['dev'].split(',')
-    else:
-        urls = settings['urls']['prod'].split(',')
+    DEBUG = config.debug
+    # Stage timings and the event loop monitor, in every process
+    HUB_MONITOR = setup_profiling(config)
+    # Circuit breakers and the DNS cache of the hosts
+    setup_hosts(config)
+
+    # Get URLs to monitor depending on if we are in DEBUG mode or not, and
+    # on which host when they are shared between several
+    urls = node_urls(config)
+    if args.shard is not None:
+        # A worker process, the supervisor hands out the urls
+        log.info('---- Starting shard {} ----'.format(args.shard))
+        urls = []
+    elif config.workers > 1:
+        return supervise(config, urls)
     log.info('---- Monitoring {} URLs ----'.format(len(urls)))
 
     # Setup external alerting configurations
@@ -295,76 +805,106 @@ def main():
     # Setup Sentry Monitoring
     setup_sentry()
 
-    log.info('---- DEBUGGING {} ----'.format(DEBUG))
+    # Deliver notifications in the background so slow services never hold
+    # up the checks
+    setup_notifications()
 
-    message = '{}\n Monitoring: {}\n'.format('\n'.join(urls), settings['main']['debug'])
-    send_messages(message)
-
-    # Start a small Flask webserver to gather results of the checks
-    app = Flask(__name__)
+    # The greenlets that SIGTERM stops before the final snapshot
+    workers = []
 
-    def make_flask_thread():
-        def on_exception():
-            log.error('---- Flask service crashed! ----')
-            # Sleep, maybe the problem will be resolved in 60 seconds?!
-            sleep(60)
-            log.info('---- Restarting Flask service! ----')
-            make_flask_thread()
+    # Only state changes, escalations and reminders turn into messages
+    ALERTS = setup_alerts(send_messages)
+    ALERTS.on_alert(publish_alert)
+    workers.append(gevent.spawn(ALERTS.run))
+    if args.shard is None:
+        EVENTS = setup_events()
+        # Tasks that push their status instead of being polled
+        HEARTBEATS = setup_ingest(heartbeat_missed)
+        workers.append(gevent.spawn(HEARTBEATS.run))
+
+    # Pick up the stats, sleep windows and alert state of the last run
+    STORE = setup_state_store()
+    if STORE is not None:
+        if HEARTBEATS is not None:
+            STORE.heartbeats = HEARTBEATS.documents
+        if args.shard is None:
+            restore_state(urls)
+        gevent.spawn(STORE.run, STATS, ALERTS)
 
-        log.info('---- Attempting to start Flask service! ----')
-        webapp = gevent.spawn(app.run, host='0.0.0.0', port=3002, debug=False)
-        webapp.link_exception(on_exception)
-        return webapp
+    log.info('---- DEBUGGING {} ----'.format(DEBUG))
 
-    @app.route('/')
-    def service_stats():
-        tasks = []
-        for key, value in STATS.items():
-            d = {'url': key}
-            for k, v in value.items():
-                d[k] = v
-            tasks.append(d)
-        return jsonify({'data': tasks})
+    if args.shard is None:
+        send_messages(startup_message(urls, settings['main']['debug']))
 
-    @app.route('/task/<path:url>')
-    def stats_by_url(url):
-        data = {}
-        status = 200
-        if STATS.get(url):
-            data = STATS[url]
-            if STATS[url].get('status') and STATS[url].get('status') == 'error':
-                status = 500
-        else:
-            status = 404
-        return jsonify({'data': data}), status
-
-    make_flask_thread()
-
-    # Make the pinger threads
-    workers = []
+    HISTORY.capacity = config.history_size
 
-    # This will allow these greenlets to re-spawn themselves forever!
-    def make_thread(key, args):
-        def on_exception(thread):
-            log.error('Greenlet went BOOM!')
-            # Sleep, maybe the problem will be resolved in 60 seconds?!
-            sleep(60)
-            make_thread(key, args)
+    # A single scheduler runs the checks for all urls, spread out over the
+    # interval and limited to a number of checks in flight
+    scheduler = Scheduler(
+        check,
+        max_in_flight=config.max_in_flight,
+        max_per_host=config.max_in_flight_per_host,
+    )
+    scheduler.add_all(urls, config.interval)
 
-        thread = gevent.spawn(worker, args)
-        thread.link_exception(on_exception)
-        return thread
+    def on_settings_reload(old, new):
+        monitor(scheduler, node_urls(new), new.interval)
 
-    workers = [make_thread(worker, u) for u in urls]
+    def on_assignment(assigned, forget):
+        # Urls taken over from another shard continue from the stored state
+        if STORE is not None:
+            restore_state(
+                [u for u in assigned if u not in scheduler.active], forget_others=False
+            )
+            for u in forget:
+                STORE.forget(u)
+        monitor(scheduler, assigned, get_config().interval, forget_stored=False)
+
+    def worker_status():
+        # Shown per worker on the /shards of the supervisor
+        status = scheduler.stats()
+        if TIMINGS.enabled:
+            status['timings'] = TIMINGS.stats()['stages']
+        return status
+
+    if args.shard is None:
+        SETTINGS_CACHE.on_reload(on_settings_reload)
+    else:
+        REPORTER = setup_reporter(args.report_fd, STATS, worker_status)
+        workers.append(gevent.spawn(REPORTER.run))
+        stdin = FileObject(sys.stdin.fileno(), 'rb', close=False)
+        assignments = gevent.spawn(read_assignments, stdin, on_assignment)
+        workers.append(assignments)
+
+    if args.shard is None:
+        # Start a small Flask webserver to gather results of the checks
+        app = make_app()
+        add_stats_routes(app)
+        add_ingest_routes(app)
+        add_debug_routes(app)
+        add_check_routes(app, scheduler)
+        workers.append(make_flask_thread(app))
+    workers.append(scheduler.start())
 
     gevent.signal(signal.SIGTERM, sigterm_handler, workers)
+    gevent.signal(signal.SIGHUP, sighup_handler)
 
     log.info('Terminate me by kill -TERM {}'.format(os.getpid()))
 
-    gevent.wait()
-
-    message = 'Monitoring service shutting down! C-ya later!'
-    send_messages(message)
+    if args.shard is None:
+        # Returns once SIGTERM has stopped the workers, the notifier and the
+        # state store are still running for the shutdown below
+        gevent.joinall(workers)
+        message = 'Monitoring service shutting down! C-ya later!'
+        send_messages(message)
+    else:
+        # Stop together with the supervisor
+        assignments.join()
+        scheduler.kill()
+    utils.DISPATCHER.close(timeout=30)
+    if STORE is not None:
+        STORE.flush(STATS, ALERTS, threaded=False)
+        STORE.close()
 
     log.info('---- Exiting Pinger ----')
 
@@ -0,0 +1,99 @@
+import datetime
+import random
+
+from evaluator import DEFAULT_FREQUENCY
+
+# Runs less than this far apart are taken as the same run
+SAME_RUN = 1.0
+# Doublings of the backoff, well past any sensible backoff_max
+MAX_DOUBLINGS = 30
+
+
+class PollState(object):
+    __slots__ = ('failures', 'lastrun', 'period', 'next_run', 'deadline')
+
+    def __init__(self):
+        self.failures = 0
+        self.lastrun = None
+        self.period = None
+        self.next_run = None
+        self.deadline = None
+
+
+class PollingPolicy(object):
+    """
+    Decides when a url is checked again in adaptive mode.
+
+    A task that is ok is checked ``margin`` seconds after its next run is
+    due, which is ``lastrun`` plus the shortest time between two runs seen
+    so far, and at the latest plus its ``frequency``. Until a task has been
+    seen running twice it is checked at the normal interval. A late run is
+    looked for again after as long as it is late, until it is stale. A
+    sleeping task is checked when its sleep window ends. Failures back off
+    exponentially from ``backoff_base`` up to ``backoff_max`` seconds, with
+    jitter so that the urls of a failing host do not retry in lockstep.
+    Every delay is kept between ``min_interval`` and ``max_interval``.
+    """
+
+    def __init__(self, random=random.random):
+        self.random = random
+        self.states = {}
+
+    def next_check(self, url, state, result, now, config):
+        # Seconds until the url is checked again. `state` is its evaluated
+        # State, `result` is None when the check got no response.
+        poll = self.states.get(url)
+        if poll is None:
+            poll = self.states[url] = PollState()
+        if state.status == 'error':
+            poll.failures += 1
+            return self.backoff(poll.failures, config)
+        poll.failures = 0
+
+        if state.status == 'sleeping':
+            delay = (state.sleep_end - now).total_seconds() + config.margin
+        else:
+            if result is not None and result.lag is not None:
+                self.observe(poll, result.document, now, result.lag)
+            if poll.next_run is None:
+                # Nothing to go on yet
+                return self.bound(config.interval, config)
+            delay = (poll.next_run - now).total_seconds() + config.margin
+            if poll.period is None:
+                # Learn how often the task runs
+                delay = min(delay, config.interval)
+            elif delay < config.margin:
+                # The run is late, look again after as long as it is late
+                late = (now - poll.next_run).total_seconds()
+                stale = (poll.deadline - now).total_seconds() + config.margin
+                delay = min(late, stale)
+        return self.bound(delay, config)
+
+    def observe(self, poll, document, now, lag):
+        lastrun = now - datetime.timedelta(seconds=lag)
+        if poll.lastrun is not None:
+            gap = (lastrun - poll.lastrun).total_seconds()
+            if gap > SAME_RUN and (poll.period is None or gap < poll.period):
+                poll.period = gap
+        poll.lastrun = lastrun
+        frequency = document.get('frequency', DEFAULT_FREQUENCY) * 60
+        poll.deadline = lastrun + datetime.timedelta(seconds=frequency)
+        poll.next_run = poll.deadline
+        if poll.period is not None and poll.period < frequency:
+            poll.next_run = lastrun + datetime.timedelta(seconds=poll.period)
+
+    def backoff(self, failures, config):
+        # Equal jitter, between half and all of the exponential delay
+        doublings = min(failures - 1, MAX_DOUBLINGS)
+        delay = min(config.backoff_max, config.backoff_base * 2**doublings)
+        return self.bound(delay / 2 * (1 + self.random()), config)
+
+    def bound(self, delay, config):
+        return min(max(delay, config.min_interval), config.max_interval)
+
+    def forget(self, url):
+        self.states.pop(url, None)
+
+    def stats(self):
+        failing = sum(1 for poll in self.states.values() if poll.failures)
+        return {'urls': len(self.states), 'backing_off': failing}
@@ -0,0 +1,305 @@
+import logging
+import os
+import sys
+import warnings
+from collections import Counter, deque
+from time import monotonic, perf_counter, time
+
+import gevent
+import gevent.events
+from gevent.monkey import get_original
+
+from metrics import LATENCY_BUCKETS, Histogram
+
+# The stages of a check, in the order they happen
+STAGES = (
+    'pool',
+    'dns',
+    'connect',
+    'tls',
+    'first_byte',
+    'read',
+    'error',
+    'decode',
+    'evaluate',
+    'notify',
+    'record',
+)
+# Most stages take well under the smallest latency bucket of a check
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025) + LATENCY_BUCKETS
+LAG_INTERVAL = 1.0
+MAX_REPORTS = 20
+SAMPLE_INTERVAL = 0.005
+MAX_PROFILE_SECONDS = 60
+
+log = logging.getLogger('pinger')
+
+# The real thread, sleep and thread ident even after monkey patching
+get_ident = get_original('_thread', 'get_ident')
+real_sleep = get_original('time', 'sleep')
+MAIN_THREAD = get_ident()
+# Only one profile runs at a time, each one holds a thread of the hub's pool
+PROFILING = False
+
+
+class Stopwatch(object):
+    """
+    Seconds spent in each stage of one check. ``lap(stage)`` adds the time
+    since the previous lap to ``stage``.
+    """
+
+    __slots__ = ('last', 'laps')
+
+    def __init__(self):
+        self.last = perf_counter()
+        self.laps = {}
+
+    def lap(self, stage):
+        now = perf_counter()
+        self.laps[stage] = self.laps.get(stage, 0.0) + now - self.last
+        self.last = now
+
+
+class NullStopwatch(object):
+    # Handed out while the timings are off, laps cost a method call
+    __slots__ = ()
+    laps = {}
+
+    def lap(self, stage):
+        pass
+
+
+NO_WATCH = NullStopwatch()
+
+
+def quantile(histogram, q):
+    # The upper bound of the bucket that holds the quantile
+    rank = q * histogram.count
+    for bound, running in zip(histogram.bounds, histogram.cumulative()):
+        if running >= rank:
+            return bound
+    return None
+
+
+def ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+class StageTimings(object):
+    """
+    Time spent per stage of the checks, for every url and for all of them.
+    Per url only the count, total and maximum are kept, the global numbers
+    also have a latency histogram per stage.
+    """
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.checks = 0
+        self.stages = {}
+        self.urls = {}
+
+    def stopwatch(self):
+        return Stopwatch() if self.enabled else NO_WATCH
+
+    def record(self, url, watch):
+        if not watch.laps:
+            return
+        self.checks += 1
+        per_url = self.urls.get(url)
+        if per_url is None:
+            per_url = self.urls[url] = {}
+        for stage, seconds in watch.laps.items():
+            totals = self.stages.get(stage)
+            if totals is None:
+                totals = self.stages[stage] = [Histogram(BUCKETS), 0.0]
+            totals[0].observe(seconds)
+            totals[1] = max(totals[1], seconds)
+            numbers = per_url.get(stage)
+            if numbers is None:
+                per_url[stage] = [1, seconds, seconds]
+            else:
+                numbers[0] += 1
+                numbers[1] += seconds
+                numbers[2] = max(numbers[2], seconds)
+
+    def forget(self, url):
+        self.urls.pop(url, None)
+
+    def stats(self, url=None):
+        # Milliseconds, stages in check order
+        order = sorted(
+            self.stages, key=lambda s: STAGES.index(s) if s in STAGES else len(STAGES)
+        )
+        if url is not None:
+            per_url = self.urls.get(url, {})
+            return {
+                stage: {
+                    'count': per_url[stage][0],
+                    'mean_ms': ms(per_url[stage][1] / per_url[stage][0]),
+                    'max_ms': ms(per_url[stage][2]),
+                }
+                for stage in order
+                if stage in per_url
+            }
+        stages = {}
+        for stage in order:
+            histogram, longest = self.stages[stage]
+            p50, p99 = quantile(histogram, 0.5), quantile(histogram, 0.99)
+            stages[stage] = {
+                'count': histogram.count,
+                'total_s': round(histogram.total, 3),
+                'mean_ms': ms(histogram.total / histogram.count),
+                'p50_ms': ms(p50) if p50 is not None else None,
+                'p99_ms': ms(p99) if p99 is not None else None,
+                'max_ms': ms(longest),
+            }
+        return {'enabled': self.enabled, 'checks': self.checks, 'stages': stages}
+
+
+TIMINGS = StageTimings()
+
+
+class HubMonitor(object):
+    """
+    Event loop latency and the greenlets that block it.
+
+    A greenlet sleeps ``interval`` seconds in a loop, how much later than
+    that it wakes up is the lag. gevent's monitoring thread reports every
+    greenlet that keeps the loop from running for ``threshold`` seconds, once
+    per ``threshold``. Its reports arrive in that thread, they are only
+    queued there and logged with their stack by the greenlet.
+    """
+
+    def __init__(self, threshold, interval=LAG_INTERVAL, keep=MAX_REPORTS):
+        self.threshold = threshold
+        self.interval = interval
+        self.lag = Histogram(BUCKETS)
+        self.max_lag = 0.0
+        self.last_lag = None
+        self.blocked = 0
+        self.pending = deque()
+        self.reports = deque(maxlen=keep)
+
+    def start(self):
+        gevent.config.max_blocking_time = self.threshold
+        gevent.config.print_blocking_reports = False
+        gevent.config.monitor_thread = True
+        gevent.events.subscribers.append(self.on_event)
+        with warnings.catch_warnings():
+            # Memory usage is not monitored, psutil is not needed
+            warnings.simplefilter('ignore')
+            gevent.get_hub().start_periodic_monitoring_thread()
+        return gevent.spawn(self.run)
+
+    def on_event(self, event):
+        # Runs in the monitoring thread, deque appends are thread safe
+        if isinstance(event, gevent.events.EventLoopBlocked):
+            self.pending.append((event.greenlet, event.info))
+
+    def run(self):
+        while True:
+            started = perf_counter()
+            gevent.sleep(self.interval)
+            self.observe(perf_counter() - started - self.interval)
+            # A greenlet is reported once per threshold while it blocks
+            blocked = []
+            while self.pending:
+                greenlet, info = self.pending.popleft()
+                if blocked and blocked[-1][0] is greenlet:
+                    blocked[-1][2] += 1
+                else:
+                    blocked.append([greenlet, info, 1])
+            for greenlet, info, periods in blocked:
+                self.report(greenlet, info, periods)
+
+    def observe(self, lag):
+        lag = max(lag, 0.0)
+        self.last_lag = lag
+        self.max_lag = max(self.max_lag, lag)
+        self.lag.observe(lag)
+
+    def report(self, greenlet, info, periods=1):
+        # Only the stack of the blocking greenlet, not gevent's whole tree
+        lines = [line.strip('\n') for line in info]
+        start = next(
+            (i + 1 for i, line in enumerate(lines) if line.startswith('Blocked Stack')),
+            0,
+        )
+        end = lines.index('Info:') if 'Info:' in lines else len(lines)
+        stack = '\n'.join(lines[start:end])
+        seconds = round(self.threshold * periods, 3)
+        self.blocked += 1
+        self.reports.append(
+            {
+                'time': round(time(), 3),
+                'greenlet': str(greenlet),
+                'seconds': seconds,
+                'stack': stack,
+            }
+        )
+        log.warning(
+            'Event loop blocked for at least {}s by {}\n{}'.format(
+                seconds, greenlet, stack
+            )
+        )
+
+    def stats(self):
+        p50, p99 = quantile(self.lag, 0.5), quantile(self.lag, 0.99)
+        return {
+            'threshold_ms': ms(self.threshold),
+            'lag_ms': {
+                'last': ms(self.last_lag) if self.last_lag is not None else None,
+                'p50': ms(p50) if p50 is not None else None,
+                'p99': ms(p99) if p99 is not None else None,
+                'max': ms(self.max_lag),
+            },
+            'blocked': self.blocked,
+            'reports': list(self.reports),
+        }
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return '{}:{}'.format(os.path.basename(code.co_filename), code.co_name)
+
+
+def sample_stacks(seconds, interval=SAMPLE_INTERVAL, thread=MAIN_THREAD):
+    # Samples the stack of the thread running the event loop, from another
+    # real thread, as {"root;...;leaf": samples}
+    counts = Counter()
+    deadline = monotonic() + seconds
+    while monotonic() < deadline:
+        frame = sys._current_frames().get(thread)
+        names = []
+        while frame is not None:
+            names.append(frame_name(frame))
+            frame = frame.f_back
+        if names:
+            counts[';'.join(reversed(names))] += 1
+        real_sleep(interval)
+    return counts
+
+
+def profile(seconds):
+    # Runs the sampler on a thread of the hub's pool, the calling greenlet
+    # waits without blocking the event loop. None while another profile is
+    # running.
+    global PROFILING
+    if PROFILING:
+        return None
+    PROFILING = True
+    try:
+        counts = gevent.get_hub().threadpool.spawn(sample_stacks, seconds).get()
+    finally:
+        PROFILING = False
+    return ''.join('{} {}\n'.format(stack, n) for stack, n in counts.most_common())
+
+
+def setup_profiling(config):
+    # Everything is off unless turned on in the [profiling] section
+    TIMINGS.enabled = config.timings
+    if not config.max_blocking_ms:
+        return None
+    monitor = HubMonitor(config.max_blocking_ms / 1000.0)
+    monitor.start()
+    return monitor
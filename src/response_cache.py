@@ -0,0 +1,62 @@
+import hashlib
+
+
+class CachedResponse(object):
+    __slots__ = ('etag', 'last_modified', 'digest', 'status')
+
+    def __init__(self, etag, last_modified, digest, status):
+        self.etag = etag
+        self.last_modified = last_modified
+        self.digest = digest
+        self.status = status
+
+
+def body_digest(body):
+    return hashlib.blake2b(body, digest_size=16).digest()
+
+
+class ResponseCache(object):
+    """
+    The last parsed status document per url, so that an unchanged response
+    does not have to be decoded again.
+
+    Servers that send an ETag or Last-Modified get a conditional request and
+    answer 304 when nothing changed. For other servers the body is hashed and
+    compared with the last one.
+    """
+
+    def __init__(self):
+        self.entries = {}
+
+    def headers(self, url):
+        entry = self.entries.get(url)
+        headers = {}
+        if entry is not None:
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+        return headers
+
+    def lookup(self, url, response):
+        # The cached status if the response is unchanged, otherwise None
+        entry = self.entries.get(url)
+        if entry is None:
+            return None
+        if response.status == 304 or entry.digest == body_digest(response.body):
+            return entry.status
+        return None
+
+    def store(self, url, response, status):
+        self.entries[url] = CachedResponse(
+            response.headers.get('ETag'),
+            response.headers.get('Last-Modified'),
+            body_digest(response.body),
+            status,
+        )
+
+    def forget(self, url):
+        self.entries.pop(url, None)
+
+
+RESPONSES = ResponseCache()
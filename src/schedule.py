@@ -0,0 +1,109 @@
+import datetime
+import logging
+import re
+from functools import lru_cache
+
+from pytz import UTC
+
+DAY = 86400
+# Distinct sleep specs kept compiled
+CACHE_SIZE = 4096
+
+TIME_OF_DAY = re.compile(r'^(\d{1,2}):(\d{2})(?::(\d{2}))?$')
+
+log = logging.getLogger('pinger')
+
+
+def parse_timestamp(value):
+    """
+    Parse an ISO-8601 timestamp such as ``2018-06-28T11:37:48Z``. Strings the
+    standard library cannot read go through dateutil. Timestamps without a
+    timezone are taken to be UTC.
+    """
+    if value.endswith(('Z', 'z')):
+        value = value[:-1] + '+00:00'
+    try:
+        parsed = datetime.datetime.fromisoformat(value)
+    except ValueError:
+        # Rarely needed, dateutil is only imported then
+        from dateutil import parser
+
+        parsed = parser.parse(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=UTC)
+    return parsed
+
+
+class SleepSchedule(object):
+    """
+    Compiled sleep windows of a task. ``daily`` holds (seconds after midnight
+    UTC, duration in seconds) of windows that repeat every day, ``once`` holds
+    (start, end) datetimes of windows with a full date.
+    """
+
+    __slots__ = ('daily', 'once')
+
+    def __init__(self, daily=(), once=()):
+        self.daily = tuple(daily)
+        self.once = tuple(once)
+
+    def window_at(self, now):
+        # The (start, end) of the window `now` falls in, or None
+        if self.daily:
+            midnight = now.replace(hour=0, minute=0, second=0, microsecond=0)
+            seconds = (now - midnight).total_seconds()
+            for start, duration in self.daily:
+                # How far we are into the most recent occurrence, which may
+                # have started yesterday
+                offset = (seconds - start) % DAY
+                if offset <= duration:
+                    begin = now - datetime.timedelta(seconds=offset)
+                    return begin, begin + datetime.timedelta(seconds=duration)
+        for start, end in self.once:
+            if start <= now <= end:
+                return start, end
+        return None
+
+    def __bool__(self):
+        return bool(self.daily or self.once)
+
+
+NEVER = SleepSchedule()
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _compile(spec):
+    daily = []
+    once = []
+    for start, duration in spec:
+        if not start or not duration:
+            continue
+        try:
+            duration = float(duration) * 60
+            match = TIME_OF_DAY.match(start.strip())
+            if match:
+                hours, minutes, seconds = match.groups()
+                offset = int(hours) * 3600 + int(minutes) * 60 + int(seconds or 0)
+                if offset >= DAY:
+                    raise ValueError('{} is not a time of day'.format(start))
+                daily.append((offset, duration))
+            else:
+                begin = parse_timestamp(start)
+                once.append((begin, begin + datetime.timedelta(seconds=duration)))
+        except (ValueError, TypeError, OverflowError, AttributeError) as e:
+            log.error('Error parsing sleep time! {!r}: {}'.format(start, e))
+    return SleepSchedule(daily, once) if daily or once else NEVER
+
+
+def compile_sleep(sleep):
+    # `sleep` is the list of {"start", "duration"} objects from the status
+    # document. Compiled schedules are cached on the raw values.
+    if not sleep:
+        return NEVER
+    try:
+        spec = tuple((s.get('start'), s.get('duration')) for s in sleep)
+        hash(spec)
+    except (AttributeError, TypeError):
+        log.error('Error parsing sleep time! {!r}'.format(sleep))
+        return NEVER
+    return _compile(spec)
@@ -0,0 +1,182 @@
+import heapq
+import logging
+import time
+import zlib
+from collections import defaultdict, deque
+from urllib.parse import urlsplit
+
+import gevent
+from gevent.event import Event
+from gevent.pool import Pool
+
+DEFAULT_MAX_IN_FLIGHT = 100
+DEFAULT_MAX_IN_FLIGHT_PER_HOST = 4
+# Delay before retrying a url whose check raised an unexpected exception
+CRASH_DELAY = 60
+# Weight of the newest sample in the average scheduling lag
+LAG_SMOOTHING = 0.1
+
+log = logging.getLogger('pinger')
+
+
+def jitter(url, interval):
+    # A stable offset in [0, interval) so that urls are spread evenly across
+    # the interval and keep the same slot across restarts
+    return zlib.crc32(url.encode('utf-8')) / 2**32 * interval
+
+
+def host_of(url):
+    return urlsplit(url).netloc
+
+
+class Scheduler(object):
+    """
+    Runs ``check(url)`` for every url on a single timer heap.
+
+    ``check`` returns the number of seconds until the url is due again. At
+    most ``max_in_flight`` checks run at the same time, and at most
+    ``max_per_host`` against a single host. Due checks that cannot start yet
+    wait in line, which shows up as queue depth and scheduling lag.
+    """
+
+    def __init__(
+        self,
+        check,
+        max_in_flight=DEFAULT_MAX_IN_FLIGHT,
+        max_per_host=DEFAULT_MAX_IN_FLIGHT_PER_HOST,
+        clock=time.monotonic,
+    ):
+        self.check = check
+        self.max_per_host = max_per_host
+        self.clock = clock
+        self.pool = Pool(max_in_flight)
+        self.heap = []
+        self.active = {}
+        self.sequence = 0
+        self.host_in_flight = defaultdict(int)
+        self.host_waiting = defaultdict(deque)
+        self.wakeup = Event()
+        self.greenlet = None
+        self.checks = 0
+        self.crashes = 0
+        self.lag_last = 0.0
+        self.lag_avg = 0.0
+        self.lag_max = 0.0
+
+    def add(self, url, interval):
+        # New urls start at their jitter offset within the first interval
+        if url in self.active:
+            return
+        self.sequence += 1
+        self.active[url] = self.sequence
+        self.push(self.clock() + jitter(url, interval), url)
+
+    def add_all(self, urls, interval):
+        # Like add() for every url, with one heapify instead of a push each
+        now = self.clock()
+        for url in urls:
+            if url in self.active:
+                continue
+            self.sequence += 1
+            self.active[url] = self.sequence
+            self.heap.append((now + jitter(url, interval), self.sequence, url))
+        heapq.heapify(self.heap)
+        self.wakeup.set()
+
+    def remove(self, url):
+        # Stale heap entries are skipped when they come up
+        self.active.pop(url, None)
+
+    def push(self, due, url):
+        heapq.heappush(self.heap, (due, self.active[url], url))
+        self.wakeup.set()
+
+    def run(self):
+        while True:
+            self.wakeup.clear()
+            now = self.clock()
+            while self.heap and self.heap[0][0] <= now:
+                due, generation, url = heapq.heappop(self.heap)
+                if self.active.get(url) != generation:
+                    continue
+                self.dispatch(url, due, generation)
+                now = self.clock()
+            timeout = self.heap[0][0] - now if self.heap else None
+            self.wakeup.wait(timeout)
+
+    def dispatch(self, url, due, generation):
+        host = host_of(url)
+        if self.host_in_flight[host] >= self.max_per_host:
+            self.host_waiting[host].append((due, generation, url))
+            return
+        self.host_in_flight[host] += 1
+        # Blocks while the pool is full, due checks stay in the heap meanwhile
+        self.pool.spawn(self.run_check, url, due, host)
+
+    def run_check(self, url, due, host):
+        generation = self.active.get(url)
+        started = self.clock()
+        self.record_lag(started - due)
+        try:
+            delay = self.check(url)
+        except Exception as e:
+            self.crashes += 1
+            log.error('Greenlet went BOOM!')
+            log.exception(e)
+            delay = CRASH_DELAY
+        finally:
+            self.checks += 1
+            self.host_in_flight[host] -= 1
+            waiting = self.host_waiting.get(host)
+            while waiting:
+                # Hand the host slot to the next check waiting in line,
+                # skipping urls that were removed (or removed and added
+                # again) while they waited
+                waiting_due, waiting_generation, waiting_url = waiting.popleft()
+                if self.active.get(waiting_url) == waiting_generation:
+                    self.push(waiting_due, waiting_url)
+                    break
+            if not waiting:
+                self.host_waiting.pop(host, None)
+            if not self.host_in_flight[host]:
+                del self.host_in_flight[host]
+
+        if generation is not None and self.active.get(url) == generation:
+            # Keep the url in its slot instead of drifting by the check time,
+            # unless we have fallen so far behind that it is already due
+            self.push(max(due + delay, self.clock()), url)
+
+    def record_lag(self, lag):
+        self.lag_last = lag
+        self.lag_max = max(self.lag_max, lag)
+        self.lag_avg += LAG_SMOOTHING * (lag - self.lag_avg)
+
+    def queue_depth(self):
+        # Checks that are due but have not started yet
+        now = self.clock()
+        overdue = sum(1 for item in self.heap if item[0] <= now)
+        return overdue + sum(len(w) for w in self.host_waiting.values())
+
+    def stats(self):
+        return {
+            'urls': len(self.active),
+            'scheduled': len(self.heap),
+            'queue_depth': self.queue_depth(),
+            'in_flight': len(self.pool),
+            'max_in_flight': self.pool.size,
+            'max_in_flight_per_host': self.max_per_host,
+            'checks': self.checks,
+            'crashes': self.crashes,
+            'lag_last': round(self.lag_last, 3),
+            'lag_avg': round(self.lag_avg, 3),
+            'lag_max': round(self.lag_max, 3),
+        }
+
+    def start(self):
+        self.greenlet = gevent.spawn(self.run)
+        return self.greenlet
+
+    def kill(self):
+        if self.greenlet is not None:
+            self.greenlet.kill()
+        self.pool.kill()
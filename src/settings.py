@@ -0,0 +1,393 @@
+import configparser
+import logging
+import os
+import socket
+import time
+from os import path
+
+DEFAULT_CONFIG = path.join(path.dirname(path.realpath(__file__)), '../pinger.ini')
+
+# How often (in seconds) the config file is stat'ed for changes. Between
+# checks the cached settings are returned without touching the disk.
+CHECK_INTERVAL = 1.0
+
+log = logging.getLogger('pinger')
+
+BOOLEAN_STATES = configparser.ConfigParser.BOOLEAN_STATES
+
+
+class SettingsError(Exception):
+    pass
+
+
+def _as_bool(section, key, default=False):
+    value = section.get(key)
+    if value is None or value == '':
+        return default
+    try:
+        return BOOLEAN_STATES[value.strip().lower()]
+    except KeyError:
+        raise SettingsError('{} must be true or false, got {!r}'.format(key, value))
+
+
+def _as_int(section, key, default, minimum=1):
+    value = section.get(key)
+    if value is None or value == '':
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        raise SettingsError('{} must be an integer, got {!r}'.format(key, value))
+    if value < minimum:
+        raise SettingsError(
+            '{} must be at least {}, got {}'.format(key, minimum, value)
+        )
+    return value
+
+
+def _as_float(section, key, default, minimum=0):
+    value = section.get(key)
+    if value is None or value == '':
+        return default
+    try:
+        value = float(value)
+    except ValueError:
+        raise SettingsError('{} must be a number, got {!r}'.format(key, value))
+    if value < minimum:
+        raise SettingsError(
+            '{} must be at least {}, got {}'.format(key, minimum, value)
+        )
+    return value
+
+
+def _as_list(value):
+    return [v.strip() for v in (value or '').split(',') if v.strip()]
+
+
+def _mtime(file_name):
+    try:
+        return os.stat(file_name).st_mtime
+    except OSError:
+        return None
+
+
+def read_urls(file_name):
+    # One url per line, blank lines and # comments are skipped. Read line by
+    # line, a list of many thousand urls is never held as one string.
+    try:
+        with open(file_name) as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    yield line
+    except OSError as e:
+        raise SettingsError('Could not read urls from {}: {}'.format(file_name, e))
+
+
+class Settings(object):
+    """
+    Parsed and validated contents of pinger.ini.
+
+    The raw sections are kept so that the existing ``settings['slack']['url']``
+    style lookups keep working, the commonly used values are exposed as
+    converted attributes.
+    """
+
+    def __init__(self, sections, config_file=None, mtime=None):
+        # The defaults live with the code using them. Imported here, those
+        # modules import this one.
+        import alerts
+        import auth
+        import events
+        import http_client
+        import ingest
+        import logs
+        import notifier
+        import sharding
+        import state_store
+
+        self.sections = sections
+        self.config_file = config_file
+        self.mtime = mtime
+
+        main = sections.get('main', {})
+        self.debug = _as_bool(main, 'debug')
+        self.only_log = _as_bool(main, 'only_log')
+        self.interval = _as_int(main, 'interval', 60)
+        self.error_interval = _as_int(main, 'error_interval', 480)
+        self.max_in_flight = _as_int(main, 'max_in_flight', 100)
+        self.max_in_flight_per_host = _as_int(main, 'max_in_flight_per_host', 4)
+        self.history_size = _as_int(main, 'history_size', 1000)
+
+        # Adaptive mode checks each url on the schedule of its task
+        polling = sections.get('polling', {})
+        self.adaptive = _as_bool(polling, 'adaptive')
+        self.min_interval = _as_int(polling, 'min_interval', 10)
+        self.max_interval = _as_int(polling, 'max_interval', 3600)
+        self.margin = _as_int(polling, 'margin', 30, minimum=0)
+        self.backoff_base = _as_int(polling, 'backoff_base', 30)
+        self.backoff_max = _as_int(polling, 'backoff_max', self.error_interval)
+        if self.min_interval > self.max_interval:
+            raise SettingsError(
+                'min_interval {} is above max_interval {}'.format(
+                    self.min_interval, self.max_interval
+                )
+            )
+
+        # Instrumentation that is off unless asked for
+        profiling = sections.get('profiling', {})
+        self.timings = _as_bool(profiling, 'timings')
+        self.max_blocking_ms = _as_int(profiling, 'max_blocking_ms', 0, minimum=0)
+        self.profile = _as_bool(profiling, 'profile')
+
+        # Health and name resolution per host, shared by all of its urls
+        hosts = sections.get('hosts', {})
+        self.host_failures = _as_int(hosts, 'failures', 5, minimum=0)
+        self.host_retry = _as_int(hosts, 'retry', 30)
+        self.dns_ttl = _as_int(hosts, 'dns_ttl', 60, minimum=0)
+
+        # Urls listed in the ini, and in url files for long lists
+        urls = sections.get('urls', {})
+        self.url_files = {}
+        self.prod_urls = _as_list(urls.get('prod'))
+        self.prod_urls.extend(self.read_url_file(urls.get('prod_file')))
+        self.dev_urls = _as_list(urls.get('dev'))
+        self.dev_urls.extend(self.read_url_file(urls.get('dev_file')))
+
+        # Worker processes on this host, and the hosts sharing the urls
+        shard = sections.get('shard', {})
+        self.workers = _as_int(shard, 'workers', 1)
+        self.nodes = _as_list(shard.get('nodes'))
+        self.node = shard.get('node') or socket.gethostname()
+        if self.nodes and self.node not in self.nodes:
+            raise SettingsError(
+                'node {!r} is not one of the nodes {}'.format(self.node, self.nodes)
+            )
+        self.heartbeat_timeout = _as_float(
+            shard, 'heartbeat_timeout', sharding.DEFAULT_HEARTBEAT_TIMEOUT
+        )
+        self.restart_delay = _as_float(
+            shard, 'restart_delay', sharding.DEFAULT_RESTART_DELAY
+        )
+        self.report_interval = _as_float(
+            shard, 'report_interval', sharding.REPORT_INTERVAL
+        )
+
+        # Delivery of notifications, combined into digests per channel
+        notify = sections.get('notify', {})
+        self.notify_window = _as_float(notify, 'window', notifier.DEFAULT_WINDOW)
+        self.notify_queue_size = _as_int(
+            notify, 'queue_size', notifier.DEFAULT_QUEUE_SIZE
+        )
+        self.notify_max_batch = _as_int(notify, 'max_batch', notifier.DEFAULT_MAX_BATCH)
+        self.notify_retries = _as_int(
+            notify, 'retries', notifier.DEFAULT_RETRIES, minimum=0
+        )
+        self.notify_backoff = _as_float(notify, 'backoff', notifier.DEFAULT_BACKOFF)
+
+        # Escalation, reminders and the alert budget
+        alerts_section = sections.get('alerts', {})
+        self.escalate_after = _as_int(
+            alerts_section, 'escalate_after', alerts.DEFAULT_ESCALATE_AFTER
+        )
+        self.reminder = _as_float(alerts_section, 'reminder', alerts.DEFAULT_REMINDER)
+        self.reminder_factor = _as_float(
+            alerts_section, 'reminder_factor', alerts.DEFAULT_REMINDER_FACTOR, minimum=1
+        )
+        self.reminder_max = _as_float(
+            alerts_section, 'reminder_max', alerts.DEFAULT_REMINDER_MAX
+        )
+        self.alerts_per_minute = _as_int(
+            alerts_section, 'per_minute', alerts.DEFAULT_PER_MINUTE
+        )
+
+        # The stream of events at /events
+        events_section = sections.get('events', {})
+        self.event_buffer_size = _as_int(
+            events_section, 'buffer_size', events.DEFAULT_BUFFER_SIZE
+        )
+        self.event_client_queue = _as_int(
+            events_section, 'client_queue', events.DEFAULT_CLIENT_QUEUE
+        )
+        self.event_keepalive = _as_float(
+            events_section, 'keepalive', events.DEFAULT_KEEPALIVE
+        )
+
+        # Heartbeats pushed to /ingest
+        ingest_section = sections.get('ingest', {})
+        self.ingest_grace = _as_float(ingest_section, 'grace', ingest.DEFAULT_GRACE)
+        self.ingest_max_batch = _as_int(
+            ingest_section, 'max_batch', ingest.DEFAULT_MAX_BATCH
+        )
+        self.ingest_token = ingest_section.get('token') or None
+
+        # Persistence is on by default, an empty path turns it off
+        state = sections.get('state', {})
+        self.state_path = state.get('path', state_store.DEFAULT_PATH)
+        self.state_interval = _as_float(state, 'interval', state_store.DEFAULT_INTERVAL)
+
+        # The http client shared by the checks and the notifiers
+        http = sections.get('http', {})
+        self.max_connections_per_host = _as_int(
+            http, 'max_connections_per_host', http_client.DEFAULT_MAX_PER_HOST
+        )
+        self.connect_timeout = _as_float(
+            http, 'connect_timeout', http_client.DEFAULT_CONNECT_TIMEOUT
+        )
+        self.read_timeout = _as_float(
+            http, 'read_timeout', http_client.DEFAULT_READ_TIMEOUT
+        )
+        self.total_timeout = _as_float(
+            http, 'total_timeout', http_client.DEFAULT_TOTAL_TIMEOUT
+        )
+        self.max_body_size = _as_int(
+            http, 'max_body_size', http_client.DEFAULT_MAX_BODY_SIZE
+        )
+        self.content_types = (
+            tuple(value.lower() for value in _as_list(http.get('content_types')))
+            or http_client.DEFAULT_CONTENT_TYPES
+        )
+
+        # The log file and the pipeline in front of it
+        logging_section = sections.get('logging', {})
+        self.log_path = logging_section.get('path') or logs.DEFAULT_PATH
+        self.log_max_bytes = _as_int(
+            logging_section, 'max_bytes', logs.DEFAULT_MAX_BYTES, minimum=0
+        )
+        self.log_backup_count = _as_int(
+            logging_section, 'backup_count', logs.DEFAULT_BACKUP_COUNT, minimum=0
+        )
+        self.log_when = logging_section.get('when') or None
+        self.log_buffer_size = _as_int(
+            logging_section, 'buffer_size', logs.DEFAULT_BUFFER_SIZE
+        )
+        self.log_rate_limit = _as_int(
+            logging_section, 'rate_limit', logs.DEFAULT_RATE_LIMIT, minimum=0
+        )
+        self.log_rate_period = _as_float(
+            logging_section, 'rate_period', logs.DEFAULT_RATE_PERIOD
+        )
+        self.log_format = logging_section.get('format') or 'text'
+        if self.log_format not in ('text', 'json'):
+            raise SettingsError(
+                'format must be text or json, got {!r}'.format(self.log_format)
+            )
+        self.log_level = (logging_section.get('level') or '').upper() or None
+
+        # Reusing a login token for less than the margin would log in on
+        # every check
+        token_auth = sections.get('token_auth', {})
+        self.token_ttl = _as_int(
+            token_auth, 'ttl', None, minimum=auth.EXPIRY_MARGIN + 1
+        )
+
+    def read_url_file(self, file_name):
+        # Relative to the directory of the ini. The mtime is taken before
+        # reading, a change while reading reloads again.
+        if not file_name:
+            return []
+        if self.config_file:
+            file_name = path.join(path.dirname(self.config_file), file_name)
+        self.url_files[file_name] = _mtime(file_name)
+        return read_urls(file_name)
+
+    def mtimes(self):
+        # Of the ini and its url files when they were read
+        return (self.mtime,) + tuple(self.url_files.values())
+
+    def current_mtimes(self):
+        return (_mtime(self.config_file),) + tuple(_mtime(f) for f in self.url_files)
+
+    @property
+    def urls(self):
+        # The dev urls are used when debugging, the same as main() always did
+        return self.dev_urls if self.debug else self.prod_urls
+
+    def get(self, key, default=None):
+        return self.sections.get(key, default)
+
+    def __getitem__(self, key):
+        return self.sections[key]
+
+    def __contains__(self, key):
+        return key in self.sections
+
+
+def parse(config_file):
+    config = configparser.ConfigParser()
+    try:
+        config.read(config_file)
+    except configparser.Error as e:
+        # A duplicate option or a missing section header
+        raise SettingsError('Could not parse {}: {}'.format(config_file, e))
+    return Settings(dict(config._sections), config_file, _mtime(config_file))
+
+
+class SettingsCache(object):
+    """
+    Holds a single Settings instance that is shared by every worker.
+
+    The file is only re-parsed when its mtime, or that of one of its url
+    files, changes (checked at most every ``check_interval`` seconds) or when
+    a reload is forced, e.g. on SIGHUP.
+    """
+
+    def __init__(self, config_file=DEFAULT_CONFIG, check_interval=CHECK_INTERVAL):
+        self.config_file = config_file
+        self.check_interval = check_interval
+        self.settings = None
+        self.last_check = 0
+        self.failed_mtimes = None
+        self.listeners = []
+
+    def on_reload(self, callback):
+        self.listeners.append(callback)
+
+    def get(self):
+        if self.settings is None:
+            self.settings = parse(self.config_file)
+            self.last_check = time.monotonic()
+        elif time.monotonic() - self.last_check >= self.check_interval:
+            self.last_check = time.monotonic()
+            mtimes = self.settings.current_mtimes()
+            if mtimes != self.settings.mtimes() and mtimes != self.failed_mtimes:
+                self.reload()
+        return self.settings
+
+    def reload(self):
+        old = self.settings
+        mtimes = old.current_mtimes() if old is not None else None
+        try:
+            new = parse(self.config_file)
+        except SettingsError as e:
+            # Keep running with the last good settings, the files are read
+            # again once they change
+            self.failed_mtimes = mtimes
+            log.error('Could not reload settings! {}'.format(e))
+            return old
+        self.settings = new
+        self.last_check = time.monotonic()
+        log.info('---- Settings reloaded from {} ----'.format(self.config_file))
+        if old is not None:
+            for callback in self.listeners:
+                try:
+                    callback(old, new)
+                except Exception as e:
+                    log.exception(e)
+        return new
+
+
+CACHE = SettingsCache()
+_FILE_CACHES = {}
+
+
+def get_config(config_file=None):
+    if not config_file:
+        return CACHE.get()
+    if config_file not in _FILE_CACHES:
+        _FILE_CACHES[config_file] = SettingsCache(config_file)
+    return _FILE_CACHES[config_file].get()
+
+
+def sighup_handler():
+    CACHE.reload()
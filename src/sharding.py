@@ -0,0 +1,400 @@
+import bisect
+import datetime
+import hashlib
+import logging
+import os
+import time
+from json import dumps, loads
+
+import gevent
+from gevent import subprocess
+from gevent.fileobject import FileObject
+
+from evaluator import base_url
+from schedule import parse_timestamp
+from settings import get_config
+from url_stats import UrlStats
+
+# Points per node on the hash ring, more points spread the urls more evenly
+DEFAULT_REPLICAS = 100
+REPORT_INTERVAL = 1.0
+DEFAULT_HEARTBEAT_TIMEOUT = 30.0
+DEFAULT_RESTART_DELAY = 5.0
+DATE_KEYS = ('sleep_start', 'sleep_end')
+
+log = logging.getLogger('pinger')
+
+
+def ring_hash(key):
+    digest = hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big')
+
+
+class HashRing(object):
+    """
+    Consistent hashing of urls onto nodes. Every node owns ``replicas`` points
+    on the ring and a url belongs to the node of the first point after its
+    hash, so adding or removing a node only moves the urls of that node.
+    """
+
+    def __init__(self, nodes=(), replicas=DEFAULT_REPLICAS):
+        self.replicas = replicas
+        self.nodes = set()
+        self.points = []
+        self.owners = []
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        if node in self.nodes:
+            return
+        self.nodes.add(node)
+        for i in range(self.replicas):
+            point = ring_hash('{}#{}'.format(node, i))
+            index = bisect.bisect(self.points, point)
+            self.points.insert(index, point)
+            self.owners.insert(index, node)
+
+    def remove(self, node):
+        if node not in self.nodes:
+            return
+        self.nodes.discard(node)
+        kept = [(p, o) for p, o in zip(self.points, self.owners) if o != node]
+        self.points = [p for p, o in kept]
+        self.owners = [o for p, o in kept]
+
+    def node_for(self, key):
+        if not self.points:
+            return None
+        index = bisect.bisect(self.points, ring_hash(key)) % len(self.points)
+        return self.owners[index]
+
+    def assign(self, keys):
+        # {node: [keys]} with an entry for every node, even without keys
+        assignment = {node: [] for node in self.nodes}
+        for key in keys:
+            node = self.node_for(key)
+            if node is not None:
+                assignment[node].append(key)
+        return assignment
+
+
+def node_urls(config):
+    # The share of the urls to monitor on this host when [shard] nodes lists
+    # several hosts, all of them otherwise
+    if not config.nodes:
+        return config.urls
+    ring = HashRing(config.nodes)
+    return [url for url in config.urls if ring.node_for(url) == config.node]
+
+
+def dump_stats(stats):
+    return {
+        key: value.isoformat() if isinstance(value, datetime.datetime) else value
+        for key, value in stats.items()
+    }
+
+
+def load_stats(stats):
+    for key in DATE_KEYS:
+        if stats.get(key):
+            stats[key] = parse_timestamp(stats[key])
+    return stats
+
+
+class Reporter(object):
+    """
+    Worker side of the IPC channel. Every ``interval`` seconds the stats of
+    the urls checked since the last report are written to the supervisor as
+    one JSON line. A line is written even if nothing changed, it doubles as
+    the heartbeat.
+    """
+
+    def __init__(self, fd, stats, status=None, interval=REPORT_INTERVAL):
+        self.stream = FileObject(fd, 'wb')
+        self.stats = stats
+        self.status = status
+        self.interval = interval
+        self.dirty = set()
+        self.events = []
+
+    def mark(self, url):
+        self.dirty.add(url)
+
+    def event(self, name, data):
+        # Sent with the next report, the supervisor publishes it on /events
+        self.events.append((name, data))
+
+    def report(self):
+        dirty, self.dirty = self.dirty, set()
+        message = {
+            'stats': {
+                url: dump_stats(self.stats[url]) for url in dirty if url in self.stats
+            }
+        }
+        removed = [url for url in dirty if url not in self.stats]
+        if removed:
+            message['removed'] = removed
+        if self.events:
+            message['events'], self.events = self.events, []
+        if self.status is not None:
+            message['status'] = self.status()
+        self.stream.write(dumps(message).encode('utf-8') + b'\n')
+        self.stream.flush()
+
+    def run(self):
+        while True:
+            try:
+                self.report()
+            except OSError as e:
+                # The supervisor is gone, the worker stops when its stdin closes
+                log.error('Could not report to the supervisor! {}'.format(e))
+                return
+            gevent.sleep(self.interval)
+
+
+def read_assignments(stream, callback):
+    # Worker side, calls callback(urls, forget) for every assignment from the
+    # supervisor. Returns when the supervisor closes the pipe.
+    for line in stream:
+        try:
+            message = loads(line)
+        except ValueError as e:
+            log.error('Could not read url assignment! {}'.format(e))
+            continue
+        callback(message.get('urls', []), message.get('forget', []))
+
+
+class Shard(object):
+    def __init__(self, name):
+        self.name = name
+        self.process = None
+        self.alive = False
+        self.urls = set()
+        self.restarts = 0
+        self.reports = 0
+        self.last_seen = 0.0
+        self.status = {}
+
+
+class Supervisor(object):
+    """
+    Runs ``workers`` worker processes and splits the urls between them on a
+    HashRing. Each worker gets its urls as JSON lines on stdin and reports
+    its stats back over a pipe, the reports are merged into ``stats``.
+
+    A worker that exits or has not reported for ``heartbeat_timeout`` seconds
+    is killed and its urls go to the other workers. It is started again after
+    ``restart_delay`` seconds and then takes its urls back.
+    """
+
+    def __init__(
+        self,
+        command,
+        workers,
+        stats,
+        heartbeat_timeout=DEFAULT_HEARTBEAT_TIMEOUT,
+        restart_delay=DEFAULT_RESTART_DELAY,
+        changed=None,
+        on_event=None,
+        clock=time.monotonic,
+    ):
+        self.command = command
+        self.url_stats = stats
+        # Called with the url whenever its stats changed
+        self.changed = changed or (lambda url: None)
+        # Called with (name, data) for every event a worker reported
+        self.on_event = on_event or (lambda name, data: None)
+        self.heartbeat_timeout = heartbeat_timeout
+        self.restart_delay = restart_delay
+        self.clock = clock
+        self.shards = {str(n): Shard(str(n)) for n in range(workers)}
+        self.ring = HashRing()
+        self.urls = []
+        self.stopping = False
+        self.watcher = None
+
+    def start(self, urls):
+        self.urls = list(urls)
+        for shard in self.shards.values():
+            self.spawn(shard)
+        self.rebalance()
+        self.watcher = gevent.spawn(self.watch)
+
+    def spawn(self, shard):
+        read, write = os.pipe()
+        try:
+            shard.process = subprocess.Popen(
+                self.command + ['--shard', shard.name, '--report-fd', str(write)],
+                stdin=subprocess.PIPE,
+                pass_fds=(write,),
+            )
+        except OSError as e:
+            os.close(read)
+            log.error('Could not start shard {}! {}'.format(shard.name, e))
+            gevent.spawn_later(self.restart_delay, self.restart, shard)
+            return
+        finally:
+            os.close(write)
+        log.info(
+            '---- Started shard {} (pid {}) ----'.format(shard.name, shard.process.pid)
+        )
+        shard.alive = True
+        shard.urls = set()
+        shard.last_seen = self.clock()
+        self.ring.add(shard.name)
+        gevent.spawn(self.read, shard, shard.process, read)
+
+    def read(self, shard, process, fd):
+        stream = FileObject(fd, 'rb')
+        try:
+            for line in stream:
+                shard.last_seen = self.clock()
+                shard.reports += 1
+                try:
+                    message = loads(line)
+                except ValueError as e:
+                    log.error('Bad report from shard {}! {}'.format(shard.name, e))
+                    continue
+                shard.status = message.get('status', shard.status)
+                for url, stats in message.get('stats', {}).items():
+                    # Late reports of urls that moved to another shard are
+                    # dropped, tasks of aggregate urls go with their url
+                    if base_url(url) in shard.urls:
+                        self.url_stats[url] = UrlStats.from_dict(load_stats(stats))
+                        self.changed(url)
+                for url in message.get('removed', []):
+                    if base_url(url) in shard.urls:
+                        self.url_stats.pop(url, None)
+                        self.changed(url)
+                for name, data in message.get('events', []):
+                    self.on_event(name, data)
+        finally:
+            stream.close()
+        # The pipe closes when the worker exits
+        if shard.process is process:
+            self.died(shard)
+
+    def died(self, shard):
+        if not shard.alive:
+            return
+        shard.alive = False
+        shard.urls = set()
+        self.ring.remove(shard.name)
+        if self.stopping:
+            return
+        # A worker that closed the pipe but kept running is stopped for good
+        self.kill_shard(shard)
+        log.error(
+            '---- Shard {} died with exit code {}, moving its urls ----'.format(
+                shard.name, shard.process.wait()
+            )
+        )
+        self.rebalance()
+        gevent.spawn_later(self.restart_delay, self.restart, shard)
+
+    def restart(self, shard):
+        if self.stopping or shard.alive:
+            return
+        shard.restarts += 1
+        self.spawn(shard)
+        self.rebalance()
+
+    def watch(self):
+        while True:
+            gevent.sleep(1)
+            now = self.clock()
+            for shard in list(self.shards.values()):
+                if shard.alive and now - shard.last_seen > self.heartbeat_timeout:
+                    log.error(
+                        '---- Shard {} stopped reporting, killing it ----'.format(
+                            shard.name
+                        )
+                    )
+                    self.kill_shard(shard)
+
+    def kill_shard(self, shard):
+        # read() notices the closed pipe and moves the urls
+        try:
+            shard.process.kill()
+        except OSError:
+            pass
+
+    def set_urls(self, urls):
+        removed = set(self.urls) - set(urls)
+        self.urls = list(urls)
+        for url in list(self.url_stats):
+            if base_url(url) in removed:
+                self.url_stats.pop(url, None)
+                self.changed(url)
+        self.rebalance(removed)
+
+    def rebalance(self, forget=()):
+        # Only shards whose urls changed get a new assignment, urls that are
+        # no longer monitored at all are forgotten by every shard
+        forget = sorted(forget)
+        for name, urls in self.ring.assign(self.urls).items():
+            shard = self.shards[name]
+            urls = set(urls)
+            if urls == shard.urls and not forget:
+                continue
+            shard.urls = urls
+            self.send(shard, {'urls': sorted(urls), 'forget': forget})
+
+    def send(self, shard, message):
+        try:
+            shard.process.stdin.write(dumps(message).encode('utf-8') + b'\n')
+            shard.process.stdin.flush()
+        except (OSError, ValueError) as e:
+            log.error('Could not send urls to shard {}! {}'.format(shard.name, e))
+            self.kill_shard(shard)
+
+    def stats(self):
+        now = self.clock()
+        return {
+            name: {
+                'pid': shard.process.pid if shard.process else None,
+                'alive': shard.alive,
+                'urls': len(shard.urls),
+                'restarts': shard.restarts,
+                'reports': shard.reports,
+                'last_report': round(now - shard.last_seen, 3),
+                'status': shard.status,
+            }
+            for name, shard in self.shards.items()
+        }
+
+    def kill(self, timeout=10):
+        # Stop the workers, they get SIGTERM and then SIGKILL after timeout
+        self.stopping = True
+        if self.watcher is not None:
+            self.watcher.kill()
+        running = [
+            shard.process
+            for shard in self.shards.values()
+            if shard.process is not None and shard.process.poll() is None
+        ]
+        for process in running:
+            process.terminate()
+        for process in running:
+            try:
+                process.wait(timeout)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+
+def setup_supervisor(command, stats, changed=None, on_event=None):
+    config = get_config()
+    return Supervisor(
+        command,
+        config.workers,
+        stats,
+        changed=changed,
+        on_event=on_event,
+        heartbeat_timeout=config.heartbeat_timeout,
+        restart_delay=config.restart_delay,
+    )
+
+
+def setup_reporter(fd, stats, status=None):
+    return Reporter(fd, stats, status, get_config().report_interval)
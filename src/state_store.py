@@ -0,0 +1,203 @@
+import datetime
+import logging
+import sqlite3
+from json import dumps, loads
+
+import gevent
+
+from pytz import UTC
+
+from settings import get_config
+
+DEFAULT_PATH = 'pinger.db'
+DEFAULT_INTERVAL = 5.0
+
+log = logging.getLogger('pinger')
+
+# One column per STATS key, so restoring needs no parsing beyond the
+# sleep window timestamps
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS state (
+    url TEXT PRIMARY KEY,
+    pings INTEGER NOT NULL,
+    errors INTEGER NOT NULL,
+    status TEXT,
+    sleep_start REAL,
+    sleep_end REAL,
+    server TEXT,
+    process TEXT,
+    cache_hits INTEGER NOT NULL DEFAULT 0,
+    alert TEXT,
+    heartbeat TEXT
+)
+"""
+# Columns added after the first version, added to older databases
+MIGRATIONS = (
+    ('cache_hits', 'INTEGER NOT NULL DEFAULT 0'),
+    ('heartbeat', 'TEXT'),
+)
+COLUMNS = (
+    'url, pings, errors, status, sleep_start, sleep_end, server, process, '
+    'cache_hits, alert, heartbeat'
+)
+INSERT = 'INSERT OR REPLACE INTO state ({}) VALUES ({})'.format(
+    COLUMNS, ', '.join('?' * len(COLUMNS.split(', ')))
+)
+
+
+def to_timestamp(value):
+    return None if value is None else value.timestamp()
+
+
+def from_timestamp(value):
+    return None if value is None else datetime.datetime.fromtimestamp(value, UTC)
+
+
+def to_text(value):
+    # Taken from status documents, a list or a dict there would fail the
+    # whole snapshot
+    return value if value is None or isinstance(value, str) else str(value)
+
+
+def encode_stats(url, stats, alert=None, heartbeat=None):
+    return (
+        url,
+        stats['pings'],
+        stats['errors'],
+        stats['status'],
+        to_timestamp(stats['sleep_start']),
+        to_timestamp(stats['sleep_end']),
+        to_text(stats['server']),
+        to_text(stats['process']),
+        stats.get('cache_hits', 0),
+        alert,
+        heartbeat,
+    )
+
+
+def decode_stats(row):
+    return {
+        'pings': row[1],
+        'errors': row[2],
+        'status': row[3],
+        'sleep_start': from_timestamp(row[4]),
+        'sleep_end': from_timestamp(row[5]),
+        'server': row[6],
+        'process': row[7],
+        'cache_hits': row[8],
+        'cache_hit_rate': round(row[8] / float(row[1]), 3) if row[1] else 0.0,
+    }
+
+
+class StateStore(object):
+    """
+    Keeps STATS and the alert state on disk in SQLite, so that a restart
+    carries on where the last process stopped.
+
+    Checks only mark their url as dirty. Every ``interval`` seconds the dirty
+    urls are written in a single transaction from a thread, off the event
+    loop. The database runs in WAL mode, a crash mid-write loses at most the
+    last unfinished snapshot. ``heartbeats`` holds the last document of the
+    pushed tasks, which is saved with their state.
+    """
+
+    def __init__(self, path=DEFAULT_PATH, interval=DEFAULT_INTERVAL):
+        self.path = path
+        self.interval = interval
+        self.dirty = set()
+        self.removed = set()
+        self.writing = False
+        self.snapshots = 0
+        self.heartbeats = {}
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute(SCHEMA)
+        self.migrate()
+
+    def migrate(self):
+        columns = {row[1] for row in self.db.execute('PRAGMA table_info(state)')}
+        for column, definition in MIGRATIONS:
+            if column not in columns:
+                self.db.execute(
+                    'ALTER TABLE state ADD COLUMN {} {}'.format(column, definition)
+                )
+
+    def mark(self, url):
+        self.dirty.add(url)
+
+    def forget(self, url):
+        self.dirty.discard(url)
+        self.removed.add(url)
+
+    def load(self):
+        # Returns {url: (stats, alert)}, alert is a dict or None
+        state = {}
+        for row in self.db.execute('SELECT {} FROM state'.format(COLUMNS)):
+            alert = row[9]
+            state[row[0]] = (decode_stats(row), loads(alert) if alert else None)
+        return state
+
+    def load_heartbeats(self):
+        # Returns {key: document} of the pushed tasks
+        query = 'SELECT url, heartbeat FROM state WHERE heartbeat IS NOT NULL'
+        return {url: loads(heartbeat) for url, heartbeat in self.db.execute(query)}
+
+    def collect(self, stats, alerts):
+        # Serialize the dirty urls on the event loop, this is cheap compared
+        # to the disk write
+        dirty, self.dirty = self.dirty, set()
+        removed, self.removed = self.removed, set()
+        rows = []
+        for url in dirty:
+            if url not in stats:
+                continue
+            alert = alerts.states.get(url) if alerts is not None else None
+            if alert is not None:
+                alert = dumps(alert.to_dict())
+            heartbeat = self.heartbeats.get(url)
+            if heartbeat is not None:
+                heartbeat = dumps(heartbeat)
+            rows.append(encode_stats(url, stats[url], alert, heartbeat))
+        return rows, [(url,) for url in removed]
+
+    def write(self, rows, removed):
+        with self.db:
+            self.db.execute('BEGIN')
+            self.db.executemany(INSERT, rows)
+            self.db.executemany('DELETE FROM state WHERE url = ?', removed)
+        self.snapshots += 1
+
+    def flush(self, stats, alerts, threaded=True):
+        if self.writing or not (self.dirty or self.removed):
+            return
+        rows, removed = self.collect(stats, alerts)
+        self.writing = True
+        try:
+            if threaded:
+                gevent.get_hub().threadpool.apply(self.write, (rows, removed))
+            else:
+                self.write(rows, removed)
+        except Exception as e:
+            # Try these urls again with the next snapshot
+            self.dirty.update(row[0] for row in rows)
+            self.removed.update(url for url, in removed)
+            log.error('Could not save state to {}! {}'.format(self.path, e))
+        finally:
+            self.writing = False
+
+    def run(self, stats, alerts):
+        while True:
+            gevent.sleep(self.interval)
+            self.flush(stats, alerts)
+
+    def close(self):
+        self.db.close()
+
+
+def setup_state_store():
+    # Persistence is on by default, an empty [state] path turns it off
+    config = get_config()
+    if not config.state_path:
+        return None
+    return StateStore(config.state_path, config.state_interval)
@@ -0,0 +1,159 @@
+import base64
+import binascii
+import json
+import time
+from bisect import bisect_left, bisect_right
+from collections import Counter
+
+# Name in the summary for urls that have not been checked yet
+PENDING = 'pending'
+
+
+class CursorError(ValueError):
+    pass
+
+
+def encode_cursor(url):
+    return base64.urlsafe_b64encode(url.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        url = base64.b64decode(cursor.encode('ascii'), altchars=b'-_', validate=True)
+        return url.decode('utf-8')
+    except (binascii.Error, UnicodeError):
+        raise CursorError('Invalid cursor {!r}'.format(cursor))
+
+
+class StatsView(object):
+    """
+    Cached JSON of STATS for the web routes.
+
+    Whatever changes the stats of a url calls ``touch(url)``, which bumps
+    ``version`` and drops the cached JSON of that url only. The full listing
+    is rebuilt from the cached parts at most once per version, so requests
+    between two checks are served from memory. ``version`` also makes the
+    ETag of the responses.
+    """
+
+    def __init__(self, stats, dumps=json.dumps):
+        self.stats = stats
+        self.dumps = dumps
+        # Tells apart the versions of different processes
+        self.epoch = '{:x}'.format(int(time.time()))
+        self.version = 0
+        self.changed = {}
+        self.tasks = {}
+        self.stale = set()
+        self.details = {}
+        self.statuses = {}
+        self.counts = Counter()
+        self.keys = None
+        self.listing = None
+
+    def touch(self, url):
+        # Returns the status the url had before, None for a new url
+        self.version += 1
+        self.tasks.pop(url, None)
+        self.stale.add(url)
+        self.details.pop(url, None)
+        old = self.statuses.pop(url, None)
+        if old is not None:
+            self.counts[old] -= 1
+        stats = self.stats.get(url)
+        if stats is None:
+            self.changed.pop(url, None)
+            self.keys = None
+            return old
+        if old is None:
+            self.keys = None
+        status = stats.get('status') or PENDING
+        self.statuses[url] = status
+        self.counts[status] += 1
+        self.changed[url] = self.version
+        return old
+
+    def etag(self, url=None):
+        # The ETag of the listing, or of a single url
+        version = self.version if url is None else self.changed.get(url, 0)
+        return '{}-{}'.format(self.epoch, version)
+
+    def urls(self):
+        if self.keys is None or len(self.keys) != len(self.stats):
+            self.keys = sorted(self.stats)
+        return self.keys
+
+    def task(self, url):
+        # A url with its stats, as listed by /
+        encoded = self.tasks.get(url)
+        if encoded is None:
+            task = {'url': url}
+            task.update(self.stats[url])
+            encoded = self.tasks[url] = self.dumps(task)
+        return encoded
+
+    def detail(self, url):
+        # The body of /task/<url>, None for unknown urls
+        encoded = self.details.get(url)
+        if encoded is None:
+            if not self.stats.get(url):
+                return None
+            data = dict(self.stats[url])
+            encoded = self.details[url] = self.dumps({'data': data})
+        return encoded
+
+    def select(self, status=None, prefix=None, cursor=None, limit=None):
+        # Urls in order, returns (urls, cursor of the next page or None)
+        urls = self.urls()
+        start = 0
+        if cursor:
+            start = bisect_right(urls, decode_cursor(cursor))
+        if prefix:
+            start = max(start, bisect_left(urls, prefix))
+        page = []
+        for i in range(start, len(urls)):
+            url = urls[i]
+            if prefix and not url.startswith(prefix):
+                break
+            if status and self.stats[url].get('status') != status:
+                continue
+            if limit is not None and len(page) == limit:
+                return page, encode_cursor(page[-1])
+            page.append(url)
+        return page, None
+
+    def render(self, status=None, prefix=None, cursor=None, limit=None):
+        # The body of /, the unfiltered listing is cached per version
+        paginated = limit is not None
+        if not (status or prefix or cursor or paginated):
+            if self.listing is None or self.listing[0] != self.version:
+                self.listing = (self.version, self.join(self.urls()))
+            return self.listing[1]
+        urls, next_cursor = self.select(status, prefix, cursor, limit)
+        return self.join(urls, paginated, next_cursor)
+
+    def join(self, urls, paginated=False, next_cursor=None):
+        # Encode the changed urls, the rest is joined from the cache
+        for url in self.stale:
+            if url in self.stats:
+                self.task(url)
+        self.stale.clear()
+        try:
+            parts = list(map(self.tasks.__getitem__, urls))
+        except KeyError:
+            # A url was added without a touch
+            parts = [self.task(url) for url in urls]
+        end = ']'
+        if paginated:
+            end += ',"next":' + self.dumps(next_cursor)
+        end += '}\n'
+        # A single join, the listing can be megabytes
+        if parts:
+            parts[0] = '{"data":[' + parts[0]
+            parts[-1] += end
+            return ','.join(parts)
+        return '{"data":[' + end
+
+    def summary(self):
+        counts = {status: n for status, n in self.counts.items() if n}
+        return {'total': len(self.stats), 'statuses': counts}
@@ -0,0 +1,98 @@
+import sys
+
+# The keys of the stats of every url, in the order they are listed
+FIELDS = (
+    'pings',
+    'errors',
+    'status',
+    'sleep_start',
+    'sleep_end',
+    'server',
+    'process',
+    'cache_hits',
+    'cache_hit_rate',
+)
+# Only set for aggregate urls, the number of their tasks
+OPTIONAL = ('tasks',)
+KEYS = frozenset(FIELDS + OPTIONAL)
+# Values that repeat across many urls, kept once
+SHARED = ('status', 'server', 'process')
+
+
+def shared(value):
+    # The one copy of a string that many urls have, e.g. the server name
+    return sys.intern(value) if type(value) is str else value
+
+
+class UrlStats(object):
+    """
+    The stats of one url, read and written like the dict they used to be
+    (``stats['status']``) in about a third of its memory. ``tasks`` is only
+    listed when it is set.
+    """
+
+    __slots__ = FIELDS + OPTIONAL
+
+    def __init__(self):
+        self.pings = 0
+        self.errors = 0
+        self.status = ''
+        self.sleep_start = None
+        self.sleep_end = None
+        self.server = None
+        self.process = None
+        self.cache_hits = 0
+        self.cache_hit_rate = 0.0
+        self.tasks = None
+
+    @classmethod
+    def from_dict(cls, data):
+        stats = cls()
+        for key, value in data.items():
+            if key in KEYS:
+                setattr(stats, key, shared(value) if key in SHARED else value)
+        return stats
+
+    def __getitem__(self, key):
+        if key not in KEYS:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key, value):
+        if key not in KEYS:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def get(self, key, default=None):
+        if key not in KEYS:
+            return default
+        value = getattr(self, key)
+        return default if value is None and key in OPTIONAL else value
+
+    def keys(self):
+        if self.tasks is None:
+            return FIELDS
+        return FIELDS + OPTIONAL
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __len__(self):
+        return len(self.keys())
+
+    def items(self):
+        return [(key, getattr(self, key)) for key in self.keys()]
+
+    def to_dict(self):
+        return dict(self.items())
+
+    def __eq__(self, other):
+        if isinstance(other, UrlStats):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    def __repr__(self):
+        return 'UrlStats({!r})'.format(self.to_dict())
@@ -1,37 +1,89 @@
-import configparser
-from os import path
 from json import dumps, loads
 import datetime
 from pytz import UTC
-from urllib.request import urlopen, Request
 import logging
 
+from settings import get_config
+from notifier import Dispatcher
+from logs import LogPipeline, setup_logging
+import http_client
+
 
 SENTRY_CLIENT = None
+DISPATCHER = None
+LOG_PIPELINE = None
 
 
 def get_logger():
+    # The handler is only added once, however often this is called
+    global LOG_PIPELINE
     log = logging.getLogger('pinger')
-    hdlr = logging.FileHandler('pinger.log')
-    formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
-    hdlr.setFormatter(formatter)
-    log.addHandler(hdlr)
-    log.setLevel(logging.DEBUG)
+    pipeline = next((h for h in log.handlers if isinstance(h, LogPipeline)), None)
+    if pipeline is None:
+        config = get_config()
+        pipeline = setup_logging(config)
+        log.addHandler(pipeline)
+        # Debug lines are only written in debug mode, unless a level is set
+        if config.log_level:
+            log.setLevel(config.log_level)
+        else:
+            log.setLevel(logging.DEBUG if config.debug else logging.INFO)
+    LOG_PIPELINE = pipeline
     return log
 
 
+def use_shard_log(shard):
+    # Called by shard workers before they log anything
+    global LOG_PIPELINE
+    log = logging.getLogger('pinger')
+    previous = LOG_PIPELINE
+    LOG_PIPELINE = setup_logging(get_config(), shard)
+    log.addHandler(LOG_PIPELINE)
+    if previous is not None:
+        log.removeHandler(previous)
+        previous.close()
+
+
 log = get_logger()
 
 
 def setup_sentry():
-    from raven import Client
-
+    # raven is only imported when a Sentry url is configured
     global SENTRY_CLIENT
     settings = get_settings()
-    if settings.get('sentry'):
+    if (settings.get('sentry') or {}).get('url'):
+        from raven import Client
+
         SENTRY_CLIENT = Client(settings['sentry']['url'])
 
 
+def setup_notifications():
+    # Deliver messages from background workers instead of inline, one
+    # worker per configured channel
+    global DISPATCHER
+    settings = get_settings()
+    senders = {}
+    if settings.get('slack'):
+        senders['slack'] = lambda message: send_to_slack(message, raise_errors=True)
+    if settings.get('hipchat'):
+        senders['hipchat'] = lambda message: send_to_hipchat(
+            message, raise_errors=True
+        )
+    if SENTRY_CLIENT is not None:
+        senders['sentry'] = send_to_sentry
+    config = get_config()
+    DISPATCHER = Dispatcher(
+        senders,
+        window=config.notify_window,
+        queue_size=config.notify_queue_size,
+        max_batch=config.notify_max_batch,
+        retries=config.notify_retries,
+        backoff=config.notify_backoff,
+    )
+    DISPATCHER.start()
+    return DISPATCHER
+
+
 def only_log():
     settings = get_settings()
     if settings['main']['only_log'] == 'true':
@@ -58,40 +110,48 @@ def sigterm_handler(workers):
 
 
 def send_messages(message):
+    if DISPATCHER is not None:
+        DISPATCHER.publish(message)
+        log.error(message)
+        return
     settings = get_settings()
     if settings.get('slack'):
         send_to_slack(message)
     if settings.get('hipchat'):
         send_to_hipchat(message)
-    if settings.get('sentry'):
+    if SENTRY_CLIENT is not None:
         send_to_sentry(message)
     log.error(message)
 
 
-def send_to_hipchat(message, color='green', meme='(yey)', notify=True):
+def send_to_hipchat(
+    message, color='green', meme='(yey)', notify=True, raise_errors=False
+):
     settings = get_settings()
     HIPCHATAUTH = settings['hipchat']['auth']
     HIPCHATROOM = settings['hipchat']['room']
-    HIPCHATURL = 'https://api.hipchat.com/v2/room/{}/notification?auth_token={}'.format(
-        HIPCHATROOM, HIPCHATAUTH
+    HIPCHATAPI = settings['hipchat'].get('url') or 'https://api.hipchat.com'
+    HIPCHATURL = '{}/v2/room/{}/notification?auth_token={}'.format(
+        HIPCHATAPI, HIPCHATROOM, HIPCHATAUTH
     )
     if not meme:
         meme = settings['hipchat']['emoji']
 
     if only_log():
         try:
-            req = Request(HIPCHATURL)
             data = {
                 "color": color,
                 "message": "{} {}".format(message, meme),
                 "notify": notify,
                 "message_format": "text",
             }
-            data = dumps(data)
-            req.add_header('Content-Type', 'application/json')
-            with urlopen(req, data, timeout=20) as f:
+            data = dumps(data).encode('utf-8')
+            headers = {'Content-Type': 'application/json'}
+            with http_client.request(HIPCHATURL, data, headers, timeout=20) as f:
                 log.info('---- Notified Hipchat! Message {} ----'.format(message))
         except Exception as e:
+            if raise_errors:
+                raise
             log.error('Error sending to Hipchat!')
             log.exception(e)
     else:
@@ -102,7 +162,7 @@ def send_to_hipchat(message, color='green', meme='(yey)', notify=True):
         )
 
 
-def send_to_slack(message, meme=':robot:', send_messages=True):
+def send_to_slack(message, meme=':robot:', send_messages=True, raise_errors=False):
     settings = get_settings()
     SLACKURL = settings['slack']['url']
     SLACKCHANNEL = settings['slack']['channel']
@@ -114,9 +174,8 @@ def send_to_slack(message, meme=':robot:', send_messages=True):
 
     if only_log():
         try:
-            req = Request(SLACKURL)
-            req.add_header('Content-Type', 'application/json; charset=utf-8')
-            req.data = dumps(
+            headers = {'Content-Type': 'application/json; charset=utf-8'}
+            data = dumps(
                 {
                     'token': SLACKTOKEN,
                     'channel': SLACKCHANNEL,
@@ -126,9 +185,15 @@ def send_to_slack(message, meme=':robot:', send_messages=True):
                     'text': message,
                 }
             ).encode('utf-8')
-            with urlopen(req, timeout=20) as f:
+            with http_client.request(SLACKURL, data, headers, timeout=20) as f:
+                # Slack answers errors with a 200 and "ok": false
+                response = loads(f.read() or b'{}')
+                if response.get('ok') is False:
+                    raise IOError('Slack error: {}'.format(response.get('error')))
                 log.info('---- Notified Slack! {} ----'.format(message))
         except Exception as e:
+            if raise_errors:
+                raise
             log.error('Error sending to Slack!')
             log.exception(e)
     else:
@@ -141,13 +206,8 @@ def send_to_sentry(message):
 
 
 def get_settings(config_file=None):
-    config = configparser.ConfigParser()
-    if not config_file:
-        config_path = path.dirname(path.realpath(__file__))
-        config.read(path.join(config_path, '../pinger.ini'))
-    else:
-        config.read(config_file)
-    return dict(config._sections)
+    # Parsed once and cached, see settings.SettingsCache for reloading
+    return get_config(config_file).sections
 
 
 def request_token():
@@ -158,8 +218,7 @@ def request_token():
 
     data = {'email': username, 'password': password}
 
-    req = Request(url, data=dumps(data).encode())
-    req.add_header('Content-Type', 'application/json')
+    headers = {'Content-Type': 'application/json'}
 
-    with urlopen(req) as response:
+    with http_client.request(url, dumps(data).encode(), headers) as response:
         return loads(response.read())['auth_token']
@@ -1,5 +1,16 @@
+import sys
+from os import path
+
 import pytest
-from src import utils
+
+# The pinger modules import each other by name, the same as when running
+# src/pinger.py directly
+sys.path.insert(0, path.join(path.dirname(path.realpath(__file__)), '../src'))
+
+from src import utils  # noqa: E402
+
+# Monkey patches, before any test starts a thread
+import pinger as pinger_module  # noqa: E402
 
 
 @pytest.fixture
@@ -25,3 +36,16 @@ def settings(monkeypatch):
             }
         }
     monkeypatch.setattr(utils, 'get_settings', mock_return)
+
+
+@pytest.fixture
+def pinger(monkeypatch):
+    # The pinger module with alerts that are not sent anywhere, the stats of
+    # the test are forgotten afterwards
+    from alerts import AlertManager
+
+    monkeypatch.setattr(pinger_module, 'ALERTS', AlertManager(lambda message: None))
+    yield pinger_module
+    for url in list(pinger_module.STATS):
+        pinger_module.forget_url(url, forget_stored=False)
+    pinger_module.TASKS.clear()
@@ -0,0 +1,124 @@
+import pytest
+
+from alerts import AlertManager
+
+
+@pytest.fixture
+def clock():
+    now = [6000.0]
+
+    def tick(seconds=0):
+        now[0] += seconds
+        return now[0]
+
+    return tick
+
+
+@pytest.fixture
+def alerts(clock):
+    sent = []
+    manager = AlertManager(
+        sent.append, escalate_after=3, reminder=600, reminder_factor=2, clock=clock
+    )
+    manager.messages = sent
+    return manager
+
+
+def test_alerts_on_state_change_only(alerts, clock):
+    url = 'https://api.example.com/task'
+    alerts.success(url, 'OK again')
+    alerts.failure(url, 'status', 'boom', 'Error: boom')
+    clock(60)
+    alerts.failure(url, 'status', 'boom', 'Error: boom')
+    assert alerts.messages == ['Error: boom']
+    # A different reason is a new alert
+    clock(60)
+    alerts.failure(url, 'status', 'bang', 'Error: bang')
+    assert alerts.messages[-1] == 'Error: bang'
+    assert alerts.stats()['suppressed'] == 1
+
+
+def test_escalation_reminders_and_recovery(alerts, clock):
+    url = 'https://api.example.com/task'
+    for _ in range(3):
+        alerts.failure(url, 'http', 500, 'Warn: HTTP Error 500')
+        clock(60)
+    assert len(alerts.messages) == 2
+    assert alerts.messages[1].startswith('Escalation: {} has failed 3'.format(url))
+
+    # Reminders after 600s, then after another 1200s
+    clock(480)
+    alerts.failure(url, 'http', 500, 'Warn: HTTP Error 500')
+    assert alerts.messages[-1].startswith('Reminder:')
+    clock(600)
+    alerts.failure(url, 'http', 500, 'Warn: HTTP Error 500')
+    assert len(alerts.messages) == 3
+    clock(600)
+    alerts.failure(url, 'http', 500, 'Warn: HTTP Error 500')
+    assert len(alerts.messages) == 4
+
+    alerts.success(url, 'OK again')
+    alerts.success(url, 'OK again')
+    assert alerts.messages[-1] == 'OK again'
+    assert len(alerts.messages) == 5
+
+
+def test_listeners_get_every_alert(alerts, clock):
+    url = 'https://api.example.com/task'
+    seen = []
+    alerts.on_alert(lambda *args: seen.append(args))
+    for _ in range(3):
+        alerts.failure(url, 'http', 500, 'Warn: HTTP Error 500')
+        clock(60)
+    alerts.success(url, 'OK again')
+    assert [kind for _, kind, _ in seen] == ['alert', 'escalation', 'recovery']
+    assert seen[0] == (url, 'alert', 'Warn: HTTP Error 500')
+
+
+def test_budget_degrades_to_summary(clock):
+    sent = []
+    alerts = AlertManager(sent.append, per_minute=5, clock=clock)
+    for i in range(20):
+        alerts.failure(
+            'http://host/{}'.format(i), 'url', 'refused', 'down {}'.format(i)
+        )
+    assert sent == ['down {}'.format(i) for i in range(5)]
+    assert alerts.stats()['pending_summary'] == 15
+
+    clock(60)
+    alerts.tick()
+    assert len(sent) == 6
+    assert sent[-1].startswith('Summary: 15 alerts over the limit of 5 per minute')
+    assert 'down 5\n' in sent[-1]
+    assert sent[-1].endswith('... and 5 more')
+    assert alerts.stats()['summarized'] == 15
+
+
+def test_one_alert_for_a_host_that_is_down(alerts, clock):
+    urls = ['http://api.example.com/task/{}'.format(i) for i in range(3)]
+    alerts.failure(urls[0], 'url', 'refused', 'Warn: refused')
+    alerts.host_down('api.example.com', 'refused')
+    for url in urls:
+        alerts.failure(url, 'host', 'api.example.com', 'Warn: not checked')
+        clock(60)
+    assert len(alerts.messages) == 2
+    assert alerts.messages[1].startswith('Error: api.example.com is down')
+    assert alerts.stats()['failing'] == 3
+
+    # They recover with the host, without a message each. The first one
+    # failed before, its recovery is sent.
+    alerts.host_up('api.example.com')
+    for url in urls:
+        alerts.success(url, 'OK again')
+    assert alerts.messages[2:] == ['OK: api.example.com is back up', 'OK again']
+
+
+def test_error_before_the_host_went_down_is_not_alerted_again(alerts, clock):
+    url = 'http://api.example.com/task'
+    alerts.failure(url, 'status', 'disk full', 'Error: disk full')
+    alerts.host_down('api.example.com', 'refused')
+    alerts.failure(url, 'host', 'api.example.com', 'Warn: not checked')
+    alerts.host_up('api.example.com')
+    clock(60)
+    alerts.failure(url, 'status', 'disk full', 'Error: disk full')
+    assert alerts.messages.count('Error: disk full') == 1
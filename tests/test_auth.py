@@ -0,0 +1,204 @@
+import base64
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from json import dumps, loads
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import gevent
+import pytest
+
+from auth import TokenCache, token_expiry
+from settings import Settings, SettingsError
+
+
+class AuthServer(object):
+    def __init__(self):
+        self.logins = 0
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                loads(self.rfile.read(int(self.headers['Content-Length'])))
+                server.logins += 1
+                body = dumps({'auth_token': 'token-{}'.format(server.logins)}).encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = HTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}/login'.format(self.httpd.server_port)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def request_token(self):
+        # Yield first so that other greenlets pile up behind the login
+        gevent.sleep(0.01)
+        req = Request(self.url, data=dumps({'email': 'a', 'password': 'b'}).encode())
+        req.add_header('Content-Type', 'application/json')
+        with urlopen(req, timeout=5) as response:
+            return loads(response.read())['auth_token']
+
+
+@pytest.fixture
+def auth_server():
+    server = AuthServer()
+    yield server
+    server.httpd.shutdown()
+    server.httpd.server_close()
+
+
+class TaskServer(object):
+    # A monitored endpoint that only accepts the token `accepted` returns
+    def __init__(self, accepted):
+        self.gets = []
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                token = self.headers.get('Authorization')
+                server.gets.append(token)
+                if token == accepted():
+                    body = dumps({'status': 'OK'}).encode()
+                    self.send_response(200)
+                else:
+                    body = dumps({'error': 'Invalid token'}).encode()
+                    self.send_response(401)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = HTTPServer(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:{}/task'.format(self.httpd.server_port)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def token_auth(pinger, auth_server, monkeypatch):
+    # open_url() logs in through the auth server for every url
+    settings = {'token_auth': {'url': auth_server.url, 'header': 'Authorization'}}
+    monkeypatch.setattr(pinger, 'get_settings', lambda: settings)
+    monkeypatch.setattr(pinger, 'TOKEN_CACHE', TokenCache(auth_server.request_token))
+    return pinger
+
+
+def make_jwt(exp):
+    payload = base64.urlsafe_b64encode(dumps({'exp': exp}).encode()).decode()
+    return 'header.{}.signature'.format(payload.rstrip('='))
+
+
+def test_single_flight_login(auth_server):
+    cache = TokenCache(auth_server.request_token)
+    greenlets = [gevent.spawn(cache.get) for _ in range(50)]
+    gevent.joinall(greenlets, raise_error=True)
+    assert {g.value for g in greenlets} == {'token-1'}
+    assert auth_server.logins == 1
+    # Cached afterwards
+    assert cache.get() == 'token-1'
+    assert auth_server.logins == 1
+
+
+def test_invalidate_refreshes_once(auth_server):
+    cache = TokenCache(auth_server.request_token)
+    stale = cache.get()
+
+    def rejected():
+        # Every greenlet saw a 401 with the same stale token
+        cache.invalidate(stale)
+        return cache.get()
+
+    greenlets = [gevent.spawn(rejected) for _ in range(20)]
+    gevent.joinall(greenlets, raise_error=True)
+    assert {g.value for g in greenlets} == {'token-2'}
+    assert auth_server.logins == 2
+
+
+def test_ttl_expiry(auth_server):
+    now = [1000.0]
+    cache = TokenCache(auth_server.request_token, ttl=600, clock=lambda: now[0])
+    assert cache.get() == 'token-1'
+    now[0] += 500
+    assert cache.get() == 'token-1'
+    now[0] += 100
+    assert cache.get() == 'token-2'
+
+
+def test_token_without_an_expiry_is_not_kept(auth_server):
+    def ttl():
+        raise SettingsError('ttl must be an integer')
+
+    cache = TokenCache(auth_server.request_token, ttl=ttl)
+    with pytest.raises(SettingsError):
+        cache.get()
+    assert cache.token is None
+
+
+def test_ttl_must_outlast_the_margin():
+    assert Settings({'token_auth': {'ttl': '3600'}}).token_ttl == 3600
+    assert Settings({}).token_ttl is None
+    for ttl in ('1h', '30'):
+        with pytest.raises(SettingsError):
+            Settings({'token_auth': {'ttl': ttl}})
+
+
+def test_jwt_exp_claim():
+    now = [1000.0]
+    tokens = iter([make_jwt(1300), make_jwt(2000)])
+    cache = TokenCache(lambda: next(tokens), clock=lambda: now[0])
+    first = cache.get()
+    assert token_expiry(first) == 1300
+    now[0] = 1200
+    assert cache.get() == first
+    now[0] = 1280
+    assert cache.get() != first
+
+
+def test_failed_login_is_not_cached():
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        raise IOError('auth service down')
+
+    cache = TokenCache(fetch)
+    with pytest.raises(IOError):
+        cache.get()
+    with pytest.raises(IOError):
+        cache.get()
+    assert len(calls) == 2
+
+
+def test_rejected_token_is_refreshed_and_retried_once(token_auth, auth_server):
+    # The first token went stale, only the one of the second login works
+    task = TaskServer(lambda: 'token-2')
+    try:
+        response = token_auth.open_url(task.url)
+    finally:
+        task.close()
+    assert loads(response.body)['status'] == 'OK'
+    assert auth_server.logins == 2
+    assert task.gets == ['token-1', 'token-2']
+
+
+def test_token_rejected_again_is_not_retried_twice(token_auth, auth_server):
+    task = TaskServer(lambda: None)
+    try:
+        with pytest.raises(HTTPError) as e:
+            token_auth.open_url(task.url)
+    finally:
+        task.close()
+    assert e.value.code == 401
+    assert auth_server.logins == 2
+    assert task.gets == ['token-1', 'token-2']
@@ -0,0 +1,140 @@
+import datetime
+from json import dumps
+
+from pytz import UTC
+
+from evaluator import (
+    ASLEEP,
+    AWAKE,
+    FAILURE,
+    RECOVERY,
+    STILL_ASLEEP,
+    State,
+    aggregate_tasks,
+    base_url,
+    evaluate,
+    evaluate_response,
+    is_aggregate,
+)
+
+NOW = datetime.datetime(2018, 6, 28, 12, 0, tzinfo=UTC)
+
+
+def document(**kwargs):
+    status = {
+        'status': 'OK',
+        'lastrun': '2018-06-28T11:55:00Z',
+        'frequency': 10,
+        'process': 'p',
+        'server': 's',
+    }
+    status.update(kwargs)
+    return status
+
+
+def kinds(result):
+    return [event.kind for event in result.events]
+
+
+def test_ok():
+    result = evaluate(State(), document(), NOW, 'u')
+    assert result.state == State('ok', process='p', server='s')
+    assert kinds(result) == [RECOVERY]
+    assert result.lag == 300
+
+
+def test_failures():
+    cases = [
+        (document(status='ERROR', reason='boom'), 'status', 'boom'),
+        (document(lastrun='2018-06-28T11:00:00Z'), 'stale', ''),
+        (document(lastrun='yesterday-ish'), 'date', ''),
+        (document(frequency='often'), 'schema', 'frequency'),
+        (document(frequency=1e20), 'config', ''),
+        ([1, 2], 'parse', ''),
+    ]
+    for status, error_class, reason in cases:
+        result = evaluate(State('ok'), status, NOW, 'u')
+        assert result.state.status == 'error'
+        [event] = result.events
+        assert (event.kind, event.error_class, event.reason) == (
+            FAILURE,
+            error_class,
+            reason,
+        )
+
+
+def test_one_error_per_bad_field():
+    status = document(status=None, frequency=-5, sleep=[{'start': '22:00'}])
+    result = evaluate(State('ok'), status, NOW, 'u')
+    [event] = result.events
+    assert event.error_class == 'schema'
+    assert event.reason == 'status,frequency,sleep'
+    assert event.message == (
+        'Error: Invalid status document from u: status is required; '
+        'frequency must be greater than 0; '
+        'sleep entry 0 needs a "duration" in minutes'
+    )
+    assert result.state == State('error', process='p', server='s')
+
+
+def test_invalid_names_are_not_kept():
+    status = document(process=['a', 'b'], server={'name': 's'})
+    result = evaluate(State('ok'), status, NOW, 'u')
+    assert result.events[0].reason == 'process,server'
+    assert result.state == State('error', process=None, server=None)
+
+
+def test_response_not_json():
+    result = evaluate_response(State(), b'<html>', NOW, 'u')
+    assert result.document is None
+    assert result.events[0].message == (
+        'Error: Could not parse response from endpoint u'
+    )
+    decoded = evaluate_response(State(), dumps(document()).encode(), NOW, 'u')
+    assert decoded.document == document()
+
+
+def test_empty_document_keeps_state():
+    previous = State('error', process='p', server='s')
+    result = evaluate(previous, {}, NOW, 'u')
+    assert result.state is previous
+    assert result.events == []
+
+
+def test_sleep_cycle():
+    status = document(sleep=[{'start': '11:30:00', 'duration': 60}])
+    asleep = evaluate(State('ok'), status, NOW, 'u')
+    assert kinds(asleep) == [ASLEEP]
+    assert asleep.state.status == 'sleeping'
+
+    still = evaluate(asleep.state, status, NOW, 'u')
+    assert kinds(still) == [STILL_ASLEEP]
+    assert still.state is asleep.state
+
+    # Past the window the url wakes up and is evaluated straight away
+    later = NOW + datetime.timedelta(hours=1)
+    awake = evaluate(asleep.state, document(lastrun='2018-06-28T12:55:00Z'), later)
+    assert kinds(awake) == [AWAKE, RECOVERY]
+    assert awake.state.status == 'ok'
+
+
+def test_aggregate_responses():
+    keyed = {'export': document(), 'import': document(status='ERROR')}
+    listed = [document(task='export'), document(process='load'), {'status': 'OK'}]
+    assert is_aggregate(keyed) and is_aggregate(listed)
+    for single in (document(), {}, [], [1, 2], {'a': 1}):
+        assert not is_aggregate(single)
+
+    assert [url for url, _ in aggregate_tasks('u', keyed)] == ['u export', 'u import']
+    assert [url for url, _ in aggregate_tasks('u', listed)] == [
+        'u export',
+        'u s/load',
+        'u 2',
+    ]
+    assert base_url('https://x/status s/load') == 'https://x/status'
+    assert base_url('https://x/status!v2') == 'https://x/status!v2'
+
+    result = evaluate_response(State('error'), dumps(keyed), NOW, 'u')
+    assert result.state.status == 'ok'
+    assert kinds(result) == [RECOVERY]
+    assert result.document == keyed
@@ -0,0 +1,56 @@
+import json
+
+from events import EventBuffer, parse_last_event_id
+
+
+def parse(message):
+    fields = dict(line.split(': ', 1) for line in message.strip().split('\n'))
+    return int(fields['id']), fields['event'], json.loads(fields['data'])
+
+
+def test_stream_gets_published_events():
+    events = EventBuffer(keepalive=0.01)
+    stream = events.stream()
+    assert next(stream) == ': keepalive\n\n'
+    events.publish('status', {'url': 'https://a', 'status': 'error'})
+    assert parse(next(stream)) == (1, 'status', {'status': 'error', 'url': 'https://a'})
+    stream.close()
+    assert events.stats()['subscribers'] == 0
+
+
+def test_resume_from_last_event_id():
+    events = EventBuffer(size=5)
+    for i in range(8):
+        events.publish('status', {'n': i})
+    stream = events.stream(6)
+    assert [parse(next(stream))[0] for _ in range(2)] == [7, 8]
+
+    # Events 2 and 3 are no longer kept
+    stream = events.stream(1)
+    assert next(stream).startswith('event: reset')
+    assert parse(next(stream))[0] == 4
+
+    # An id from before a restart
+    stream = events.stream(100)
+    assert next(stream).startswith('event: reset')
+
+
+def test_slow_client_is_disconnected():
+    events = EventBuffer(queue_size=2, keepalive=0.01)
+    slow = events.stream()
+    fast = events.stream()
+    next(slow)
+    next(fast)
+    for i in range(3):
+        events.publish('status', {'n': i})
+        assert parse(next(fast))[2] == {'n': i}
+    assert events.stats()['disconnected'] == 1
+    # The slow client gets what was queued, then its stream ends
+    assert [parse(message)[0] for message in slow] == [1, 2]
+    assert events.stats()['subscribers'] == 1
+
+
+def test_parse_last_event_id():
+    assert parse_last_event_id('42') == 42
+    assert parse_last_event_id('') is None
+    assert parse_last_event_id('abc') is None
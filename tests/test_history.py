@@ -0,0 +1,70 @@
+from history import ERROR, OK, SLEEPING, History, HistoryStore
+
+
+def test_ring_buffer_keeps_the_last_samples():
+    history = History(capacity=3)
+    for t in range(5):
+        history.record(1000 + t, 0.1, OK, 30)
+    assert [s['time'] for s in history.samples()] == [1002, 1003, 1004]
+    assert history.size == 3
+
+
+def test_arrays_grow_up_to_capacity():
+    history = History(capacity=1000)
+    assert len(history.times) == 0
+    history.record(1000, 0.1, OK, 30)
+    assert len(history.times) == len(history.lag) == 1
+    for t in range(1, 1005):
+        history.record(1000 + t, 0.1, OK, 30)
+    assert len(history.times) == 1000
+    assert next(history.samples())['time'] == 1005
+
+
+def test_sample_encoding():
+    history = History(capacity=4)
+    history.record(1000.7, 0.1234, OK, 42.9)
+    history.record(1001, None, ERROR, None)
+    history.record(1002, 500, SLEEPING, -10)
+    samples = list(history.samples())
+    assert samples[0] == {'time': 1000, 'latency': 0.123, 'status': 'ok', 'lag': 42}
+    assert samples[1] == {'time': 1001, 'latency': None, 'status': 'error', 'lag': None}
+    # Latency is capped, negative lag (lastrun in the future) is kept
+    assert samples[2]['latency'] == 65.534
+    assert samples[2]['lag'] == -10
+
+
+def test_summary_and_time_range():
+    store = HistoryStore(capacity=100)
+    url = 'https://api.example.com/task'
+    statuses = ['ok', 'ok', 'error', 'ok', 'sleeping', 'error', 'error', 'ok']
+    for t, status in enumerate(statuses):
+        store.record(url, 1000 + t, (t + 1) / 100.0, status, 60)
+
+    summary = store.get(url).summary()
+    assert summary['samples'] == 8
+    assert summary['errors'] == 3
+    assert summary['uptime'] == 62.5
+    # ok->error, error->ok, ok->error (sleeping ignored), error->ok
+    assert summary['flaps'] == 4
+    assert summary['latency_p50'] == 0.04
+    assert summary['latency_p95'] == 0.08
+
+    ranged = store.get(url).summary(start=1005, end=1006)
+    assert ranged['samples'] == 2
+    assert ranged['uptime'] == 0.0
+    assert ranged['flaps'] == 0
+    assert store.get('https://unknown') is None
+
+
+def test_checks_without_a_status_are_not_errors():
+    store = HistoryStore(capacity=10)
+    url = 'https://api.example.com/task'
+    for t, status in enumerate(['ok', '', None, 'error']):
+        store.record(url, 1000 + t, None, status, None)
+    summary = store.get(url).summary()
+    assert summary['samples'] == 4
+    assert summary['errors'] == 1
+    assert summary['unknown'] == 2
+    assert summary['uptime'] == 50.0
+    assert summary['flaps'] == 1
+    assert [s['status'] for s in store.get(url).samples()][1] == 'unknown'
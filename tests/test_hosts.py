@@ -0,0 +1,86 @@
+import socket
+
+import gevent
+import pytest
+
+from hosts import HALF_OPEN, OPEN, DNSCache, HostBreakers
+
+
+@pytest.fixture
+def clock():
+    now = [100.0]
+
+    def tick(seconds=0):
+        now[0] += seconds
+        return now[0]
+
+    return tick
+
+
+def test_breaker_opens_and_probes(clock):
+    breakers = HostBreakers(failures=3, retry=30, clock=clock)
+    host = 'api.example.com'
+    assert not breakers.failure(host, 'refused')
+    assert not breakers.failure(host, 'refused')
+    # A response in between starts counting again
+    assert not breakers.success(host)
+    opened = [breakers.failure(host, 'refused') for _ in range(3)]
+    assert opened == [False, False, True]
+    assert breakers.hosts[host].status == OPEN
+    assert not breakers.allow(host)
+    assert breakers.allow('other.example.com')
+
+    # One probe after the retry time, it fails and the host stays open
+    clock(30)
+    assert breakers.allow(host)
+    assert breakers.hosts[host].status == HALF_OPEN
+    assert not breakers.allow(host)
+    assert not breakers.failure(host, 'timeout')
+    assert breakers.hosts[host].status == OPEN
+    assert breakers.stats()['hosts'][host]['retry_in'] == 30
+
+    clock(30)
+    assert breakers.allow(host)
+    assert breakers.success(host)
+    assert not breakers.is_open(host)
+    assert breakers.stats() == {'open': 0, 'short_circuited': 2, 'hosts': {}}
+
+
+def test_breakers_can_be_turned_off(clock):
+    breakers = HostBreakers(failures=0, clock=clock)
+    for _ in range(10):
+        assert not breakers.failure('api.example.com', 'refused')
+    assert breakers.allow('api.example.com')
+
+
+def test_dns_cache(clock):
+    lookups = []
+
+    def resolve(host, port):
+        lookups.append(host)
+        gevent.sleep(0.01)
+        if host == 'missing.example.com':
+            raise socket.gaierror(socket.EAI_NONAME, 'Name or service not known')
+        return [(socket.AF_INET, socket.SOCK_STREAM, 6, '', ('10.0.0.1', port))]
+
+    dns = DNSCache(ttl=60, negative_ttl=5, resolve=resolve, clock=clock)
+    # Concurrent lookups of the same name share one
+    waiting = [gevent.spawn(dns.getaddrinfo, 'api.example.com', 80) for _ in range(5)]
+    gevent.joinall(waiting, raise_error=True)
+    assert all(g.value[0][4] == ('10.0.0.1', 80) for g in waiting)
+    dns.getaddrinfo('api.example.com', 80)
+    assert lookups == ['api.example.com']
+
+    for _ in range(2):
+        with pytest.raises(socket.gaierror):
+            dns.getaddrinfo('missing.example.com', 80)
+    assert lookups.count('missing.example.com') == 1
+
+    clock(61)
+    dns.getaddrinfo('api.example.com', 80)
+    dns.forget('api.example.com', 80)
+    dns.getaddrinfo('api.example.com', 80)
+    assert lookups.count('api.example.com') == 3
+    stats = dns.stats()
+    assert (stats['hits'], stats['shared']) == (2, 4)
+    assert (stats['misses'], stats['errors']) == (4, 1)
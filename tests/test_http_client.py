@@ -0,0 +1,183 @@
+import socket
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.error import HTTPError, URLError
+
+import pytest
+
+from http_client import HTTPClient, RejectedResponse
+from profiling import Stopwatch
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.connections.add(self.client_address)
+        if self.path == '/slow':
+            time.sleep(0.5)
+        if self.path in ('/redirect', '/loop'):
+            self.send_response(302)
+            self.send_header('Location', '/ok' if self.path == '/redirect' else '/loop')
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        status = 404 if self.path == '/missing' else 200
+        body = b'{"status": "OK"}'
+        content_type = 'application/json; charset=utf-8'
+        if self.path == '/big':
+            body = b'[' + b'1,' * 100 + b'1]'
+        elif self.path == '/html':
+            content_type = 'text/html'
+            body = b'<html></html>'
+        elif self.path == '/error-page':
+            status = 500
+            content_type = 'text/html'
+            body = b'<html>' + b' ' * 200 + b'</html>'
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    httpd.daemon_threads = True
+    httpd.connections = set()
+    httpd.url = 'http://127.0.0.1:{}'.format(httpd.server_port)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_connections_are_reused(server):
+    client = HTTPClient()
+    for i in range(20):
+        with client.request('{}/task/{}'.format(server.url, i)) as fp:
+            assert fp.read() == b'{"status": "OK"}'
+    stats = client.stats()['http://127.0.0.1:{}'.format(server.server_port)]
+    assert stats['requests'] == 20
+    assert stats['created'] == 1
+    assert stats['reused'] == 19
+    assert len(server.connections) == 1
+    client.close()
+
+
+def test_http_error(server):
+    client = HTTPClient()
+    with pytest.raises(HTTPError) as e:
+        client.request(server.url + '/missing')
+    assert e.value.code == 404
+    # The body was read, so the connection is still usable
+    assert client.request(server.url + '/ok').status == 200
+    assert len(server.connections) == 1
+
+
+def test_body_size_and_content_type(server):
+    client = HTTPClient(max_body_size=100)
+    with pytest.raises(RejectedResponse) as e:
+        client.request(server.url + '/big')
+    assert e.value.reason == 'too_large'
+    # The notifiers take any type, the checks only status documents
+    assert client.request(server.url + '/html', check_type=False)
+    with pytest.raises(RejectedResponse) as e:
+        client.request(server.url + '/html', check_type=True)
+    assert e.value.reason == 'content_type'
+    assert client.request(server.url + '/ok', check_type=True).status == 200
+    # An error page is cut off at the limit
+    with pytest.raises(HTTPError) as e:
+        client.request(server.url + '/error-page')
+    assert len(e.value.read()) == 100
+    # Connections with an unread body are closed, not reused
+    pool = list(client.pools.values())[0]
+    assert (pool.created, pool.reused, pool.idle) == (3, 2, [])
+
+
+def test_stages_are_timed(server):
+    client = HTTPClient()
+    watch = Stopwatch()
+    client.request(server.url + '/ok', watch=watch)
+    assert list(watch.laps) == ['pool', 'dns', 'connect', 'first_byte', 'read']
+    # A reused connection skips the connect
+    watch = Stopwatch()
+    client.request(server.url + '/ok', watch=watch)
+    assert list(watch.laps) == ['pool', 'first_byte', 'read']
+
+
+def test_follows_redirects(server):
+    response = HTTPClient().request(server.url + '/redirect')
+    assert response.status == 200
+    assert response.url == server.url + '/ok'
+
+
+def test_too_many_redirects(server):
+    with pytest.raises(URLError, match='too many redirects'):
+        HTTPClient().request(server.url + '/loop')
+
+
+def test_read_timeout(server):
+    client = HTTPClient(read_timeout=0.1)
+    with pytest.raises(socket.timeout):
+        client.request(server.url + '/slow')
+    # The timed out connection is not put back into the pool
+    pool = list(client.pools.values())[0]
+    assert pool.idle == []
+    assert pool.errors == 1
+
+
+def test_total_timeout(server):
+    client = HTTPClient(total_timeout=0.1)
+    started = time.monotonic()
+    with pytest.raises(socket.timeout):
+        client.request(server.url + '/slow')
+    assert time.monotonic() - started < 0.4
+
+
+def test_connection_refused():
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    with pytest.raises(URLError):
+        HTTPClient().request('http://127.0.0.1:{}/'.format(port))
+
+
+def test_answer_that_is_not_http():
+    # A raw socket answering garbage instead of a status line
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+
+    def answer():
+        conn, _ = listener.accept()
+        conn.recv(1024)
+        conn.sendall(b'garbage\r\n')
+        conn.close()
+
+    threading.Thread(target=answer, daemon=True).start()
+    port = listener.getsockname()[1]
+    with pytest.raises(URLError):
+        HTTPClient().request('http://127.0.0.1:{}/'.format(port))
+    listener.close()
+
+
+def test_per_host_limit():
+    client = HTTPClient(max_per_host=2)
+    pool = client.get_pool('http', 'example.com', 80)
+    pool.acquire()
+    pool.acquire()
+    with pytest.raises(URLError):
+        pool.acquire(timeout=0.01)
+    assert pool.stats()['in_use'] == 2
+
+
+def test_bad_url():
+    with pytest.raises(ValueError):
+        HTTPClient().request('test')
@@ -0,0 +1,143 @@
+import datetime
+import json
+
+import pytest
+import pytz
+
+from evaluator import State, evaluate
+from ingest import HeartbeatMonitor, IngestError, parse_heartbeats
+from state_store import StateStore
+from utils import get_now
+
+NOW = datetime.datetime(2026, 3, 2, 12, 0, tzinfo=pytz.UTC)
+
+
+def heartbeat(process='job', minutes_ago=0, frequency=10, status='OK'):
+    lastrun = NOW - datetime.timedelta(minutes=minutes_ago)
+    return {
+        'status': status,
+        'frequency': frequency,
+        'lastrun': lastrun.isoformat(),
+        'process': process,
+        'server': 'batch-1',
+    }
+
+
+def test_parse_single_and_batch():
+    single = parse_heartbeats(json.dumps(heartbeat()))
+    assert single == [('push://batch-1/job', heartbeat())]
+    batch = parse_heartbeats(json.dumps([heartbeat('a'), dict(task='nightly')]))
+    assert [key for key, _ in batch] == ['push://batch-1/a', 'push://nightly']
+
+    for body in ('nope', '42', '[1]', '[{"status": "OK"}]'):
+        with pytest.raises(IngestError):
+            parse_heartbeats(body)
+    with pytest.raises(IngestError):
+        parse_heartbeats(json.dumps([heartbeat()] * 3), max_batch=2)
+
+
+def test_deadline_follows_the_last_heartbeat():
+    expired = []
+    monitor = HeartbeatMonitor(expired.append, grace=5)
+    now = NOW.timestamp()
+    result = evaluate(State(), heartbeat(minutes_ago=2), NOW)
+    monitor.arm('a', result, NOW, error_interval=480)
+    assert monitor.deadlines['a'] == now + 8 * 60 + 5
+    assert monitor.due(now + 8 * 60) == []
+
+    # A newer heartbeat moves the deadline without a new heap entry
+    result = evaluate(State(), heartbeat(minutes_ago=0), NOW)
+    monitor.arm('a', result, NOW, error_interval=480)
+    assert len(monitor.heap) == 1
+    assert monitor.due(now + 9 * 60) == []
+    assert monitor.due(now + 10 * 60 + 5) == ['a']
+    assert monitor.deadlines == {}
+
+
+def test_failing_and_missed_heartbeats_are_evaluated_again():
+    monitor = HeartbeatMonitor(lambda key: None)
+    result = evaluate(State(), heartbeat(status='ERROR'), NOW)
+    monitor.arm('a', result, NOW, error_interval=480)
+    assert monitor.deadlines['a'] == NOW.timestamp() + 480
+
+    # Evaluating the last document after its deadline fails it as stale
+    later = NOW + datetime.timedelta(minutes=11)
+    result = evaluate(State('ok'), heartbeat(), later)
+    assert result.state.status == 'error'
+    assert result.events[0].error_class == 'stale'
+
+
+def test_token():
+    assert HeartbeatMonitor(None).authorized(None)
+    monitor = HeartbeatMonitor(None, token='secret')
+    assert monitor.authorized('Bearer secret')
+    assert not monitor.authorized('Bearer guess')
+    assert not monitor.authorized(None)
+
+
+def live_heartbeat():
+    # Sent two minutes after the last run of a task running every 10 minutes
+    lastrun = get_now() - datetime.timedelta(minutes=2)
+    return dict(heartbeat(), lastrun=lastrun.isoformat())
+
+
+def test_ingest_route(pinger, monkeypatch):
+    monitor = HeartbeatMonitor(pinger.heartbeat_missed, token='secret')
+    monkeypatch.setattr(pinger, 'HEARTBEATS', monitor)
+    alerts = []
+    pinger.ALERTS.on_alert(lambda url, kind, message: alerts.append((url, kind)))
+    app = pinger.make_app()
+    pinger.add_ingest_routes(app)
+    client = app.test_client()
+    auth = {'Authorization': 'Bearer secret'}
+    key = 'push://batch-1/job'
+
+    body = json.dumps(live_heartbeat())
+    assert client.post('/ingest', data=body).status_code == 401
+    assert client.post('/ingest', data='nope', headers=auth).status_code == 400
+    response = client.post('/ingest', data=body, headers=auth)
+    assert response.get_json()['data'] == {'accepted': 1, 'tasks': [key]}
+    assert pinger.STATS[key]['status'] == 'ok'
+    assert key in monitor.deadlines
+
+    # No heartbeat before the deadline, the task fails as stale
+    later = get_now() + datetime.timedelta(minutes=20)
+    monkeypatch.setattr(pinger, 'get_now', lambda: later)
+    pinger.heartbeat_missed(key)
+    assert pinger.STATS[key]['status'] == 'error'
+    assert alerts == [(key, 'alert')]
+
+    # A task that stopped for good is retired
+    assert client.delete('/ingest/batch-1/job').status_code == 401
+    assert client.delete('/ingest/batch-1/job', headers=auth).status_code == 200
+    assert key not in pinger.STATS
+    assert key not in monitor.documents and key not in monitor.deadlines
+    assert client.delete('/ingest/batch-1/job', headers=auth).status_code == 404
+
+
+def test_pushed_tasks_are_restored(pinger, monkeypatch, tmp_path):
+    path = str(tmp_path / 'pinger.db')
+    key = 'push://batch-1/job'
+    document = live_heartbeat()
+    monitor = HeartbeatMonitor(pinger.heartbeat_missed)
+    store = StateStore(path)
+    store.heartbeats = monitor.documents
+    monkeypatch.setattr(pinger, 'HEARTBEATS', monitor)
+    monkeypatch.setattr(pinger, 'STORE', store)
+    pinger.ingest(key, document, get_now())
+    store.flush(pinger.STATS, pinger.ALERTS, threaded=False)
+    store.close()
+
+    # A restart, with none of the polled urls
+    pinger.STATS.clear()
+    monitor = HeartbeatMonitor(pinger.heartbeat_missed)
+    store = StateStore(path)
+    monkeypatch.setattr(pinger, 'HEARTBEATS', monitor)
+    monkeypatch.setattr(pinger, 'STORE', store)
+    pinger.restore_state(['http://host/a'])
+    assert pinger.STATS[key]['status'] == 'ok'
+    assert monitor.documents == {key: document}
+    assert not store.removed
+    # Evaluated again right away, so a task that stopped meanwhile fails
+    assert monitor.due(monitor.clock()) == [key]
+    store.close()
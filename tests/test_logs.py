@@ -0,0 +1,92 @@
+import json
+import logging
+
+from logs import JSONFormatter, LogPipeline, file_handler, setup_logging
+from settings import Settings
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super(ListHandler, self).__init__()
+        self.lines = []
+
+    def emit(self, record):
+        self.lines.append(self.format(record))
+
+
+def record(message, level=logging.INFO):
+    return logging.makeLogRecord(
+        {'msg': message, 'levelno': level, 'levelname': logging.getLevelName(level)}
+    )
+
+
+def test_repeated_lines_are_sampled():
+    now = [0.0]
+    pipeline = LogPipeline(
+        ListHandler(), rate_limit=3, rate_period=60, clock=lambda: now[0]
+    )
+    for _ in range(10):
+        pipeline.handle(record('same'))
+    pipeline.handle(record('other'))
+    pipeline.handle(record('same', logging.ERROR))
+    assert list(pipeline.buffer) == ['same'] * 3 + ['other', 'same']
+    assert pipeline.suppressed == 7
+
+    # The next period starts with how many were left out
+    now[0] = 61.0
+    pipeline.handle(record('same'))
+    assert list(pipeline.buffer)[-2:] == ['7 more times in 60s: same', 'same']
+
+
+def test_full_buffer_drops_lines():
+    pipeline = LogPipeline(ListHandler(), capacity=2)
+    for i in range(5):
+        pipeline.handle(record('line {}'.format(i)))
+    assert len(pipeline.buffer) == 2
+    assert pipeline.stats()['dropped'] == 3
+
+
+def test_writer_drains_the_buffer_on_close():
+    target = ListHandler()
+    pipeline = LogPipeline(target).start()
+    for i in range(100):
+        pipeline.handle(record('line {}'.format(i)))
+    pipeline.close()
+    # Written in batches, a record per batch
+    lines = '\n'.join(target.lines).split('\n')
+    assert lines == ['line {}'.format(i) for i in range(100)]
+    assert pipeline.stats()['written'] == 100
+
+
+def test_json_lines_and_rotation(tmp_path):
+    path = str(tmp_path / 'pinger.log')
+    target = file_handler(path, max_bytes=200, backup_count=2)
+    pipeline = LogPipeline(target)
+    pipeline.setFormatter(JSONFormatter())
+    pipeline.start()
+    for i in range(20):
+        pipeline.handle(record('line {}'.format(i)))
+        # Rotates between batches
+        pipeline.flush()
+    pipeline.close()
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        'pinger.log',
+        'pinger.log.1',
+        'pinger.log.2',
+    ]
+    with open(path) as f:
+        lines = [json.loads(line) for line in f]
+    assert lines[-1]['message'] == 'line 19'
+    assert lines[-1]['level'] == 'INFO'
+
+
+def test_shards_write_their_own_file(tmp_path):
+    config = Settings({'logging': {'path': str(tmp_path / 'pinger.log')}})
+    pipeline = setup_logging(config, shard='1')
+    logger = logging.getLogger('test_shard_log')
+    logger.addHandler(pipeline)
+    logger.warning('from shard 1')
+    logger.removeHandler(pipeline)
+    pipeline.close()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ['pinger.1.log']
+    assert 'from shard 1' in (tmp_path / 'pinger.1.log').read_text()
@@ -0,0 +1,60 @@
+import pytest
+
+from metrics import LATENCY_BUCKETS, Histogram, Metrics, SIZE_BUCKETS
+
+
+def test_histogram_buckets():
+    histogram = Histogram((1, 2, 5))
+    for value in (0.5, 1, 1.5, 3, 10):
+        histogram.observe(value)
+    assert list(histogram.counts) == [2, 1, 1, 1]
+    assert list(histogram.cumulative()) == [2, 3, 4, 5]
+    assert histogram.count == 5
+    assert histogram.total == 16
+
+
+def test_histogram_merge():
+    a = Histogram(LATENCY_BUCKETS)
+    b = Histogram(LATENCY_BUCKETS)
+    a.observe(0.02)
+    b.observe(0.02)
+    b.observe(3)
+    a.merge(b)
+    assert a.count == 3
+    assert sum(a.counts) == 3
+    with pytest.raises(ValueError):
+        a.merge(Histogram(SIZE_BUCKETS))
+
+
+def test_render_prometheus_text():
+    metrics = Metrics()
+    url = 'https://api.example.com/task?name="a"'
+    metrics.observe(url, 0.03, 300)
+    metrics.observe(url, 0.2, 300)
+    stats = {url: {'pings': 2, 'errors': 1}}
+    text = metrics.render(stats)
+    labels = 'url="https://api.example.com/task?name=\\"a\\""'
+    assert '# TYPE pinger_check_duration_seconds histogram\n' in text
+    assert 'pinger_check_duration_seconds_bucket{%s,le="0.025"} 0\n' % labels in text
+    assert 'pinger_check_duration_seconds_bucket{%s,le="0.05"} 1\n' % labels in text
+    assert 'pinger_check_duration_seconds_bucket{%s,le="+Inf"} 2\n' % labels in text
+    assert 'pinger_check_duration_seconds_count{%s} 2\n' % labels in text
+    assert 'pinger_response_size_bytes_bucket{%s,le="512.0"} 2\n' % labels in text
+    assert 'pinger_pings_total{%s} 2\n' % labels in text
+    assert 'pinger_errors_total{%s} 1\n' % labels in text
+
+
+def test_failed_checks_and_urls_without_requests():
+    metrics = Metrics()
+    metrics.observe('http://svc/agg', 5.0)
+    stats = {
+        'http://svc/agg': {'pings': 1, 'errors': 1},
+        'http://svc/agg a': {'pings': 1, 'errors': 0},
+    }
+    text = metrics.render(stats)
+    assert 'pinger_check_duration_seconds_count{url="http://svc/agg"} 1\n' in text
+    assert 'pinger_response_size_bytes_count{url="http://svc/agg"} 0\n' in text
+    # The task is counted, but has no histograms and is not kept
+    assert 'pinger_pings_total{url="http://svc/agg a"} 1\n' in text
+    assert 'duration_seconds_count{url="http://svc/agg a"}' not in text
+    assert list(metrics.urls) == ['http://svc/agg']
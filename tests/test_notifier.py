@@ -0,0 +1,127 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from json import dumps, loads
+
+import gevent
+import pytest
+
+import utils
+from notifier import Channel
+from settings import Settings
+
+
+class StubServer(object):
+    # Counts posts, answering the first `failures` of them with a 500
+    def __init__(self, failures=0):
+        self.posts = []
+        self.failures = failures
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                body = loads(self.rfile.read(int(self.headers['Content-Length'])))
+                if stub.failures:
+                    stub.failures -= 1
+                    status = 500
+                else:
+                    stub.posts.append(body)
+                    status = 200
+                response = dumps({'ok': True}).encode()
+                self.send_response(status)
+                self.send_header('Content-Length', str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.httpd.daemon_threads = True
+        self.url = 'http://127.0.0.1:{}'.format(self.httpd.server_port)
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+@pytest.fixture
+def stubs(monkeypatch):
+    slack = StubServer(failures=2)
+    hipchat = StubServer()
+    settings = {
+        'main': {'only_log': 'true', 'debug': 'false'},
+        'slack': {
+            'url': slack.url + '/api/chat.postMessage',
+            'channel': 'alerts',
+            'token': '1234',
+            'user': 'bot',
+        },
+        'hipchat': {'url': hipchat.url, 'auth': '1234', 'room': 'alerts'},
+        'notify': {'window': '0.2', 'max_batch': '500', 'backoff': '0.01'},
+    }
+    monkeypatch.setattr(utils, 'get_settings', lambda: settings)
+    monkeypatch.setattr(utils, 'get_config', lambda: Settings(settings))
+    monkeypatch.setattr(utils, 'DISPATCHER', None)
+    yield slack, hipchat
+    slack.close()
+    hipchat.close()
+
+
+def test_messages_are_coalesced_into_a_digest(stubs):
+    slack, hipchat = stubs
+    dispatcher = utils.setup_notifications()
+    for i in range(200):
+        utils.send_messages('Error: task {} failed'.format(i))
+    with gevent.Timeout(5):
+        while not dispatcher.idle():
+            gevent.sleep(0.05)
+
+    assert len(hipchat.posts) == 1
+    assert hipchat.posts[0]['message'].startswith('200 messages:\nError: task 0')
+    assert len(slack.posts) == 1
+    assert slack.posts[0]['text'].endswith('Error: task 199 failed')
+
+    stats = dispatcher.stats()
+    assert stats['slack']['delivered'] == 200
+    assert stats['slack']['posts'] == 1
+    assert stats['slack']['retried'] == 2
+    assert stats['hipchat']['retried'] == 0
+    assert stats['hipchat']['depth'] == 0
+    assert stats['hipchat']['latency_max'] >= 0.2
+    dispatcher.close()
+
+
+def test_close_flushes_the_queue(stubs):
+    slack, hipchat = stubs
+    dispatcher = utils.setup_notifications()
+    utils.send_messages('Monitoring service shutting down! C-ya later!')
+    dispatcher.close(timeout=5)
+    assert [p['message'] for p in hipchat.posts] == [
+        'Monitoring service shutting down! C-ya later! (yey)'
+    ]
+
+
+def test_full_queue_drops_messages():
+    channel = Channel('test', lambda message: None, queue_size=2)
+    for i in range(5):
+        channel.put(str(i))
+    stats = channel.stats()
+    assert stats['depth'] == 2
+    assert stats['dropped'] == 3
+
+
+def test_failed_delivery_gives_up():
+    def send(message):
+        raise IOError('service down')
+
+    channel = Channel('test', send, retries=2, backoff=0)
+    channel.put('a')
+    channel.put('b')
+    channel.flush()
+    stats = channel.stats()
+    assert stats['failed'] == 2
+    assert stats['retried'] == 2
+    assert stats['delivered'] == 0
@@ -1,5 +1,8 @@
+import datetime
+import socket
+
 from src.utils import (send_messages, send_to_slack, send_to_hipchat,
-                       debug_mode, only_log)
+                       debug_mode, only_log, get_now)
 
 
 def test_send_message(settings):
@@ -22,3 +25,67 @@ def test_debug(settings):
 def test_only_log(settings):
     logging = only_log()
     assert logging is True
+
+
+def status(process, status='OK'):
+    lastrun = get_now() - datetime.timedelta(minutes=2)
+    return {
+        'status': status,
+        'lastrun': lastrun.isoformat(),
+        'frequency': 10,
+        'process': process,
+        'server': 'web-1',
+    }
+
+
+def test_aggregate_tasks_are_checked_and_forgotten(pinger):
+    url = 'http://svc/agg'
+    alerts = []
+    pinger.ALERTS.on_alert(lambda url, kind, message: alerts.append(message))
+    pinger.STATS[url] = pinger.new_stats()
+    pinger.check_tasks(url, {'a': status('a'), 'b': status('b')}, get_now())
+    assert pinger.TASKS[url] == {'http://svc/agg a', 'http://svc/agg b'}
+    assert pinger.STATS[url]['tasks'] == 2
+    assert pinger.STATS['http://svc/agg a']['status'] == 'ok'
+
+    # Tasks are addressed under /task/ like any url
+    app = pinger.make_app()
+    pinger.add_stats_routes(app)
+    response = app.test_client().get('/task/http://svc/agg%20a')
+    assert response.get_json()['data']['process'] == 'a'
+
+    # b left the response, a fails and its alert names the task
+    pinger.check_tasks(url, {'a': status('', 'ERROR')}, get_now())
+    assert pinger.TASKS[url] == {'http://svc/agg a'}
+    assert 'http://svc/agg b' not in pinger.STATS
+    assert pinger.STATS[url]['tasks'] == 1
+    assert pinger.STATS['http://svc/agg a']['status'] == 'error'
+    assert len(alerts) == 1
+    assert 'process  running on web-1 (http://svc/agg a)' in alerts[0]
+
+
+def test_failed_checks_are_timed(pinger):
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    url = 'http://127.0.0.1:{}/task'.format(sock.getsockname()[1])
+    sock.close()
+    pinger.check(url)
+    assert pinger.STATS[url]['status'] == 'error'
+    metrics = pinger.METRICS.urls[url]
+    assert metrics.latency.count == 1
+    assert metrics.size.count == 0
+
+
+def test_history_range_must_be_numbers(pinger):
+    url = 'http://svc/history'
+    pinger.STATS[url] = pinger.new_stats()
+    for t in range(5):
+        pinger.HISTORY.record(url, 1000 + t, 0.1, 'ok', 0)
+    app = pinger.make_app()
+    pinger.add_check_routes(app, scheduler=None)
+    client = app.test_client()
+    response = client.get('/task/{}/history?start=1003'.format(url))
+    assert [s['time'] for s in response.get_json()['data']['samples']] == [1003, 1004]
+    response = client.get('/task/{}/history?start=yesterday'.format(url))
+    assert response.status_code == 400
+    assert client.get('/task/{}/history?end=1e'.format(url)).status_code == 400
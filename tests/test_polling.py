@@ -0,0 +1,77 @@
+import datetime
+
+import pytest
+import pytz
+
+from evaluator import State, evaluate
+from polling import PollingPolicy
+from settings import Settings, SettingsError
+
+NOW = datetime.datetime(2026, 3, 2, 12, 0, tzinfo=pytz.UTC)
+CONFIG = Settings({'main': {'interval': '60', 'error_interval': '480'}})
+
+
+def at(minutes):
+    return NOW + datetime.timedelta(minutes=minutes)
+
+
+def check(policy, url, lastrun, now=0, frequency=60):
+    # lastrun and now in minutes from NOW
+    document = {
+        'status': 'OK',
+        'frequency': frequency,
+        'lastrun': at(lastrun).isoformat(),
+    }
+    result = evaluate(State(), document, at(now))
+    return policy.next_check(url, result.state, result, at(now), CONFIG)
+
+
+def test_checks_after_the_next_run_is_due():
+    policy = PollingPolicy()
+    # The normal interval until the task was seen running twice
+    assert check(policy, 'a', -10, frequency=30) == 60
+    assert check(policy, 'a', -10, 1, frequency=30) == 60
+    assert check(policy, 'a', 20, 20, frequency=30) == 30 * 60 + 30
+    # An unchanged response keeps the same next run
+    unchanged = evaluate(State('ok'), {}, at(40))
+    delay = policy.next_check('a', unchanged.state, unchanged, at(40), CONFIG)
+    assert delay == 10 * 60 + 30
+    # A daily task is bounded by max_interval
+    check(policy, 'b', -10, frequency=1440)
+    assert check(policy, 'b', 1430, 1430, frequency=1440) == 3600
+
+
+def test_learns_tasks_that_run_more_often():
+    policy = PollingPolicy()
+    check(policy, 'a', -3)
+    # Ran two minutes after the previous run
+    assert check(policy, 'a', -1) == 60 + 30
+    # A late run is looked for again after as long as it is late, until the
+    # last run is stale
+    assert check(policy, 'a', -1, 4) == 180
+    assert check(policy, 'a', -1, 58) == 60 + 30
+
+
+def test_sleeping_checks_when_the_window_ends():
+    policy = PollingPolicy()
+    state = State('sleeping', NOW, NOW + datetime.timedelta(minutes=20))
+    assert policy.next_check('a', state, None, NOW, CONFIG) == 20 * 60 + 30
+
+
+def test_failures_back_off_with_jitter():
+    policy = PollingPolicy(random=lambda: 1.0)
+    error = State('error')
+    delays = [policy.next_check('a', error, None, NOW, CONFIG) for _ in range(6)]
+    assert delays == [30, 60, 120, 240, 480, 480]
+
+    policy = PollingPolicy(random=lambda: 0.0)
+    delays = [policy.next_check('a', error, None, NOW, CONFIG) for _ in range(3)]
+    assert delays == [15, 30, 60]
+    # The backoff starts over once the url is ok again
+    check(policy, 'a', -10)
+    assert policy.next_check('a', error, None, NOW, CONFIG) == 15
+
+
+def test_bounds_are_validated():
+    with pytest.raises(SettingsError):
+        Settings({'polling': {'min_interval': '600', 'max_interval': '60'}})
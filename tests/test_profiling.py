@@ -0,0 +1,93 @@
+import time
+
+import gevent
+
+from profiling import (
+    NO_WATCH,
+    HubMonitor,
+    StageTimings,
+    Stopwatch,
+    get_ident,
+    sample_stacks,
+)
+from settings import Settings
+
+
+def test_stage_timings():
+    timings = StageTimings()
+    assert timings.stopwatch() is NO_WATCH
+    timings.record('a', NO_WATCH)
+    assert timings.checks == 0
+
+    timings.enabled = True
+    for seconds in (0.002, 0.004):
+        watch = timings.stopwatch()
+        assert isinstance(watch, Stopwatch)
+        watch.laps = {'read': seconds, 'pool': 0.001}
+        timings.record('a', watch)
+    stats = timings.stats()
+    assert stats['checks'] == 2
+    # Stages in the order of a check
+    assert list(stats['stages']) == ['pool', 'read']
+    assert stats['stages']['read']['mean_ms'] == 3.0
+    assert stats['stages']['read']['max_ms'] == 4.0
+    assert timings.stats('a')['read'] == {'count': 2, 'mean_ms': 3.0, 'max_ms': 4.0}
+    timings.forget('a')
+    assert timings.stats('a') == {}
+
+
+def test_laps_add_up():
+    watch = Stopwatch()
+    watch.lap('read')
+    watch.lap('decode')
+    watch.lap('read')
+    assert list(watch.laps) == ['read', 'decode']
+    assert all(seconds >= 0 for seconds in watch.laps.values())
+
+
+def test_blocking_reports_keep_the_stack():
+    monitor = HubMonitor(0.1)
+    info = [
+        '=' * 80,
+        '\n12:00:00 : Greenlet <check> appears to be blocked',
+        'Blocked Stack (for thread id 1):',
+        '  File "pinger.py", line 10, in check\n',
+        'Info:',
+        '*' * 80,
+        'Greenlet tree',
+    ]
+    monitor.report('<check>', info, periods=3)
+    monitor.observe(0.2)
+    stats = monitor.stats()
+    assert stats['blocked'] == 1
+    assert stats['lag_ms']['max'] == 200.0
+    assert stats['reports'][0]['seconds'] == 0.3
+    stack = stats['reports'][0]['stack']
+    assert stack == '  File "pinger.py", line 10, in check'
+
+
+def spin(seconds):
+    until = time.perf_counter() + seconds
+    while time.perf_counter() < until:
+        pass
+
+
+def test_samples_the_blocking_function():
+    # The sampler runs on a real thread while this one does not yield
+    samples = gevent.get_hub().threadpool.spawn(sample_stacks, 0.2, 0.001, get_ident())
+    spin(0.4)
+    counts = samples.get()
+    assert any(stack.endswith('test_profiling.py:spin') for stack in counts)
+
+
+def test_one_profile_at_a_time(pinger, monkeypatch):
+    config = Settings({'profiling': {'profile': 'true'}})
+    monkeypatch.setattr(pinger, 'get_config', lambda: config)
+    app = pinger.make_app()
+    pinger.add_debug_routes(app)
+    client = app.test_client()
+    first = gevent.spawn(client.get, '/debug/profile?seconds=0.2')
+    gevent.sleep(0.05)
+    assert client.get('/debug/profile?seconds=0.1').status_code == 409
+    assert first.get().status_code == 200
+    assert client.get('/debug/profile?seconds=0.05').status_code == 200
@@ -0,0 +1,35 @@
+from email.message import Message
+
+from http_client import Response
+from response_cache import ResponseCache
+
+
+def make_response(status=200, body=b'{"status": "OK"}', **headers):
+    message = Message()
+    for key, value in headers.items():
+        message[key.replace('_', '-')] = value
+    return Response('http://host/task', status, 'OK', message, body)
+
+
+def test_etag_round_trip():
+    cache = ResponseCache()
+    assert cache.headers('http://host/task') == {}
+    first = make_response(ETag='"v1"', Last_Modified='Thu, 28 Jun 2018 11:37:48 GMT')
+    assert cache.lookup('http://host/task', first) is None
+    cache.store('http://host/task', first, {'status': 'OK'})
+    assert cache.headers('http://host/task') == {
+        'If-None-Match': '"v1"',
+        'If-Modified-Since': 'Thu, 28 Jun 2018 11:37:48 GMT',
+    }
+    assert cache.lookup('http://host/task', make_response(304, b'')) == {'status': 'OK'}
+
+
+def test_body_hash_fallback():
+    cache = ResponseCache()
+    cache.store('http://host/task', make_response(), {'status': 'OK'})
+    assert cache.headers('http://host/task') == {}
+    assert cache.lookup('http://host/task', make_response()) == {'status': 'OK'}
+    changed = make_response(body=b'{"status": "error"}')
+    assert cache.lookup('http://host/task', changed) is None
+    cache.forget('http://host/task')
+    assert cache.lookup('http://host/task', make_response()) is None
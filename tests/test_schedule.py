@@ -0,0 +1,54 @@
+import datetime
+
+from pytz import UTC
+
+from schedule import NEVER, compile_sleep, parse_timestamp
+
+
+def at(hour, minute=0, day=28):
+    return datetime.datetime(2018, 6, day, hour, minute, tzinfo=UTC)
+
+
+def test_parse_timestamp():
+    assert parse_timestamp('2018-06-28T11:37:48Z') == datetime.datetime(
+        2018, 6, 28, 11, 37, 48, tzinfo=UTC
+    )
+    assert parse_timestamp('2018-06-28T13:37:48+02:00') == at(11, 37) + (
+        datetime.timedelta(seconds=48)
+    )
+    # Naive timestamps are UTC, odd formats fall back to dateutil
+    assert parse_timestamp('2018-06-28 11:37:48').tzinfo is not None
+    assert parse_timestamp('Thu, 28 Jun 2018 11:37:48 GMT') == at(11, 37) + (
+        datetime.timedelta(seconds=48)
+    )
+
+
+def test_daily_window_wraps_midnight():
+    schedule = compile_sleep([{'start': '22:00:00', 'duration': 450}])
+    assert schedule.window_at(at(21, 59)) is None
+    assert schedule.window_at(at(22, 0)) == (at(22), at(5, 30, day=29))
+    # Just after midnight the window started yesterday
+    assert schedule.window_at(at(1, 0, day=29)) == (at(22), at(5, 30, day=29))
+    assert schedule.window_at(at(5, 31, day=29)) is None
+
+
+def test_dated_window():
+    schedule = compile_sleep([{'start': '2018-06-28T10:00:00Z', 'duration': 60}])
+    assert schedule.window_at(at(10, 30)) == (at(10), at(11))
+    assert schedule.window_at(at(10, 30, day=29)) is None
+
+
+def test_compiled_schedules_are_cached():
+    spec = [{'start': '22:00', 'duration': 60}, {'start': '12:00', 'duration': 5}]
+    first = compile_sleep(spec)
+    assert compile_sleep([dict(s) for s in spec]) is first
+    assert first.window_at(at(12, 3)) == (at(12), at(12, 5))
+
+
+def test_bad_specs_never_sleep():
+    assert compile_sleep(None) is NEVER
+    assert compile_sleep([]) is NEVER
+    assert compile_sleep([{'start': '25:00', 'duration': 10}]) is NEVER
+    assert compile_sleep([{'start': 'tea time', 'duration': 10}]) is NEVER
+    assert compile_sleep([{'start': '22:00'}]) is NEVER
+    assert compile_sleep(['22:00']) is NEVER
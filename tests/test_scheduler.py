@@ -0,0 +1,167 @@
+from collections import Counter, defaultdict
+
+import gevent
+from gevent.event import Event
+
+from scheduler import Scheduler, host_of, jitter
+
+
+def test_jitter_is_deterministic_and_spread():
+    urls = ['https://api.example.com/task/{}'.format(i) for i in range(1000)]
+    offsets = [jitter(u, 60) for u in urls]
+    assert offsets == [jitter(u, 60) for u in urls]
+    assert all(0 <= o < 60 for o in offsets)
+    # Roughly even over six 10 second buckets
+    buckets = Counter(int(o // 10) for o in offsets)
+    assert len(buckets) == 6
+    assert min(buckets.values()) > 100
+
+
+def test_checks_repeat_at_interval():
+    calls = Counter()
+
+    def check(url):
+        calls[url] += 1
+        return 0.1
+
+    scheduler = Scheduler(check)
+    for i in range(5):
+        scheduler.add('http://host/{}'.format(i), 0.1)
+    scheduler.start()
+    gevent.sleep(0.55)
+    scheduler.kill()
+    assert len(calls) == 5
+    assert all(4 <= n <= 7 for n in calls.values())
+    assert scheduler.stats()['checks'] == sum(calls.values())
+
+
+def test_add_all_schedules_like_add():
+    urls = ['http://host/{}'.format(i) for i in range(50)]
+    one_by_one = Scheduler(lambda url: 1, clock=lambda: 100.0)
+    for u in urls:
+        one_by_one.add(u, 60)
+    at_once = Scheduler(lambda url: 1, clock=lambda: 100.0)
+    at_once.add_all(urls + urls[:5], 60)
+    assert at_once.active == one_by_one.active
+    assert sorted(at_once.heap) == sorted(one_by_one.heap)
+    assert at_once.heap[0] == min(one_by_one.heap)
+
+
+def test_global_and_per_host_limits():
+    running = defaultdict(int)
+    peak = defaultdict(int)
+    done = []
+
+    def check(url):
+        host = host_of(url)
+        running[host] += 1
+        running['all'] += 1
+        peak[host] = max(peak[host], running[host])
+        peak['all'] = max(peak['all'], running['all'])
+        gevent.sleep(0.02)
+        running[host] -= 1
+        running['all'] -= 1
+        done.append(url)
+        return 60
+
+    scheduler = Scheduler(check, max_in_flight=5, max_per_host=2)
+    for host in ('a', 'b', 'c', 'd'):
+        for i in range(10):
+            scheduler.add('http://{}/{}'.format(host, i), 0.01)
+    scheduler.start()
+    gevent.sleep(0.5)
+    stats = scheduler.stats()
+    scheduler.kill()
+    assert len(done) == 40
+    assert peak['all'] <= 5
+    assert max(peak[h] for h in 'abcd') == 2
+    # Checks waited in line, so some started after they were due
+    assert stats['lag_max'] > 0
+    assert stats['queue_depth'] == 0
+
+
+def test_removed_urls_are_not_checked_again():
+    calls = Counter()
+
+    def check(url):
+        calls[url] += 1
+        return 0.05
+
+    scheduler = Scheduler(check)
+    scheduler.add('http://host/a', 0.01)
+    scheduler.add('http://host/b', 0.01)
+    scheduler.start()
+    gevent.sleep(0.1)
+    scheduler.remove('http://host/a')
+    seen = calls['http://host/a']
+    gevent.sleep(0.2)
+    scheduler.kill()
+    assert calls['http://host/a'] == seen
+    assert calls['http://host/b'] > seen
+
+
+def blocking_first_check(calls, release):
+    # The first check holds its host until released, the others wait in line
+    def check(url):
+        calls.append(url)
+        if len(calls) == 1:
+            release.wait()
+        return 10
+
+    return check
+
+
+def test_removed_while_waiting_does_not_stall_the_host():
+    calls = []
+    release = Event()
+    scheduler = Scheduler(blocking_first_check(calls, release), max_per_host=1)
+    scheduler.add_all(['http://host/a', 'http://host/b', 'http://host/c'], 0.001)
+    scheduler.start()
+    gevent.sleep(0.05)
+    running = calls[0]
+    first_waiting = scheduler.host_waiting['host'][0][2]
+    scheduler.remove(running)
+    scheduler.remove(first_waiting)
+    release.set()
+    gevent.sleep(0.05)
+    scheduler.kill()
+    assert len(calls) == 2
+    assert calls[1] not in (running, first_waiting)
+    assert not scheduler.host_waiting
+    assert not scheduler.host_in_flight
+
+
+def test_removed_and_added_while_waiting_runs_once():
+    calls = []
+    release = Event()
+    scheduler = Scheduler(blocking_first_check(calls, release), max_per_host=1)
+    scheduler.add_all(['http://host/a', 'http://host/b'], 0.001)
+    scheduler.start()
+    gevent.sleep(0.05)
+    waiting = scheduler.host_waiting['host'][0][2]
+    scheduler.remove(waiting)
+    scheduler.add(waiting, 0.001)
+    gevent.sleep(0.05)
+    release.set()
+    gevent.sleep(0.05)
+    scheduler.kill()
+    assert calls.count(waiting) == 1
+    live = [e for e in scheduler.heap if e[1:] == (scheduler.active[waiting], waiting)]
+    assert len(live) == 1
+
+
+def test_crashing_check_is_rescheduled(monkeypatch):
+    monkeypatch.setattr('scheduler.CRASH_DELAY', 0.05)
+    calls = []
+
+    def check(url):
+        calls.append(url)
+        raise RuntimeError('boom')
+
+    scheduler = Scheduler(check)
+    scheduler.add('http://host/a', 0.01)
+    scheduler.start()
+    gevent.sleep(0.2)
+    scheduler.kill()
+    assert len(calls) >= 2
+    assert scheduler.crashes == len(calls)
@@ -0,0 +1,169 @@
+import os
+
+import pytest
+
+import http_client
+import settings as settings_module
+from settings import Settings, SettingsCache, SettingsError, parse
+
+INI = """
+[main]
+debug=false
+only_log=true
+interval={interval}
+error_interval=480
+[urls]
+prod=https://a.example.com/task, https://b.example.com/task
+dev=http://localhost/task
+"""
+
+
+@pytest.fixture
+def ini(tmp_path):
+    config_file = tmp_path / 'pinger.ini'
+
+    def write(interval=60, mtime=None):
+        config_file.write_text(INI.format(interval=interval))
+        if mtime is not None:
+            os.utime(str(config_file), (mtime, mtime))
+        return str(config_file)
+
+    return write
+
+
+def test_settings_are_typed():
+    settings = Settings(
+        {
+            'main': {'debug': 'true', 'only_log': 'false', 'interval': '30'},
+            'urls': {'prod': 'a,b', 'dev': 'c'},
+        }
+    )
+    assert settings.debug is True
+    assert settings.only_log is False
+    assert settings.interval == 30
+    assert settings.error_interval == 480
+    assert settings.urls == ['c']
+    assert settings['main']['interval'] == '30'
+
+
+def test_settings_validation():
+    with pytest.raises(SettingsError):
+        Settings({'main': {'interval': 'often'}})
+    with pytest.raises(SettingsError):
+        Settings({'main': {'interval': '0'}})
+    with pytest.raises(SettingsError):
+        Settings({'main': {'debug': 'maybe'}})
+
+
+def test_notify_options_are_validated():
+    settings = Settings({'notify': {'window': '0.5'}})
+    assert settings.notify_window == 0.5
+    assert settings.notify_retries == 3
+    with pytest.raises(SettingsError):
+        Settings({'notify': {'window': 'abc'}})
+    with pytest.raises(SettingsError):
+        Settings({'notify': {'retries': '-1'}})
+
+
+def test_http_options_default_to_the_client():
+    settings = Settings({'http': {'content_types': ''}})
+    assert settings.content_types == http_client.DEFAULT_CONTENT_TYPES
+    assert Settings({'http': {'read_timeout': '2.5'}}).read_timeout == 2.5
+    with pytest.raises(SettingsError):
+        Settings({'http': {'read_timeout': '-1'}})
+
+
+def test_logging_options_are_validated():
+    settings = Settings({'logging': {'level': 'warning', 'rate_limit': '0'}})
+    assert settings.log_level == 'WARNING'
+    assert settings.log_rate_limit == 0
+    assert settings.log_format == 'text'
+    with pytest.raises(SettingsError):
+        Settings({'logging': {'format': 'xml'}})
+    with pytest.raises(SettingsError):
+        Settings({'logging': {'max_bytes': '10MB'}})
+
+
+def test_cache_parses_once(ini):
+    cache = SettingsCache(ini(), check_interval=3600)
+    first = cache.get()
+    assert first.prod_urls == [
+        'https://a.example.com/task',
+        'https://b.example.com/task',
+    ]
+    assert cache.get() is first
+
+
+def test_cache_reloads_on_mtime_change(ini):
+    config_file = ini(interval=60, mtime=1000)
+    cache = SettingsCache(config_file, check_interval=0)
+    reloads = []
+    cache.on_reload(lambda old, new: reloads.append((old.interval, new.interval)))
+    assert cache.get().interval == 60
+    # Unchanged mtime keeps the cached object
+    assert cache.get() is cache.get()
+
+    ini(interval=90, mtime=2000)
+    assert cache.get().interval == 90
+    assert reloads == [(60, 90)]
+
+
+def test_bad_reload_keeps_last_good_settings(ini, tmp_path):
+    config_file = ini(interval=60)
+    cache = SettingsCache(config_file)
+    cache.get()
+    (tmp_path / 'pinger.ini').write_text('[main]\ninterval=never\n')
+    assert cache.reload().interval == 60
+
+
+def test_unparsable_file_is_read_once(ini, tmp_path, monkeypatch):
+    config_file = ini(interval=60, mtime=1000)
+    cache = SettingsCache(config_file, check_interval=0)
+    cache.get()
+    (tmp_path / 'pinger.ini').write_text('[main]\ninterval=30\ninterval=30\n')
+    os.utime(config_file, (2000, 2000))
+    calls = []
+    monkeypatch.setattr(settings_module, 'parse', lambda f: calls.append(f) or parse(f))
+    assert cache.get().interval == 60
+    assert cache.get().interval == 60
+    assert len(calls) == 1
+
+    ini(interval=30, mtime=3000)
+    assert cache.get().interval == 30
+
+
+def test_url_files_are_added_to_the_listed_urls(tmp_path):
+    (tmp_path / 'urls.txt').write_text(
+        '# prod tasks\nhttps://c.example.com/task\n\n  https://d.example.com/task  \n'
+    )
+    config_file = tmp_path / 'pinger.ini'
+    config_file.write_text(
+        '[urls]\nprod=https://a.example.com/task\nprod_file=urls.txt\n'
+    )
+    settings = SettingsCache(str(config_file)).get()
+    assert settings.prod_urls == [
+        'https://a.example.com/task',
+        'https://c.example.com/task',
+        'https://d.example.com/task',
+    ]
+    assert settings.dev_urls == []
+
+
+def test_missing_url_file_is_an_error(tmp_path):
+    with pytest.raises(SettingsError):
+        Settings({'urls': {'prod_file': str(tmp_path / 'missing.txt')}})
+
+
+def test_cache_reloads_on_url_file_change(tmp_path):
+    url_file = tmp_path / 'urls.txt'
+    url_file.write_text('https://a.example.com/task\n')
+    os.utime(str(url_file), (1000, 1000))
+    config_file = tmp_path / 'pinger.ini'
+    config_file.write_text('[urls]\nprod_file=urls.txt\n')
+    cache = SettingsCache(str(config_file), check_interval=0)
+    first = cache.get()
+    assert cache.get() is first
+
+    url_file.write_text('https://a.example.com/task\nhttps://b.example.com/task\n')
+    os.utime(str(url_file), (2000, 2000))
+    assert len(cache.get().prod_urls) == 2
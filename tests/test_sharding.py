@@ -0,0 +1,92 @@
+import datetime
+import sys
+import textwrap
+
+import gevent
+from pytz import UTC
+
+from settings import Settings
+from sharding import HashRing, Supervisor, dump_stats, load_stats, node_urls
+
+URLS = ['https://example.com/task/{}'.format(n) for n in range(2000)]
+
+# Reports every assigned url once, with the shard name as its status
+WORKER = textwrap.dedent("""
+    import json, os, sys
+    shard = sys.argv[sys.argv.index('--shard') + 1]
+    out = os.fdopen(int(sys.argv[sys.argv.index('--report-fd') + 1]), 'w')
+    for line in sys.stdin:
+        urls = json.loads(line)['urls']
+        stats = {url: {'status': shard, 'sleep_start': None} for url in urls}
+        out.write(json.dumps({'stats': stats}) + '\\n')
+        out.flush()
+    """)
+
+
+def test_ring_spreads_urls():
+    assignment = HashRing(['a', 'b', 'c', 'd']).assign(URLS)
+    for urls in assignment.values():
+        assert 350 < len(urls) < 650
+
+
+def test_adding_a_node_moves_only_its_share():
+    ring = HashRing(['a', 'b', 'c', 'd'])
+    before = {url: ring.node_for(url) for url in URLS}
+    ring.add('e')
+    moved = [url for url in URLS if ring.node_for(url) != before[url]]
+    # Every moved url went to the new node
+    assert {ring.node_for(url) for url in moved} == {'e'}
+    assert len(moved) < len(URLS) / 3
+    ring.remove('e')
+    assert {url: ring.node_for(url) for url in URLS} == before
+
+
+def test_node_urls():
+    sections = {
+        'urls': {'prod': ','.join(URLS[:100])},
+        'shard': {'nodes': 'a, b', 'node': 'a'},
+    }
+    a = node_urls(Settings(sections))
+    sections['shard']['node'] = 'b'
+    b = node_urls(Settings(sections))
+    assert sorted(a + b) == sorted(URLS[:100])
+    assert not set(a) & set(b)
+
+
+def test_stats_round_trip():
+    start = datetime.datetime(2018, 6, 28, 22, tzinfo=UTC)
+    stats = {'status': 'sleeping', 'sleep_start': start, 'sleep_end': None}
+    assert load_stats(dump_stats(stats)) == stats
+
+
+def wait_for(condition, timeout=10):
+    with gevent.Timeout(timeout):
+        while not condition():
+            gevent.sleep(0.05)
+
+
+def test_supervisor_moves_urls_of_dead_shard(tmp_path):
+    worker = tmp_path / 'worker.py'
+    worker.write_text(WORKER)
+    stats = {}
+    supervisor = Supervisor([sys.executable, str(worker)], 3, stats, restart_delay=0.5)
+    urls = URLS[:300]
+    try:
+        supervisor.start(urls)
+        wait_for(lambda: len(stats) == 300)
+        assert {s['status'] for s in stats.values()} == {'0', '1', '2'}
+
+        dead = supervisor.shards['1']
+        moved = set(dead.urls)
+        dead.process.kill()
+        wait_for(lambda: all(stats[url]['status'] != '1' for url in moved))
+        assert supervisor.stats()['1']['alive'] is False
+
+        # After the restart the shard takes its urls back
+        wait_for(lambda: all(stats[url]['status'] == '1' for url in moved))
+        assert supervisor.stats()['1']['restarts'] == 1
+
+        supervisor.set_urls(urls[:200])
+        assert len(stats) <= 200
+    finally:
+        supervisor.kill()
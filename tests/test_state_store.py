@@ -0,0 +1,143 @@
+import datetime
+import sqlite3
+
+from pytz import UTC
+
+from alerts import AlertManager, AlertState
+from state_store import INSERT, StateStore
+
+
+def make_stats(status='ok', start=None, end=None):
+    return {
+        'pings': 10,
+        'errors': 2,
+        'status': status,
+        'sleep_start': start,
+        'sleep_end': end,
+        'server': 'web-1',
+        'process': 'import',
+        'cache_hits': 5,
+        'cache_hit_rate': 0.5,
+    }
+
+
+def test_snapshot_and_restore(tmp_path):
+    path = str(tmp_path / 'pinger.db')
+    start = datetime.datetime(2018, 6, 28, 22, 0, tzinfo=UTC)
+    end = start + datetime.timedelta(minutes=450)
+    stats = {
+        'http://host/a': make_stats('sleeping', start, end),
+        'http://host/b': make_stats('error'),
+    }
+    alerts = AlertManager(lambda message: None)
+    alerts.failure('http://host/b', 'http', 500, 'Warn: HTTP Error 500')
+
+    store = StateStore(path)
+    for url in stats:
+        store.mark(url)
+    store.flush(stats, alerts, threaded=False)
+    store.close()
+
+    restored = StateStore(path).load()
+    assert set(restored) == set(stats)
+    assert restored['http://host/a'] == (stats['http://host/a'], None)
+    assert restored['http://host/a'][0]['sleep_end'] == end
+    restored_stats, alert = restored['http://host/b']
+    assert restored_stats == stats['http://host/b']
+    state = AlertState.from_dict(alert)
+    assert state.status == 'error'
+    assert state.key == ('http://host/b', 'http', '500')
+
+
+def test_bad_fields_do_not_fail_the_snapshot(tmp_path):
+    path = str(tmp_path / 'pinger.db')
+    bad = make_stats()
+    bad['server'] = ['web-1', 'web-2']
+    bad['process'] = {'name': 'import'}
+    stats = {'http://host/a': make_stats(), 'http://host/b': bad}
+    store = StateStore(path)
+    for url in stats:
+        store.mark(url)
+    store.flush(stats, None, threaded=False)
+    assert not store.dirty
+    restored = store.load()
+    assert restored['http://host/a'][0] == stats['http://host/a']
+    assert restored['http://host/b'][0]['server'] == "['web-1', 'web-2']"
+
+
+def test_only_dirty_urls_are_written(tmp_path):
+    path = str(tmp_path / 'pinger.db')
+    stats = {'http://host/a': make_stats(), 'http://host/b': make_stats()}
+    store = StateStore(path)
+    store.mark('http://host/a')
+    store.flush(stats, None, threaded=False)
+    assert list(store.load()) == ['http://host/a']
+
+    # Nothing dirty, nothing written
+    store.flush(stats, None, threaded=False)
+    assert store.snapshots == 1
+
+    store.mark('http://host/b')
+    store.forget('http://host/a')
+    store.flush(stats, None, threaded=False)
+    assert list(store.load()) == ['http://host/b']
+
+
+def test_threaded_flush(tmp_path):
+    store = StateStore(str(tmp_path / 'pinger.db'))
+    stats = {'http://host/a': make_stats()}
+    store.mark('http://host/a')
+    store.flush(stats, None)
+    assert list(store.load()) == ['http://host/a']
+    assert not store.dirty
+
+
+def test_failed_write_keeps_last_snapshot(tmp_path, monkeypatch):
+    path = str(tmp_path / 'pinger.db')
+    stats = {'http://host/{}'.format(i): make_stats() for i in range(10)}
+    store = StateStore(path)
+    for url in stats:
+        store.mark(url)
+    store.flush(stats, None, threaded=False)
+
+    for url in stats:
+        stats[url]['pings'] = 11
+        store.mark(url)
+
+    def crash(rows, removed):
+        # Dies half way through the transaction
+        with store.db:
+            store.db.execute('BEGIN')
+            store.db.executemany(INSERT, rows[:5])
+            raise IOError('disk full')
+
+    monkeypatch.setattr(store, 'write', crash)
+    store.flush(stats, None, threaded=False)
+    assert {s['pings'] for s, _ in StateStore(path).load().values()} == {10}
+    # The urls are written again with the next snapshot
+    assert store.dirty == set(stats)
+
+
+def test_older_databases_get_the_new_columns(tmp_path):
+    path = str(tmp_path / 'pinger.db')
+    db = sqlite3.connect(path)
+    db.execute(
+        'CREATE TABLE state (url TEXT PRIMARY KEY, pings INTEGER NOT NULL, '
+        'errors INTEGER NOT NULL, status TEXT, sleep_start REAL, sleep_end REAL, '
+        'server TEXT, process TEXT, alert TEXT)'
+    )
+    db.execute(
+        "INSERT INTO state VALUES ('http://host/a', 3, 0, 'ok', "
+        "NULL, NULL, NULL, NULL, NULL)"
+    )
+    db.commit()
+    db.close()
+
+    store = StateStore(path)
+    stats, alert = store.load()['http://host/a']
+    assert stats['pings'] == 3
+    assert stats['cache_hits'] == 0
+    store.heartbeats = {'push://job': {'status': 'OK'}}
+    store.mark('push://job')
+    store.flush({'push://job': make_stats()}, None, threaded=False)
+    assert store.load_heartbeats() == {'push://job': {'status': 'OK'}}
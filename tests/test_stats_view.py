@@ -0,0 +1,69 @@
+import json
+
+import pytest
+
+from stats_view import CursorError, StatsView
+
+
+def make_view(n=10):
+    stats = {}
+    view = StatsView(stats)
+    for i in range(n):
+        url = 'https://{}.example.com/task/{}'.format('api' if i % 2 else 'web', i)
+        stats[url] = {'pings': 1, 'status': 'error' if i % 3 == 0 else 'ok'}
+        view.touch(url)
+    return stats, view
+
+
+def urls(body):
+    return [task['url'] for task in json.loads(body)['data']]
+
+
+def test_listing_is_cached_per_version():
+    stats, view = make_view()
+    body = view.render()
+    assert urls(body) == sorted(stats)
+    assert view.render() is body
+    etag = view.etag()
+
+    url = sorted(stats)[0]
+    stats[url]['pings'] = 2
+    view.touch(url)
+    assert view.etag() != etag
+    assert json.loads(view.render())['data'][0]['pings'] == 2
+
+
+def test_filters():
+    stats, view = make_view()
+    errors = urls(view.render(status='error'))
+    assert errors and all(stats[url]['status'] == 'error' for url in errors)
+    api = urls(view.render(prefix='https://api.'))
+    assert len(api) == 5 and all(url.startswith('https://api.') for url in api)
+
+
+def test_pagination():
+    stats, view = make_view(25)
+    seen = []
+    cursor = None
+    while True:
+        page = json.loads(view.render(cursor=cursor, limit=10))
+        seen.extend(task['url'] for task in page['data'])
+        cursor = page['next']
+        if cursor is None:
+            break
+    assert seen == sorted(stats)
+    with pytest.raises(CursorError):
+        view.render(cursor='%%%', limit=10)
+
+
+def test_detail_and_summary():
+    stats, view = make_view(6)
+    url = sorted(stats)[0]
+    assert json.loads(view.detail(url)) == {'data': stats[url]}
+    assert view.detail('https://unknown') is None
+    assert view.summary() == {'total': 6, 'statuses': {'error': 2, 'ok': 4}}
+
+    stats.pop(url)
+    view.touch(url)
+    assert view.summary()['total'] == 5
+    assert url not in urls(view.render())
@@ -0,0 +1,42 @@
+import sys
+
+import pytest
+
+from url_stats import UrlStats
+
+
+def test_reads_and_writes_like_a_dict():
+    stats = UrlStats()
+    stats['pings'] = stats['pings'] + 1
+    stats['status'] = 'ok'
+    assert stats['pings'] == 1
+    assert stats.get('tasks') is None
+    assert 'tasks' not in stats
+    assert stats.get('unknown', 'default') == 'default'
+    with pytest.raises(KeyError):
+        stats['unknown']
+    with pytest.raises(KeyError):
+        stats['unknown'] = 1
+
+    stats['tasks'] = 3
+    assert 'tasks' in stats
+    assert dict(stats)['tasks'] == 3
+    assert len(stats) == 10
+
+
+def test_round_trips_through_a_dict():
+    stats = UrlStats()
+    stats['status'] = 'sleeping'
+    stats['server'] = 'web-1'
+    data = stats.to_dict()
+    assert 'tasks' not in data
+    assert UrlStats.from_dict(data) == stats
+    assert stats == data
+
+
+def test_repeated_names_are_shared():
+    # Built at runtime, like the names decoded from a response
+    name = ''.join(['web-', str(7)])
+    stats = UrlStats.from_dict({'server': name, 'process': None, 'old': 1})
+    assert stats['server'] is sys.intern('web-7')
+    assert stats['process'] is None